@@ -0,0 +1,77 @@
+"""Admin statistics: loading every User (old) vs get_admin_stats (SQL aggregate).
+
+    python -m benchmarks.admin_stats [--users 1000000]
+
+Reports wall time and peak Python memory (tracemalloc) for each approach.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database.connection import build_engine
+from database.migrations import run_migrations
+from database.models import Base, User
+from database.queries import get_all_users, get_admin_stats
+
+BATCH = 50000
+
+
+async def _seed(session_factory, users: int):
+    async with session_factory() as session:
+        for start in range(0, users, BATCH):
+            rows = [
+                {"telegram_id": 10_000_000 + i, "username": f"user{i}", "full_name": f"User {i}",
+                 "balance": random.randint(0, 500_000), "is_admin": False}
+                for i in range(start, min(start + BATCH, users))
+            ]
+            await session.execute(insert(User), rows)
+        await session.commit()
+
+
+async def _old_stats(session):
+    users = await get_all_users(session)
+    return len(users), sum(u.balance for u in users)
+
+
+async def _measure(name: str, session_factory, fn):
+    async with session_factory() as session:
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = await fn(session)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    print(f"{name:<18}{elapsed * 1000:>10.1f}ms{peak / 1024 / 1024:>10.1f}MB")
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = build_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'stats.db')}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(run_migrations)
+        session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+        print(f"Seeding {args.users} users...")
+        await _seed(session_factory, args.users)
+
+        print(f"{'approach':<18}{'time':>12}{'peak mem':>12}")
+        await _measure("get_admin_stats", session_factory, get_admin_stats)
+        await _measure("get_all_users", session_factory, _old_stats)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+"""Auction closing: 60s polling scan (old) vs the AuctionDeadlines heap.
+
+    python -m benchmarks.auction_deadlines [--auctions 100000] [--spread 10]
+
+Seeds live auctions into a temp DB and reports:
+- the cost of one polling tick (get_active_auctions + end-time check);
+- the one-time heap seed from get_auction_deadlines;
+- how late each deadline fires when the heap runs. Deadlines are spread over
+  --spread seconds; the old scheduler was up to 60s late by design.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database.connection import build_engine
+from database.migrations import run_migrations
+from database.models import Base, User, Flower
+from database.queries import get_active_auctions, get_auction_deadlines
+from utils.scheduler import AuctionDeadlines
+
+BATCH = 20000
+
+
+async def _seed(session_factory, auctions: int, spread: float):
+    base = datetime.utcnow() + timedelta(hours=1)
+    async with session_factory() as session:
+        owner = User(telegram_id=1, balance=0)
+        session.add(owner)
+        await session.flush()
+        for start in range(0, auctions, BATCH):
+            rows = [
+                {"user_id": owner.id, "photo_id": "x", "name": f"a{i}", "price": 1000, "is_auction": True,
+                 "status": "published", "current_bid": 1000,
+                 "auction_end_time": base + timedelta(seconds=random.uniform(0, spread))}
+                for i in range(start, min(start + BATCH, auctions))
+            ]
+            await session.execute(insert(Flower), rows)
+        await session.commit()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--auctions", type=int, default=100_000)
+    parser.add_argument("--spread", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = build_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'deadlines.db')}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(run_migrations)
+        session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+        print(f"Seeding {args.auctions} auctions...")
+        await _seed(session_factory, args.auctions, args.spread)
+
+        # Old: every 60s tick loads every live auction and compares in Python
+        start = time.perf_counter()
+        async with session_factory() as session:
+            now = datetime.utcnow()
+            ended = [f for f in await get_active_auctions(session) if f.auction_end_time and now > f.auction_end_time]
+        print(f"polling tick:   {(time.perf_counter() - start) * 1000:>9.1f}ms per scan ({len(ended)} due)")
+
+        # New: one seed at startup
+        deadlines = AuctionDeadlines()
+        tracemalloc.start()
+        start = time.perf_counter()
+        async with session_factory() as session:
+            rows = await get_auction_deadlines(session)
+        deadlines.load(rows)
+        seed_ms = (time.perf_counter() - start) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"heap seed:      {seed_ms:>9.1f}ms once, {peak / 1024 / 1024:.1f}MB peak, {len(deadlines)} scheduled")
+        await engine.dispose()
+
+    # Shift the deadlines to start 1s from now and let the heap fire them
+    shift = datetime.utcnow() + timedelta(seconds=1) - min(end for _, end in rows)
+    deadlines = AuctionDeadlines()
+    deadlines.load([(flower_id, end + shift) for flower_id, end in rows])
+    expected = dict(deadlines._deadlines)
+    lateness = []
+    done = asyncio.Event()
+
+    async def on_due(flower_id: int):
+        lateness.append((datetime.utcnow() - expected[flower_id]).total_seconds())
+        if len(lateness) == len(expected):
+            done.set()
+
+    runner = asyncio.create_task(deadlines.run(on_due))
+    await asyncio.wait_for(done.wait(), args.spread + 30)
+    runner.cancel()
+
+    lateness.sort()
+    print(f"heap firing:    {len(lateness)} fired, lateness p50 {statistics.median(lateness) * 1000:.2f}ms, "
+          f"p99 {lateness[int(len(lateness) * 0.99)] * 1000:.2f}ms, max {lateness[-1] * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+"""One hot auction under concurrent bidding: per-bid DB path (old) vs AuctionEngine.
+
+    python -m benchmarks.auction_engine [--bidders 50] [--bids 20]
+
+The old path is what process_auction_bid used to do for every bid: load the
+flower, compare, insert the bid, write the new price, commit. Bidders raise
+the price by a fixed step each time, so concurrent bids race on the same
+current_bid. Reports answered bids/s, decision latency (time until the bidder
+gets an answer) and lost updates: accepted bids whose amount was not above the
+price that was committed before them.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database.connection import build_engine
+from database.migrations import run_migrations
+from database.models import Base, User, Flower, AuctionBid
+from database.queries import get_flower, add_auction_bid
+from utils.auction_engine import AuctionEngine
+
+START_PRICE = 1000
+STEP = 1000
+
+
+async def _setup(engine) -> async_sessionmaker:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_factory() as session:
+        owner = User(telegram_id=1, balance=0)
+        session.add(owner)
+        await session.flush()
+        session.add(Flower(id=1, user_id=owner.id, photo_id="x", name="bench", price=START_PRICE,
+                           is_auction=True, current_bid=START_PRICE, status="published"))
+        await session.commit()
+    return session_factory
+
+
+async def _old_bid(session_factory, user_telegram_id: int) -> bool:
+    async with session_factory() as session:
+        flower = await get_flower(session, 1)
+        current_bid = flower.current_bid or flower.price
+        amount = current_bid + STEP
+        await add_auction_bid(session, flower.id, user_telegram_id, None, None, amount)
+        flower.current_bid = amount
+        flower.highest_bidder_id = user_telegram_id
+        flower.bid_count = (flower.bid_count or 0) + 1
+        await session.commit()
+        return True
+
+
+async def _lost_updates(session_factory) -> int:
+    """Accepted bids that did not beat the bid accepted before them"""
+    async with session_factory() as session:
+        amounts = (await session.execute(
+            select(AuctionBid.amount).where(AuctionBid.flower_id == 1).order_by(AuctionBid.id)
+        )).scalars().all()
+    lost, best = 0, START_PRICE
+    for amount in amounts:
+        if amount <= best:
+            lost += 1
+        best = max(best, amount)
+    return lost
+
+
+async def _run(name: str, bidders: int, bids: int, tmp: str) -> dict:
+    engine = build_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, f'{name}.db')}")
+    session_factory = await _setup(engine)
+    auction_engine = AuctionEngine(session_factory=session_factory)
+    # Each bidder offers a step above the last offer it has seen, as in the chat
+    offers = itertools.count(START_PRICE + STEP, STEP)
+    latencies = []
+    accepted = 0
+    errors = 0
+
+    async def bidder(n: int):
+        nonlocal accepted, errors
+        for _ in range(bids):
+            start = time.perf_counter()
+            try:
+                if name == "per-bid DB":
+                    ok = await _old_bid(session_factory, 100 + n)
+                else:
+                    result = await auction_engine.submit_bid(1, 100 + n, None, None, next(offers))
+                    ok = result.accepted
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            accepted += ok
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(bidder(n) for n in range(bidders)))
+    await auction_engine.shutdown()
+    elapsed = time.perf_counter() - start
+
+    lost = await _lost_updates(session_factory)
+    await engine.dispose()
+    latencies.sort()
+    return {
+        "decisions_per_sec": len(latencies) / elapsed,
+        "accepted": accepted,
+        "errors": errors,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0,
+        "lost": lost,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bidders", type=int, default=50)
+    parser.add_argument("--bids", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'path':<14}{'decisions/s':>13}{'accepted':>10}{'errors':>8}{'p50':>10}{'p95':>10}{'lost':>6}")
+        for name in ("per-bid DB", "engine"):
+            r = await _run(name, args.bidders, args.bids, tmp)
+            print(f"{name:<14}{r['decisions_per_sec']:>13.1f}{r['accepted']:>10}{r['errors']:>8}"
+                  f"{r['p50_ms']:>8.2f}ms{r['p95_ms']:>8.2f}ms{r['lost']:>6}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
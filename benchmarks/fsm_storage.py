@@ -0,0 +1,96 @@
+"""Per-update FSM overhead: MemoryStorage vs DatabaseStorage.
+
+    python -m benchmarks.fsm_storage [--users 2000] [--steps 8]
+
+Every simulated user walks the "🌸 Gul qoshish" wizard: per step one
+get_state, one get_data, one update_data and one set_state, i.e. what a
+handler plus aiogram's FSM middleware do per update. Reports microseconds per
+update for both storages (the first DatabaseStorage access also loads the set
+of stored keys once), then how long a fresh DatabaseStorage (after a
+"restart") takes to read all states back cold.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database.connection import build_engine
+from database.fsm_storage import DatabaseStorage
+from database.models import Base, FSMRecord
+from states import FlowerStates
+
+STATES = [s.state for s in FlowerStates.__all_states__]
+
+
+async def _wizard(storage, users: int, steps: int) -> list:
+    latencies = []
+
+    async def user(n: int):
+        key = StorageKey(bot_id=1, chat_id=n, user_id=n)
+        for step in range(steps):
+            start = time.perf_counter()
+            await storage.get_state(key)
+            await storage.get_data(key)
+            await storage.update_data(key, {f"field{step}": f"value {step} of user {n}", "media_list": [n, step]})
+            await storage.set_state(key, STATES[step % len(STATES)])
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(user(n) for n in range(users)))
+    return latencies
+
+
+def _report(name: str, latencies: list, elapsed: float):
+    latencies.sort()
+    print(f"{name:<22}{statistics.median(latencies) * 1e6:>10.1f}us{statistics.mean(latencies) * 1e6:>10.1f}us"
+          f"{latencies[int(len(latencies) * 0.99)] * 1e6:>10.1f}us{len(latencies) / elapsed:>12.0f}/s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--steps", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'storage':<22}{'p50':>12}{'mean':>12}{'p99':>12}{'updates':>13}")
+
+    start = time.perf_counter()
+    latencies = await _wizard(MemoryStorage(), args.users, args.steps)
+    _report("MemoryStorage", latencies, time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = build_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'fsm.db')}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+        storage = DatabaseStorage(session_factory=session_factory)
+        start = time.perf_counter()
+        latencies = await _wizard(storage, args.users, args.steps)
+        await storage.close()
+        _report("DatabaseStorage", latencies, time.perf_counter() - start)
+
+        async with session_factory() as session:
+            rows = (await session.execute(select(func.count(FSMRecord.key)))).scalar_one()
+        print(f"  {storage.flushes} flushes, {rows} rows persisted")
+
+        # Restart: empty cache, every first read goes to the table
+        storage = DatabaseStorage(session_factory=session_factory)
+        start = time.perf_counter()
+        for n in range(args.users):
+            assert await storage.get_state(StorageKey(bot_id=1, chat_id=n, user_id=n)) is not None
+        elapsed = time.perf_counter() - start
+        print(f"cold reads after restart: {elapsed / args.users * 1e6:.1f}us per key")
+        await storage.close()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,411 @@
+"""Per-function timings for database/queries.py on seeded SQLite databases.
+
+    python -m benchmarks.queries [--sizes 10000 100000 1000000] [--only get_user get_flower]
+                                 [--out results.json] [--compare baseline.json] [--db-dir DIR]
+
+For each size N the database holds N users, N/2 flowers (a few power sellers
+own most of them), N bids (80% on 10 hot auctions), N/2 auction participants,
+N/5 payments over the last year and N/100 pending listings. Every public
+function in database.queries is called with realistic arguments (reads
+first, then writes, one session per call like the handlers) until --repeat
+calls or --budget seconds; p50/p95/mean are reported per function.
+
+Results go to benchmarks/results/queries-<commit>.json (or --out); pass an
+earlier file as --compare to print the p50 ratio per function. Seeded
+databases are kept in --db-dir and reused, each run works on a copy.
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import sqlalchemy
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database import queries
+from database.connection import build_engine
+from database.migrations import run_migrations
+from database.models import (
+    Base, User, Flower, AuctionBid, AuctionParticipant, Payment, PendingFlower, Settings
+)
+
+BATCH = 20000
+TELEGRAM_BASE = 10_000_000
+HOT_AUCTIONS = 10
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+# ==================== SEEDING ====================
+
+async def _insert(session, model, rows):
+    for start in range(0, len(rows), BATCH):
+        await session.execute(insert(model), rows[start:start + BATCH])
+
+
+def _flower_count(size: int) -> int:
+    return max(size // 2, HOT_AUCTIONS * 2)
+
+
+async def seed(session_factory, size: int, rng: random.Random):
+    """Fill an empty database"""
+    now = datetime.utcnow()
+    flowers = _flower_count(size)
+
+    async with session_factory() as session:
+        await _insert(session, User, [
+            {"id": i + 1, "telegram_id": TELEGRAM_BASE + i, "username": f"user{i}", "full_name": f"User {i}",
+             "balance": rng.randrange(0, 500_000, 1000), "is_admin": i < 3,
+             "created_at": now - timedelta(days=rng.uniform(0, 365))}
+            for i in range(size)
+        ])
+
+        # Few power sellers own most listings; the first HOT_AUCTIONS are live and hot
+        rows = []
+        for i in range(flowers):
+            owner = min(int(rng.paretovariate(1.2)), size)
+            is_auction = i < HOT_AUCTIONS or rng.random() < 0.4
+            status = "published" if i < HOT_AUCTIONS else rng.choices(
+                ["pending", "published", "expired", "sold", "ended"], [10, 10, 5, 45, 30])[0]
+            live = is_auction and status == "published"
+            rows.append({
+                "id": i + 1, "user_id": owner, "photo_id": f"photo{i}", "name": f"Gul {i}",
+                "description": "Yangi uzilgan gul", "price": rng.randrange(50_000, 1_000_000, 5000),
+                "is_auction": is_auction, "current_bid": 0, "bid_count": 0, "participant_count": 0,
+                "status": status, "message_id": i + 1, "seller_telegram_id": TELEGRAM_BASE + owner - 1,
+                "phone_number": "+998901234567", "location": "Toshkent",
+                "auction_end_time": now + timedelta(hours=rng.uniform(1, 24)) if live else
+                now - timedelta(days=rng.uniform(0, 30)) if is_auction else None,
+                "created_at": now - timedelta(days=rng.uniform(0, 365)),
+            })
+        auctions = [row["id"] for row in rows if row["is_auction"]]
+
+        # 80% of bids on the hot auctions, prices rising per auction
+        bid_rows, price = [], {}
+        for i in range(size):
+            flower_id = rng.randint(1, HOT_AUCTIONS) if rng.random() < 0.8 else rng.choice(auctions)
+            price[flower_id] = price.get(flower_id, rows[flower_id - 1]["price"]) + rng.randrange(1000, 20000, 1000)
+            bidder = rng.randrange(size)
+            bid_rows.append({"flower_id": flower_id, "user_telegram_id": TELEGRAM_BASE + bidder,
+                             "username": f"user{bidder}", "full_name": f"User {bidder}",
+                             "amount": price[flower_id], "created_at": now - timedelta(hours=rng.uniform(0, 48))})
+        for flower_id, amount in price.items():
+            rows[flower_id - 1]["current_bid"] = amount
+        for row in bid_rows:
+            rows[row["flower_id"] - 1]["bid_count"] += 1
+        await _insert(session, Flower, rows)
+        await _insert(session, AuctionBid, bid_rows)
+
+        # Participants: bidders of each auction plus some lurkers, one row per pair
+        pairs = {(row["flower_id"], row["user_telegram_id"]) for row in bid_rows[:size // 4]}
+        while len(pairs) < size // 2:
+            flower_id = rng.randint(1, HOT_AUCTIONS) if rng.random() < 0.5 else rng.choice(auctions)
+            pairs.add((flower_id, TELEGRAM_BASE + rng.randrange(size)))
+        await _insert(session, AuctionParticipant, [
+            {"flower_id": flower_id, "user_telegram_id": telegram_id, "is_active": rng.random() < 0.9,
+             "joined_at": now - timedelta(hours=rng.uniform(0, 48))}
+            for flower_id, telegram_id in sorted(pairs)
+        ])
+
+        await _insert(session, Payment, [
+            {"user_id": rng.randint(1, size), "amount": rng.choice([10_000, 20_000, 50_000, 100_000, 200_000]),
+             "screenshot_id": f"shot{i}", "status": rng.choices(["pending", "approved", "rejected"], [3, 85, 12])[0],
+             "created_at": now - timedelta(days=rng.uniform(0, 365))}
+            for i in range(size // 5)
+        ])
+        await _insert(session, PendingFlower, [
+            {"user_telegram_id": TELEGRAM_BASE + i, "created_at": now - timedelta(hours=rng.uniform(0, 48)),
+             "payload": json.dumps({"data": {"name": f"Gul {i}", "price": 100_000}, "is_auction": False})}
+            for i in range(0, size, 100)
+        ])
+        await _insert(session, Settings, [
+            {"key": "regular_post_price", "value": "30000"}, {"key": "auction_post_price", "value": "40000"},
+            {"key": "card_number", "value": "8600 0000 0000 0000"},
+        ])
+        await session.commit()
+
+        await queries.reconcile_participant_counts(session, fix=True)
+        await queries.rebuild_payment_rollup(session)
+
+
+# ==================== CASES ====================
+
+class Context:
+    """Argument source shared by the cases; writes draw fresh ids from here"""
+
+    def __init__(self, size: int, auctions: list, rng: random.Random):
+        self.size = size
+        self.flowers = _flower_count(size)
+        self.auctions = auctions
+        self.rng = rng
+        self.new_telegram_id = TELEGRAM_BASE + self.size
+        self.pending_payments = []
+        self.saved_pending = []
+
+    def telegram_id(self) -> int:
+        return TELEGRAM_BASE + self.rng.randrange(self.size)
+
+    def user_id(self) -> int:
+        return self.rng.randint(1, self.size)
+
+    def flower_id(self) -> int:
+        return self.rng.randint(1, self.flowers)
+
+    def hot(self) -> int:
+        return self.rng.randint(1, HOT_AUCTIONS)
+
+    def cold_auction(self) -> int:
+        return self.rng.choice(self.auctions[HOT_AUCTIONS:] or self.auctions)
+
+    def fresh_telegram_id(self) -> int:
+        self.new_telegram_id += 1
+        return self.new_telegram_id
+
+
+async def _a_flower(ctx, session):
+    return (await queries.get_flower(session, ctx.flower_id()),)
+
+
+async def _a_bid(ctx, session):
+    return (await queries.get_highest_bid(session, ctx.hot()),)
+
+
+async def _pending_payment(ctx, session):
+    if not ctx.pending_payments:
+        ctx.pending_payments = [p.id for p in await queries.get_pending_payments(session)]
+        ctx.rng.shuffle(ctx.pending_payments)
+    return (ctx.pending_payments.pop() if ctx.pending_payments else 0,)
+
+
+def _bids(ctx, n):
+    return [{"user_telegram_id": ctx.telegram_id(), "username": "bench", "full_name": "Bench",
+             "amount": 10 ** 9 + ctx.rng.randrange(10 ** 6)} for _ in range(n)]
+
+
+def _save_pending(ctx):
+    telegram_id = ctx.fresh_telegram_id()
+    ctx.saved_pending.append(telegram_id)
+    return (telegram_id, {"data": {"name": "Atirgul", "price": 100_000}, "is_auction": False})
+
+
+# name -> argument factory (ctx, session) -> tuple, may be async. Reads first, then writes.
+READS = {
+    "get_user": lambda ctx, s: (ctx.telegram_id(),),
+    "get_or_create_user": lambda ctx, s: (ctx.telegram_id(), "user", "User"),
+    "get_all_users": lambda ctx, s: (),
+    "get_flower": lambda ctx, s: (ctx.flower_id(),),
+    "get_flower_by_user_id": lambda ctx, s: (ctx.user_id(),),
+    "get_flower_owner_telegram_id": _a_flower,
+    "get_user_flowers": lambda ctx, s: (min(int(ctx.rng.paretovariate(1.2)), ctx.size),),
+    "get_active_auctions": lambda ctx, s: (),
+    "get_auction_deadlines": lambda ctx, s: (),
+    "get_auction_participant": lambda ctx, s: (ctx.hot(), ctx.telegram_id()),
+    "get_auction_participants": lambda ctx, s: (ctx.hot(),),
+    "get_user_active_auction": lambda ctx, s: (ctx.telegram_id(),),
+    "load_active_auction_index": lambda ctx, s: (),
+    "reconcile_participant_counts": lambda ctx, s: (),
+    "participant_count_sync_statement": lambda ctx, s: (),
+    "get_auction_bids": lambda ctx, s: (ctx.hot(),),
+    "get_highest_bid": lambda ctx, s: (ctx.hot(),),
+    "get_top_bids": lambda ctx, s: (ctx.hot(), 10),
+    "get_bid": lambda ctx, s: (ctx.rng.randint(1, ctx.size),),
+    "get_bid_rank": _a_bid,
+    "load_pending_flowers": lambda ctx, s: (),
+    "pending_flower_stats": lambda ctx, s: (),
+    "get_payment": lambda ctx, s: (ctx.rng.randint(1, max(ctx.size // 5, 1)),),
+    "get_pending_payments": lambda ctx, s: (),
+    "get_bot_settings": lambda ctx, s: (),
+    "get_setting": lambda ctx, s: ("card_number",),
+    "get_admin_stats": lambda ctx, s: (),
+    "get_live_gauges": lambda ctx, s: (),
+    "payment_rollup_rebuild_statements": lambda ctx, s: (),
+    "get_income_stats": lambda ctx, s: (),
+}
+
+WRITES = {
+    "create_user": lambda ctx, s: (ctx.fresh_telegram_id(), "new", "New User"),
+    "update_user_balance": lambda ctx, s: (ctx.telegram_id(), 1000),
+    "debit_user_balance": lambda ctx, s: (ctx.telegram_id(), 1000),
+    "set_user_balance": lambda ctx, s: (ctx.telegram_id(), 100_000),
+    "set_user_admin": lambda ctx, s: (ctx.telegram_id(), False),
+    "create_flower": lambda ctx, s: (ctx.user_id(), "photo", "Atirgul", "Tavsif", 100_000, True,
+                                     "+998901234567", "Toshkent", datetime.utcnow() + timedelta(hours=1)),
+    "update_flower_status": lambda ctx, s: (ctx.size * 10, "ended"),  # missing id: lookup cost only
+    "transition_flower_status": lambda ctx, s: (ctx.flower_id(), "pending", "pending"),
+    "update_flower_bid": lambda ctx, s: (ctx.cold_auction(), 10 ** 9, ctx.telegram_id()),
+    "add_auction_participant": lambda ctx, s: (ctx.hot(), ctx.fresh_telegram_id(), "new", "New User"),
+    "remove_auction_participant": lambda ctx, s: (ctx.hot(), ctx.telegram_id()),
+    "add_auction_bid": lambda ctx, s: (ctx.hot(), ctx.telegram_id(), "bench", "Bench", 10 ** 9),
+    "add_auction_bids_batch": lambda ctx, s: (ctx.hot(), _bids(ctx, 20), 10 ** 9, ctx.telegram_id()),
+    "save_pending_flower": lambda ctx, s: _save_pending(ctx),
+    "pop_pending_flower": lambda ctx, s: (ctx.saved_pending.pop() if ctx.saved_pending else 0,),
+    "create_payment": lambda ctx, s: (ctx.user_id(), 50_000, "shot"),
+    "update_payment_status": lambda ctx, s: (ctx.rng.randint(1, max(ctx.size // 5, 1)), "rejected"),
+    "approve_pending_payment": _pending_payment,
+    "set_setting": lambda ctx, s: ("card_number", "8600 0000 0000 0000"),
+    "rebuild_payment_rollup": lambda ctx, s: (),
+}
+
+
+def public_functions() -> list:
+    return sorted(
+        name for name, fn in inspect.getmembers(queries, inspect.isfunction)
+        if fn.__module__ == queries.__name__ and not name.startswith("_")
+    )
+
+
+async def time_function(session_factory, ctx: Context, name: str, make_args, repeat: int, budget: float) -> dict:
+    fn = getattr(queries, name)
+    latencies = []
+    deadline = time.perf_counter() + budget
+    while len(latencies) < repeat and (len(latencies) < 3 or time.perf_counter() < deadline):
+        async with session_factory() as session:
+            args = make_args(ctx, session)
+            if inspect.isawaitable(args):
+                args = await args
+            start = time.perf_counter()
+            try:
+                result = fn(session, *args) if "session" in inspect.signature(fn).parameters else fn(*args)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                # Recorded, not fatal: one broken function shouldn't hide the other numbers
+                return {"calls": len(latencies), "error": f"{type(e).__name__}: {e}".splitlines()[0]}
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "calls": len(latencies),
+        "p50_ms": round(statistics.median(latencies) * 1000, 4),
+        "p95_ms": round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000, 4),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 4),
+    }
+
+
+def _reset_module_state():
+    queries.user_cache.clear()
+    queries.pending_flowers.clear()
+    queries.active_auction_index.load([])
+    queries._settings_values = None
+
+
+async def _prepare(path: str, size: int, seed_value: int):
+    engine = build_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations)
+    print(f"  seeding {size} users...", flush=True)
+    start = time.perf_counter()
+    await seed(async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False), size,
+               random.Random(seed_value))
+    print(f"  seeded in {time.perf_counter() - start:.1f}s", flush=True)
+    await engine.dispose()
+
+
+async def run_size(db_dir: str, size: int, args) -> dict:
+    seeded = os.path.join(db_dir, f"queries-{size}-seed{args.seed}.db")
+    if not os.path.exists(seeded):
+        await _prepare(seeded + ".tmp", size, args.seed)
+        os.replace(seeded + ".tmp", seeded)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work = os.path.join(tmp, "work.db")
+        shutil.copy(seeded, work)
+        engine = build_engine(f"sqlite+aiosqlite:///{work}")
+        async with engine.begin() as conn:
+            await conn.run_sync(run_migrations)  # seeded by an older commit: bring the schema up to date
+        session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+        async with session_factory() as session:
+            auctions = (await session.execute(
+                sqlalchemy.select(Flower.id).where(Flower.is_auction == True)
+            )).scalars().all()
+        ctx = Context(size, auctions, random.Random(args.seed))
+        _reset_module_state()
+
+        results = {}
+        for name, make_args in [*READS.items(), *WRITES.items()]:
+            if args.only and name not in args.only:
+                continue
+            results[name] = await time_function(session_factory, ctx, name, make_args, args.repeat, args.budget)
+            r = results[name]
+            if "error" in r:
+                print(f"  {name:<36}  failed: {r['error']}", flush=True)
+            else:
+                print(f"  {name:<36}{r['p50_ms']:>10.3f}ms{r['p95_ms']:>10.3f}ms{r['mean_ms']:>10.3f}ms"
+                      f"{r['calls']:>7}", flush=True)
+        await engine.dispose()
+    return results
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(baseline: dict, current: dict):
+    print(f"\nvs {baseline['meta']['commit']} (p50, >1.25x slower marked with !)")
+    for size, results in current["results"].items():
+        old = baseline["results"].get(size, {})
+        print(f"  N={size}")
+        for name, r in results.items():
+            if "p50_ms" in r and old.get(name, {}).get("p50_ms"):
+                ratio = r["p50_ms"] / old[name]["p50_ms"]
+                mark = " !" if ratio > 1.25 else ""
+                print(f"    {name:<36}{old[name]['p50_ms']:>10.3f}ms -> {r['p50_ms']:>9.3f}ms  x{ratio:.2f}{mark}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--only", nargs="+", help="benchmark just these functions")
+    parser.add_argument("--repeat", type=int, default=200, help="max calls per function")
+    parser.add_argument("--budget", type=float, default=2.0, help="max seconds per function (at least 3 calls)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db-dir", default=os.path.join(tempfile.gettempdir(), "flower_bot_bench"))
+    parser.add_argument("--out")
+    parser.add_argument("--compare", help="earlier results JSON")
+    args = parser.parse_args()
+
+    missing = sorted(set(public_functions()) - set(READS) - set(WRITES))
+    if missing:
+        print(f"warning: no benchmark case for {', '.join(missing)}")
+
+    os.makedirs(args.db_dir, exist_ok=True)
+    commit = _commit()
+    current = {
+        "meta": {"commit": commit, "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+                 "python": platform.python_version(), "sqlalchemy": sqlalchemy.__version__,
+                 "sqlite": sqlite3.sqlite_version, "seed": args.seed},
+        "results": {},
+    }
+    for size in args.sizes:
+        print(f"N={size}")
+        print(f"  {'function':<36}{'p50':>12}{'p95':>12}{'mean':>12}{'calls':>7}")
+        current["results"][str(size)] = await run_size(args.db_dir, size, args)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"queries-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(current, f, indent=2)
+    print(f"\nresults written to {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), current)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
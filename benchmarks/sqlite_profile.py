@@ -0,0 +1,112 @@
+"""Concurrent bidding benchmark: default SQLite engine vs the tuned profile.
+
+    python -m benchmarks.sqlite_profile [--bidders 20] [--bids 50] [--readers 5]
+
+Writers insert an AuctionBid and bump the flower's current_bid in one commit
+(the process_auction_bid write path); readers poll get_highest_bid meanwhile.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+
+from database.connection import build_engine
+from database.migrations import run_migrations
+from database.models import Base, User, Flower, AuctionBid
+from database.queries import get_highest_bid
+
+
+async def _setup(engine) -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_factory() as session:
+        user = User(telegram_id=1, balance=0)
+        session.add(user)
+        await session.flush()
+        flower = Flower(user_id=user.id, photo_id="x", name="bench", price=1000,
+                        is_auction=True, current_bid=1000, status="published")
+        session.add(flower)
+        await session.commit()
+        return flower.id
+
+
+async def _run(engine, bidders: int, bids: int, readers: int) -> dict:
+    flower_id = await _setup(engine)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    commits = 0
+    errors = 0
+    read_latencies = []
+    writers_done = asyncio.Event()
+
+    async def bidder(n: int):
+        nonlocal commits, errors
+        for i in range(bids):
+            amount = 1000 + i * bidders + n + 1
+            try:
+                async with session_factory() as session:
+                    session.add(AuctionBid(flower_id=flower_id, user_telegram_id=n,
+                                           username=f"u{n}", full_name=f"User {n}", amount=amount))
+                    await session.execute(
+                        update(Flower).where(Flower.id == flower_id)
+                        .values(current_bid=amount, highest_bidder_id=n, bid_count=Flower.bid_count + 1)
+                    )
+                    await session.commit()
+                commits += 1
+            except Exception:
+                errors += 1
+
+    async def reader():
+        while not writers_done.is_set():
+            start = time.perf_counter()
+            async with session_factory() as session:
+                await get_highest_bid(session, flower_id)
+            read_latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0)
+
+    reader_tasks = [asyncio.create_task(reader()) for _ in range(readers)]
+    start = time.perf_counter()
+    await asyncio.gather(*(bidder(n) for n in range(bidders)))
+    elapsed = time.perf_counter() - start
+    writers_done.set()
+    await asyncio.gather(*reader_tasks)
+    await engine.dispose()
+
+    read_latencies.sort()
+    return {
+        "commits_per_sec": commits / elapsed,
+        "errors": errors,
+        "reads": len(read_latencies),
+        "read_p50_ms": statistics.median(read_latencies) * 1000 if read_latencies else 0,
+        "read_p95_ms": read_latencies[int(len(read_latencies) * 0.95)] * 1000 if read_latencies else 0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bidders", type=int, default=20)
+    parser.add_argument("--bids", type=int, default=50)
+    parser.add_argument("--readers", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        profiles = {
+            # What connection.py did before: NullPool, rollback journal, synchronous=FULL
+            "default": create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'default.db')}"),
+            "tuned": build_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'tuned.db')}"),
+        }
+        print(f"{'profile':<10}{'commits/s':>12}{'errors':>8}{'reads':>8}{'read p50':>11}{'read p95':>11}")
+        for name, engine in profiles.items():
+            r = await _run(engine, args.bidders, args.bids, args.readers)
+            print(f"{name:<10}{r['commits_per_sec']:>12.1f}{r['errors']:>8}{r['reads']:>8}"
+                  f"{r['read_p50_ms']:>9.2f}ms{r['read_p95_ms']:>9.2f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
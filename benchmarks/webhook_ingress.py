@@ -0,0 +1,152 @@
+"""Ingress-to-handler latency: webhook mode vs long polling.
+
+    python -m benchmarks.webhook_ingress [--updates recorded.jsonl] [--count 2000] [--rate 500]
+
+Both modes run a real Dispatcher against local servers, nothing reaches
+Telegram. Webhook: updates are POSTed (with the secret header) to the app
+built by utils.webhook.build_webhook_app; reports the HTTP response time and
+the time until the handler runs. Polling: updates are queued on the loadtest
+Bot API stand-in, whose getUpdates long-polls like Telegram's; reports the
+time from queueing to the handler. --updates takes one Update JSON object per line
+(update_ids are renumbered); without it sample text messages are used.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from aiohttp import ClientSession, web
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Update
+
+from loadtest.fake_api import FakeBotAPI
+from utils.webhook import build_webhook_app
+
+TOKEN = "123456:BENCHMARK-TOKEN"
+SECRET = "benchmark-secret"
+PATH = "/webhook"
+
+
+def _sample_updates(count: int) -> list:
+    texts = ["/start", "15000", "16000", "🌸 Gul qoshish", "📋 Mening gullarim", "17000"]
+    now = int(time.time())
+    return [
+        {"update_id": 0, "message": {
+            "message_id": n + 1, "date": now, "text": texts[n % len(texts)],
+            "chat": {"id": 1000 + n % 200, "type": "private"},
+            "from": {"id": 1000 + n % 200, "is_bot": False, "first_name": f"User {n % 200}"},
+        }}
+        for n in range(count)
+    ]
+
+
+def _load_updates(path: str, count: int) -> list:
+    with open(path, encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    return [updates[n % len(updates)] for n in range(count)]
+
+
+def _dispatcher(seen: dict, done: asyncio.Event, expected: int) -> Dispatcher:
+    dp = Dispatcher()
+    router = Router()
+
+    @router.message()
+    async def on_message(message, event_update: Update):
+        seen[event_update.update_id] = time.perf_counter()
+        if len(seen) == expected:
+            done.set()
+
+    dp.include_router(router)
+    return dp
+
+
+async def _serve(app: web.Application) -> tuple:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def bench_webhook(updates: list, rate: float) -> tuple:
+    seen, done = {}, asyncio.Event()
+    dp = _dispatcher(seen, done, len(updates))
+    bot = Bot(TOKEN)
+    runner, base = await _serve(build_webhook_app(dp, bot, path=PATH, secret=SECRET))
+    sent_at, responses = {}, []
+
+    async with ClientSession() as client:
+        async with client.post(f"{base}{PATH}", json=updates[0],
+                               headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}) as resp:
+            assert resp.status == 401, f"bad secret accepted ({resp.status})"
+
+        async def post(update: dict):
+            headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+            sent_at[update["update_id"]] = start = time.perf_counter()
+            async with client.post(f"{base}{PATH}", json=update, headers=headers) as resp:
+                assert resp.status == 200, resp.status
+                responses.append(time.perf_counter() - start)
+
+        posts = []
+        for update in updates:
+            posts.append(asyncio.create_task(post(update)))
+            await asyncio.sleep(1 / rate)
+        await asyncio.gather(*posts)
+        await asyncio.wait_for(done.wait(), 30)
+
+    await runner.cleanup()
+    await bot.session.close()
+    return [seen[i] - sent_at[i] for i in seen], responses
+
+
+async def bench_polling(updates: list, rate: float) -> list:
+    seen, done = {}, asyncio.Event()
+    dp = _dispatcher(seen, done, len(updates))
+    api = FakeBotAPI()
+    await api.start()
+    bot = Bot(TOKEN, session=api.session())
+
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=10))
+    await asyncio.sleep(0.2)
+    for update in updates:
+        api.put_update(update)
+        await asyncio.sleep(1 / rate)
+    await asyncio.wait_for(done.wait(), 30)
+
+    await dp.stop_polling()
+    await polling
+    await api.stop()
+    await bot.session.close()
+    return [seen[i] - api.queued_at[i] for i in seen]
+
+
+def _report(name: str, values: list):
+    values.sort()
+    print(f"{name:<26}{statistics.median(values) * 1000:>9.2f}ms{values[int(len(values) * 0.95)] * 1000:>9.2f}ms"
+          f"{values[int(len(values) * 0.99)] * 1000:>9.2f}ms{values[-1] * 1000:>9.2f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", help="recorded updates, one JSON object per line")
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=500, help="updates per second")
+    args = parser.parse_args()
+
+    updates = _load_updates(args.updates, args.count) if args.updates else _sample_updates(args.count)
+
+    def numbered(offset: int) -> list:
+        return [{**update, "update_id": offset + n} for n, update in enumerate(updates)]
+
+    print(f"{args.count} updates at {args.rate:.0f}/s")
+    print(f"{'':<26}{'p50':>11}{'p95':>11}{'p99':>11}{'max':>11}")
+    handler, responses = await bench_webhook(numbered(1), args.rate)
+    _report("webhook: HTTP response", responses)
+    _report("webhook: ingress->handler", handler)
+    _report("polling: ingress->handler", await bench_polling(numbered(1), args.rate))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,10 +7,16 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from config import BOT_TOKEN
+from config import BOT_TOKEN, BOT_MODE, FSM_STORAGE
 from database import init_db
+from database.connection import engine, async_session
+from database.fsm_storage import DatabaseStorage
+from database.queries import user_cache, active_auction_index, pending_flower_stats
 from handlers import user_router, admin_router, auction_router
-from utils import scheduler_loop
+from handlers.user import media_collection_tasks
+from utils import scheduler_loop, auction_engine, caption_refresher, broadcaster, user_dispatch, auction_deadlines
+from utils import metrics, tracing
+from utils.webhook import run_webhook
 
 
 async def main():
@@ -30,9 +36,36 @@ async def main():
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
     
-    storage = MemoryStorage()
+    # Wizard states survive restarts unless FSM_STORAGE=memory
+    storage = MemoryStorage() if FSM_STORAGE == "memory" else DatabaseStorage()
     dp = Dispatcher(storage=storage)
     
+    # Metrics first, so update latency includes the per-user queue wait
+    metrics.instrument_dispatcher(dp, bot)
+    metrics.instrument_engine(engine)
+    metrics.register_live_gauges(async_session)
+    for name, stats in {
+        "dispatch": user_dispatch.stats,
+        "broadcaster": broadcaster.stats,
+        "caption_refresher": caption_refresher.stats,
+        "deadlines": lambda: {"scheduled": len(auction_deadlines)},
+        "auction_index": active_auction_index.stats,
+        "user_cache": user_cache.stats,
+        "pending_flowers": pending_flower_stats,
+        "media_collection": lambda: {"tasks": len(media_collection_tasks)},
+        "fsm": getattr(storage, "stats", dict),
+        "tracing": tracing.tracer.stats,
+    }.items():
+        metrics.register_stats(name, stats)
+    metrics_server = await metrics.start_metrics_server()
+    
+    # Root span per sampled update (no-op unless TRACE_SAMPLE_RATE > 0)
+    tracing.instrument_dispatcher(dp, bot)
+    tracing.instrument_engine(engine)
+    
+    # One user's updates in order, different users in parallel
+    user_dispatch.setup(dp)
+    
     # Register routers
     dp.include_router(user_router)
     dp.include_router(admin_router)
@@ -41,12 +74,22 @@ async def main():
     # Start scheduler in background
     asyncio.create_task(scheduler_loop(bot))
     
-    # Start polling
-    logging.info("Bot ishga tushdi!")
+    logging.info("Bot ishga tushdi! (%s)", BOT_MODE)
     
     try:
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot, allowed_updates=dp.resolve_used_update_types())
+        else:
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
+        await user_dispatch.shutdown()
+        await auction_engine.shutdown()
+        await caption_refresher.shutdown()
+        await broadcaster.shutdown()
+        await storage.close()
+        await tracing.tracer.shutdown()
+        if metrics_server is not None:
+            await metrics_server.cleanup()
         await bot.session.close()
 
 
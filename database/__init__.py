@@ -1,4 +1,4 @@
 from database.connection import init_db, get_session, async_session
-from database.models import User, Flower, Payment, Settings, AuctionParticipant, AuctionBid, Base
+from database.models import User, Flower, Payment, PaymentDailyRollup, PendingFlower, FSMRecord, Settings, AuctionParticipant, AuctionBid, Base
 
-__all__ = ["init_db", "get_session", "async_session", "User", "Flower", "Payment", "Settings", "AuctionParticipant", "AuctionBid", "Base"]
+__all__ = ["init_db", "get_session", "async_session", "User", "Flower", "Payment", "PaymentDailyRollup", "PendingFlower", "FSMRecord", "Settings", "AuctionParticipant", "AuctionBid", "Base"]
@@ -0,0 +1,152 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+
+class LRUCache:
+    """Bounded LRU cache with a per-entry TTL and hit/miss counters.
+    Pinned entries are kept out of both until popped."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # Bumped by every pop/clear: a fill that read the database before a write
+        # landed must not put the old value back (see fill)
+        self.generation = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._pinned: Dict[Hashable, Any] = {}
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if key in self._pinned:
+            self.hits += 1
+            return self._pinned[key]
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> List[Hashable]:
+        """Store the value; returns the keys evicted to stay within maxsize"""
+        if key in self._pinned:
+            self._pinned[key] = value
+            return []
+        if self.maxsize <= 0:
+            return [key]
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        evicted = []
+        while len(self._data) > self.maxsize:
+            evicted.append(self._data.popitem(last=False)[0])
+        return evicted
+
+    def fill(self, key: Hashable, value: Any, generation: int):
+        """set() for a value read from the database, skipped if anything was invalidated
+        since `generation` (taken before the read) - the value may predate that write"""
+        if generation == self.generation:
+            self.set(key, value)
+
+    def pin(self, key: Hashable) -> bool:
+        """Exempt a live entry from LRU eviction and its TTL until it is popped;
+        False if there is no such entry (any more)"""
+        if key in self._pinned:
+            return True
+        value = self.get(key)
+        if value is None:
+            return False
+        del self._data[key]
+        self._pinned[key] = value
+        return True
+
+    def is_pinned(self, key: Hashable) -> bool:
+        return key in self._pinned
+
+    def pop(self, key: Hashable):
+        self.generation += 1
+        self._data.pop(key, None)
+        self._pinned.pop(key, None)
+
+    def clear(self):
+        self.generation += 1
+        self._data.clear()
+        self._pinned.clear()
+
+    def purge_expired(self) -> int:
+        """Drop expired entries now instead of on their next lookup"""
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _) in self._data.items() if expires_at < now]
+        for key in expired:
+            del self._data[key]
+        return len(expired)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Presence check that doesn't touch LRU order, TTL or counters"""
+        return key in self._data or key in self._pinned
+
+    def __len__(self) -> int:
+        return len(self._data) + len(self._pinned)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self), "maxsize": self.maxsize,
+                "pinned": len(self._pinned)}
+
+
+class ActiveAuctionIndex:
+    """telegram_id -> auctions the user is active in (latest join last), mirrors
+    active auction_participants rows of published auctions"""
+
+    def __init__(self):
+        self._by_user: Dict[int, List[int]] = {}
+        self._by_flower: Dict[int, Set[int]] = {}
+
+    def load(self, rows: Iterable[Tuple[int, int]]):
+        """Replace the index with (telegram_id, flower_id) rows, oldest first"""
+        self._by_user.clear()
+        self._by_flower.clear()
+        for telegram_id, flower_id in rows:
+            self.add(telegram_id, flower_id)
+
+    def add(self, telegram_id: int, flower_id: int):
+        flowers = self._by_user.setdefault(telegram_id, [])
+        if flower_id in flowers:
+            flowers.remove(flower_id)
+        flowers.append(flower_id)
+        self._by_flower.setdefault(flower_id, set()).add(telegram_id)
+
+    def remove(self, telegram_id: int, flower_id: int):
+        flowers = self._by_user.get(telegram_id)
+        if flowers and flower_id in flowers:
+            flowers.remove(flower_id)
+            if not flowers:
+                del self._by_user[telegram_id]
+        users = self._by_flower.get(flower_id)
+        if users:
+            users.discard(telegram_id)
+            if not users:
+                del self._by_flower[flower_id]
+
+    def drop_auction(self, flower_id: int):
+        for telegram_id in list(self._by_flower.get(flower_id, ())):
+            self.remove(telegram_id, flower_id)
+
+    def get(self, telegram_id: int) -> Optional[int]:
+        """The auction the user's messages go to (the one joined last)"""
+        flowers = self._by_user.get(telegram_id)
+        return flowers[-1] if flowers else None
+
+    def __len__(self) -> int:
+        return len(self._by_user)
+
+    def stats(self) -> dict:
+        return {"users": len(self._by_user), "auctions": len(self._by_flower)}
@@ -1,15 +1,73 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from database.models import Base
+from database.migrations import run_migrations
+from database.queries import load_active_auction_index, load_pending_flowers
+from config import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_STATEMENT_CACHE_SIZE,
+    SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_CACHE_SIZE, SQLITE_MMAP_SIZE, SQLITE_BUSY_TIMEOUT, SQLITE_TEMP_STORE
+)
 
-DATABASE_URL = "sqlite+aiosqlite:///./flower_bot.db"
+# Applied on every new connection (order matters: busy_timeout before journal_mode)
+SQLITE_PRAGMAS = {
+    "busy_timeout": SQLITE_BUSY_TIMEOUT,
+    "journal_mode": SQLITE_JOURNAL_MODE,
+    "synchronous": SQLITE_SYNCHRONOUS,
+    "cache_size": SQLITE_CACHE_SIZE,
+    "mmap_size": SQLITE_MMAP_SIZE,
+    "temp_store": SQLITE_TEMP_STORE,
+}
 
-engine = create_async_engine(DATABASE_URL, echo=False)
+
+def build_engine(url: str = DATABASE_URL, pragmas: dict = None,
+                 pool_size: int = DB_POOL_SIZE, max_overflow: int = DB_MAX_OVERFLOW) -> AsyncEngine:
+    """Create an engine for the configured backend (SQLite or PostgreSQL)"""
+    backend = make_url(url).get_backend_name()
+
+    if backend == "postgresql":
+        return create_async_engine(
+            url, echo=False,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_pre_ping=True,
+            # asyncpg prepared statement cache (per connection)
+            connect_args={"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE},
+        )
+
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+
+    # aiosqlite defaults to NullPool for files, which reopens the file (and
+    # re-runs the pragmas) for every session - keep connections pooled instead
+    new_engine = create_async_engine(
+        url, echo=False,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+    )
+
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    event.listen(new_engine.sync_engine, "connect", set_sqlite_pragmas)
+    return new_engine
+
+
+engine = build_engine()
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations)
+    async with async_session() as session:
+        await load_active_auction_index(session)
+        await load_pending_flowers(session)
 
 
 async def get_session() -> AsyncSession:
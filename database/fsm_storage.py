@@ -0,0 +1,188 @@
+"""aiogram FSM storage on the bot's own database.
+
+Reads are served from an in-memory LRU of recently used keys and fall back to
+the `fsm_states` table; keys known to have no row (most users are in no
+wizard) never reach the table. Writes land in memory and are flushed in one
+transaction every FSM_FLUSH_INTERVAL seconds (and on close), so a restart
+loses at most that window. Keys untouched for FSM_STATE_TTL seconds (abandoned
+wizards) expire and their rows are purged.
+
+The cache assumes all updates of one user are handled by one process.
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Set, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import select, delete
+
+from database.cache import LRUCache
+from database.connection import async_session
+from database.models import FSMRecord
+from database.queries import upsert
+from config import FSM_FLUSH_INTERVAL, FSM_STATE_TTL, FSM_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Expired rows are deleted at most this often (seconds)
+PURGE_INTERVAL = 60
+
+# (state, data)
+Record = Tuple[Optional[str], Dict[str, Any]]
+EMPTY: Record = (None, {})
+
+
+def _key(key: StorageKey) -> str:
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+
+class DatabaseStorage(BaseStorage):
+    def __init__(self, session_factory=async_session, flush_interval: float = FSM_FLUSH_INTERVAL,
+                 ttl: int = FSM_STATE_TTL, cache_size: int = FSM_CACHE_SIZE):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self._cache = LRUCache(cache_size, ttl)
+        self._dirty: Dict[str, Record] = {}
+        self._stored: Optional[Set[str]] = None  # keys that have a row, loaded on first use
+        self._stored_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+        self.flushes = 0
+
+    def _cutoff(self) -> datetime:
+        return datetime.utcnow() - timedelta(seconds=self.ttl)
+
+    async def _load_stored(self):
+        async with self._stored_lock:
+            if self._stored is not None:
+                return
+            async with self.session_factory() as session:
+                keys = (await session.execute(
+                    select(FSMRecord.key).where(FSMRecord.updated_at >= self._cutoff())
+                )).scalars().all()
+            self._stored = set(keys)
+
+    async def _get(self, key: str) -> Record:
+        if self._stored is None:
+            await self._load_stored()
+
+        while True:
+            if key in self._dirty:
+                return self._dirty[key]
+            record = self._cache.get(key)
+            if record is not None:
+                return record
+            if key not in self._stored:
+                return EMPTY
+
+            async with self.session_factory() as session:
+                row = (await session.execute(
+                    select(FSMRecord.state, FSMRecord.data).where(
+                        FSMRecord.key == key, FSMRecord.updated_at >= self._cutoff()
+                    )
+                )).one_or_none()
+            if key in self._dirty or key in self._cache:
+                continue  # written (or loaded) meanwhile: use that instead
+
+            record = (row.state, json.loads(row.data) if row.data else {}) if row else EMPTY
+            self._cache.set(key, record)
+            return record
+
+    async def _put(self, key: str, record: Record):
+        self._dirty[key] = record
+        self._cache.set(key, record)
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = _key(key)
+        _, data = await self._get(k)
+        await self._put(k, (state.state if isinstance(state, State) else state, data))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._get(_key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        k = _key(key)
+        state, _ = await self._get(k)
+        await self._put(k, (state, data.copy()))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._get(_key(key))
+        return data.copy()
+
+    async def flush(self):
+        """Write every pending change in one transaction"""
+        if not self._dirty:
+            return
+        pending, self._dirty = self._dirty, {}
+        now = datetime.utcnow()
+
+        cleared = [key for key, (state, data) in pending.items() if state is None and not data]
+        rows = [
+            {"key": key, "state": state, "data": json.dumps(data, ensure_ascii=False), "updated_at": now}
+            for key, (state, data) in pending.items() if state is not None or data
+        ]
+        try:
+            async with self.session_factory() as session:
+                if rows:
+                    stmt = upsert(session, FSMRecord)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[FSMRecord.key],
+                        set_={"state": stmt.excluded.state, "data": stmt.excluded.data,
+                              "updated_at": stmt.excluded.updated_at}
+                    )
+                    await session.execute(stmt, rows)
+                if cleared:
+                    await session.execute(delete(FSMRecord).where(FSMRecord.key.in_(cleared)))
+                await session.commit()
+        except asyncio.CancelledError:
+            self._dirty = {**pending, **self._dirty}  # rewriting is harmless, losing is not
+            raise
+        except Exception:
+            logger.exception("FSM flush of %s keys failed, will retry", len(pending))
+            # Keep anything written since; retry the rest next time
+            self._dirty = {**pending, **self._dirty}
+            return
+        if self._stored is not None:
+            self._stored.update(row["key"] for row in rows)
+            self._stored.difference_update(cleared)
+        self.flushes += 1
+
+    async def purge_expired(self) -> int:
+        async with self.session_factory() as session:
+            result = await session.execute(
+                delete(FSMRecord).where(FSMRecord.updated_at < self._cutoff()).returning(FSMRecord.key)
+            )
+            purged = result.scalars().all()
+            await session.commit()
+        if self._stored is not None:
+            self._stored.difference_update(purged)
+        return len(purged)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if time.monotonic() - self._last_purge > PURGE_INTERVAL:
+                self._last_purge = time.monotonic()
+                try:
+                    await self.purge_expired()
+                except Exception:
+                    logger.exception("FSM purge failed")
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "dirty": len(self._dirty), "flushes": self.flushes}
@@ -0,0 +1,50 @@
+"""Maintenance commands.
+
+    python -m database.maintenance rebuild-payment-rollup
+    python -m database.maintenance reconcile-participant-counts [--fix]
+"""
+import argparse
+import asyncio
+
+from database.connection import init_db, async_session
+from database.queries import rebuild_payment_rollup, reconcile_participant_counts
+
+
+async def _rebuild_payment_rollup(args):
+    async with async_session() as session:
+        days = await rebuild_payment_rollup(session)
+    print(f"payment_daily_rollup rebuilt: {days} days")
+
+
+async def _reconcile_participant_counts(args):
+    async with async_session() as session:
+        mismatches = await reconcile_participant_counts(session, fix=args.fix)
+    for flower_id, stored, actual in mismatches:
+        print(f"flower {flower_id}: participant_count={stored}, active participants={actual}")
+    if not mismatches:
+        print("participant_count is consistent")
+    elif args.fix:
+        print(f"Fixed {len(mismatches)} flowers")
+
+
+COMMANDS = {
+    "rebuild-payment-rollup": _rebuild_payment_rollup,
+    "reconcile-participant-counts": _reconcile_participant_counts,
+}
+
+
+async def _run(args):
+    await init_db()
+    await COMMANDS[args.command](args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flower bot database maintenance")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--fix", action="store_true", help="rewrite mismatched counters (reconcile-participant-counts)")
+    args = parser.parse_args()
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
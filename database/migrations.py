@@ -0,0 +1,79 @@
+"""Versioned schema migrations.
+
+`create_all` only creates missing tables, so changes to existing tables
+(new indexes, new columns) live here. Each migration runs once and its
+version is recorded in `schema_migrations`.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import Table, Column, Integer, String, DateTime, MetaData, select, insert, inspect, text
+from sqlalchemy.engine import Connection
+
+from database.models import Base
+from database.queries import payment_rollup_rebuild_statements, participant_count_sync_statement
+
+logger = logging.getLogger(__name__)
+
+_meta = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations", _meta,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+
+def _create_missing_indexes(conn: Connection, *table_names: str):
+    """Create indexes declared on the models that don't exist in the DB yet"""
+    for name in table_names:
+        for index in Base.metadata.tables[name].indexes:
+            index.create(conn, checkfirst=True)
+
+
+def _add_column(conn: Connection, table: str, column: str, ddl: str):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists"""
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in existing:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _m001_hot_lookup_indexes(conn: Connection):
+    _create_missing_indexes(conn, "flowers", "auction_participants", "auction_bids", "payments")
+
+
+def _m002_backfill_payment_rollup(conn: Connection):
+    for stmt in payment_rollup_rebuild_statements():
+        conn.execute(stmt)
+
+
+def _m003_admin_stats_indexes(conn: Connection):
+    _create_missing_indexes(conn, "flowers", "auction_bids")
+
+
+def _m004_flower_participant_count(conn: Connection):
+    _add_column(conn, "flowers", "participant_count", "INTEGER NOT NULL DEFAULT 0")
+    conn.execute(participant_count_sync_statement())
+
+
+# (version, description, fn) - append only, never renumber
+MIGRATIONS = [
+    (1, "Indexes for auction, bid and payment lookups", _m001_hot_lookup_indexes),
+    (2, "Backfill payment_daily_rollup", _m002_backfill_payment_rollup),
+    (3, "Indexes for admin statistics", _m003_admin_stats_indexes),
+    (4, "Denormalised flowers.participant_count", _m004_flower_participant_count),
+]
+
+
+def run_migrations(conn: Connection):
+    """Apply pending migrations in version order (sync, use with run_sync)"""
+    _meta.create_all(conn)
+    applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+    for version, description, fn in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info("Applying migration %s: %s", version, description)
+        fn(conn)
+        conn.execute(insert(schema_migrations).values(version=version, description=description))
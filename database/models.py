@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, Date, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime
 
@@ -9,7 +9,7 @@ class User(Base):
     __tablename__ = "users"
     
     id = Column(Integer, primary_key=True)
-    telegram_id = Column(Integer, unique=True, nullable=False)
+    telegram_id = Column(BigInteger, unique=True, nullable=False)
     username = Column(String(255), nullable=True)
     full_name = Column(String(255), nullable=True)
     balance = Column(Integer, default=0)  # Balans so'mda
@@ -34,12 +34,13 @@ class Flower(Base):
     is_auction = Column(Boolean, default=False)
     current_bid = Column(Integer, default=0)
     bid_count = Column(Integer, default=0)  # Stavkalar soni
-    highest_bidder_id = Column(Integer, nullable=True)
+    participant_count = Column(Integer, nullable=False, default=0, server_default="0")  # Faol ishtirokchilar soni
+    highest_bidder_id = Column(BigInteger, nullable=True)
     phone_number = Column(String(50), nullable=True)
     location = Column(String(255), nullable=True)
     seller_username = Column(String(255), nullable=True)
-    seller_telegram_id = Column(Integer, nullable=True)
-    status = Column(String(50), default="pending")  # pending, published, sold, ended
+    seller_telegram_id = Column(BigInteger, nullable=True)
+    status = Column(String(50), default="pending")  # pending, published, expired (time up, seller deciding), sold, ended
     message_id = Column(Integer, nullable=True)  # Kanaldagi xabar ID
     auction_end_time = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -47,6 +48,12 @@ class Flower(Base):
     owner = relationship("User", back_populates="flowers")
     participants = relationship("AuctionParticipant", back_populates="flower")
     bids = relationship("AuctionBid", back_populates="flower")
+    
+    __table_args__ = (
+        Index("ix_flowers_auction_status", "is_auction", "status"),  # get_active_auctions
+        Index("ix_flowers_user_id", "user_id"),  # get_user_flowers
+        Index("ix_flowers_status", "status"),  # get_admin_stats
+    )
 
 
 class AuctionParticipant(Base):
@@ -54,13 +61,19 @@ class AuctionParticipant(Base):
     
     id = Column(Integer, primary_key=True)
     flower_id = Column(Integer, ForeignKey("flowers.id"), nullable=False)
-    user_telegram_id = Column(Integer, nullable=False)
+    user_telegram_id = Column(BigInteger, nullable=False)
     username = Column(String(255), nullable=True)
     full_name = Column(String(255), nullable=True)
     joined_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
     
     flower = relationship("Flower", back_populates="participants")
+    
+    __table_args__ = (
+        Index("ix_participants_user_active", "user_telegram_id", "is_active"),  # get_user_active_auction
+        Index("ix_participants_flower_user", "flower_id", "user_telegram_id"),  # get_auction_participant
+        Index("ix_participants_flower_active", "flower_id", "is_active"),  # get_auction_participants
+    )
 
 
 class AuctionBid(Base):
@@ -68,13 +81,18 @@ class AuctionBid(Base):
     
     id = Column(Integer, primary_key=True)
     flower_id = Column(Integer, ForeignKey("flowers.id"), nullable=False)
-    user_telegram_id = Column(Integer, nullable=False)
+    user_telegram_id = Column(BigInteger, nullable=False)
     username = Column(String(255), nullable=True)
     full_name = Column(String(255), nullable=True)
     amount = Column(Integer, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     flower = relationship("Flower", back_populates="bids")
+    
+    __table_args__ = (
+        Index("ix_bids_flower_amount", "flower_id", "amount"),  # get_auction_bids, get_highest_bid
+        Index("ix_bids_created_at", "created_at"),  # get_admin_stats (bids today)
+    )
 
 
 class Payment(Base):
@@ -88,6 +106,38 @@ class Payment(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     user = relationship("User", back_populates="payments")
+    
+    __table_args__ = (
+        Index("ix_payments_status_created", "status", "created_at"),  # get_pending_payments, get_income_stats
+    )
+
+
+class PaymentDailyRollup(Base):
+    """Approved payments per day (UTC, by Payment.created_at) for income reports"""
+    __tablename__ = "payment_daily_rollup"
+    
+    day = Column(Date, primary_key=True)
+    amount = Column(BigInteger, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class PendingFlower(Base):
+    """Listing saved while its owner pays for it; published when the payment is approved"""
+    __tablename__ = "pending_flowers"
+    
+    user_telegram_id = Column(BigInteger, primary_key=True)
+    payload = Column(Text, nullable=False)  # JSON: wizard data, is_auction, required_price, ...
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class FSMRecord(Base):
+    """aiogram FSM state and data per storage key (see database/fsm_storage.py)"""
+    __tablename__ = "fsm_states"
+    
+    key = Column(String(255), primary_key=True)  # bot:chat:user:thread:destiny
+    state = Column(String(255), nullable=True)
+    data = Column(Text, nullable=True)  # JSON
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
 
 
 class Settings(Base):
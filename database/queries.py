@@ -1,20 +1,61 @@
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, insert, update, delete, func, case
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from database.models import User, Flower, Payment, Settings, AuctionParticipant, AuctionBid
+from database.cache import LRUCache, ActiveAuctionIndex
+from database.models import (
+    User, Flower, Payment, PaymentDailyRollup, PendingFlower, Settings, AuctionParticipant, AuctionBid
+)
+from dataclasses import dataclass
+import json
+import logging
 from typing import Optional, List, Tuple
-from datetime import datetime
+from datetime import datetime, timedelta
+from config import (
+    USER_CACHE_SIZE, USER_CACHE_TTL, REGULAR_POST_PRICE, AUCTION_POST_PRICE, CARD_NUMBER,
+    PENDING_FLOWER_LIMIT, PENDING_FLOWER_TTL
+)
+
+logger = logging.getLogger(__name__)
 
 # New user bonus amount
 NEW_USER_BONUS = 100000
 
+# telegram_id -> User (detached, read-only). Every write below drops the entry
+# (and bumps the generation, so reads already in flight don't re-cache the old row).
+user_cache = LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+# telegram_id -> active auctions; kept in step with the participant/status writes below
+active_auction_index = ActiveAuctionIndex()
+
+# telegram_id -> listing waiting for its payment; write-through to the pending_flowers table.
+# Listings whose owner has sent the payment are pinned: the limit and TTL only drop unpaid drafts.
+pending_flowers = LRUCache(PENDING_FLOWER_LIMIT, PENDING_FLOWER_TTL)
+
+
+def upsert(session: AsyncSession, model):
+    """Dialect-specific INSERT that supports ON CONFLICT"""
+    if session.get_bind().dialect.name == "postgresql":
+        return pg_insert(model)
+    return sqlite_insert(model)
+
 
 # ==================== USER QUERIES ====================
 
 async def get_user(session: AsyncSession, telegram_id: int) -> Optional[User]:
+    user = user_cache.get(telegram_id)
+    if user is not None:
+        return user
+    
+    generation = user_cache.generation
     result = await session.execute(
         select(User).where(User.telegram_id == telegram_id)
     )
-    return result.scalar_one_or_none()
+    user = result.scalar_one_or_none()
+    if user is not None:
+        # Not cached if a balance/admin write was invalidated while this read ran
+        user_cache.fill(telegram_id, user, generation)
+    return user
 
 
 async def create_user(session: AsyncSession, telegram_id: int, username: str = None, full_name: str = None) -> User:
@@ -26,38 +67,71 @@ async def create_user(session: AsyncSession, telegram_id: int, username: str = N
     )
     session.add(user)
     await session.commit()
+    generation = user_cache.generation
     await session.refresh(user)
+    user_cache.fill(telegram_id, user, generation)
     return user
 
 
 async def get_or_create_user(session: AsyncSession, telegram_id: int, username: str = None, full_name: str = None) -> Tuple[User, bool]:
     """Get or create user. Returns (user, is_new) tuple"""
     user = await get_user(session, telegram_id)
-    is_new = False
-    if not user:
-        user = await create_user(session, telegram_id, username, full_name)
-        is_new = True
-    return user, is_new
+    if user:
+        return user, False
+    
+    # ON CONFLICT keeps two concurrent /start updates from failing on the unique key
+    result = await session.execute(
+        upsert(session, User)
+        .values(telegram_id=telegram_id, username=username, full_name=full_name,
+                balance=NEW_USER_BONUS, is_admin=False, created_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=[User.telegram_id])
+        .returning(User.id)
+    )
+    is_new = result.scalar_one_or_none() is not None
+    await session.commit()
+    return await get_user(session, telegram_id), is_new
 
 
-async def update_user_balance(session: AsyncSession, telegram_id: int, amount: int) -> bool:
-    """Add or subtract from user balance"""
-    user = await get_user(session, telegram_id)
-    if user:
-        user.balance += amount
-        await session.commit()
-        return True
-    return False
+async def update_user_balance(session: AsyncSession, telegram_id: int, amount: int) -> Optional[int]:
+    """Add or subtract from user balance. Returns the new balance, None if user not found"""
+    result = await session.execute(
+        update(User)
+        .where(User.telegram_id == telegram_id)
+        .values(balance=User.balance + amount)
+        .returning(User.balance)
+    )
+    balance = result.scalar_one_or_none()
+    await session.commit()
+    user_cache.pop(telegram_id)
+    return balance
+
+
+async def debit_user_balance(session: AsyncSession, telegram_id: int, amount: int) -> Optional[int]:
+    """Subtract amount only if balance covers it. Returns the new balance, None if not enough funds"""
+    result = await session.execute(
+        update(User)
+        .where(User.telegram_id == telegram_id, User.balance >= amount)
+        .values(balance=User.balance - amount)
+        .returning(User.balance)
+    )
+    balance = result.scalar_one_or_none()
+    await session.commit()
+    user_cache.pop(telegram_id)
+    return balance
 
 
 async def set_user_balance(session: AsyncSession, telegram_id: int, amount: int) -> bool:
     """Set user balance to specific amount"""
-    user = await get_user(session, telegram_id)
-    if user:
-        user.balance = amount
-        await session.commit()
-        return True
-    return False
+    result = await session.execute(
+        update(User)
+        .where(User.telegram_id == telegram_id)
+        .values(balance=amount)
+        .returning(User.id)
+    )
+    found = result.scalar_one_or_none() is not None
+    await session.commit()
+    user_cache.pop(telegram_id)
+    return found
 
 
 async def get_all_users(session: AsyncSession) -> List[User]:
@@ -66,12 +140,16 @@ async def get_all_users(session: AsyncSession) -> List[User]:
 
 
 async def set_user_admin(session: AsyncSession, telegram_id: int, is_admin: bool) -> bool:
-    user = await get_user(session, telegram_id)
-    if user:
-        user.is_admin = is_admin
-        await session.commit()
-        return True
-    return False
+    result = await session.execute(
+        update(User)
+        .where(User.telegram_id == telegram_id)
+        .values(is_admin=is_admin)
+        .returning(User.id)
+    )
+    found = result.scalar_one_or_none() is not None
+    await session.commit()
+    user_cache.pop(telegram_id)
+    return found
 
 
 # ==================== FLOWER QUERIES ====================
@@ -123,6 +201,24 @@ async def update_flower_status(session: AsyncSession, flower_id: int, status: st
         if message_id:
             flower.message_id = message_id
         await session.commit()
+        if status != "published":
+            active_auction_index.drop_auction(flower_id)
+
+
+async def transition_flower_status(session: AsyncSession, flower_id: int, from_status: str, to_status: str) -> bool:
+    """Conditional status change; True only for the caller whose UPDATE moved the flower
+    (use it to claim work that must run once)"""
+    result = await session.execute(
+        update(Flower)
+        .where(Flower.id == flower_id, Flower.status == from_status)
+        .values(status=to_status)
+        .returning(Flower.id)
+    )
+    claimed = result.scalar_one_or_none() is not None
+    await session.commit()
+    if claimed and to_status != "published":
+        active_auction_index.drop_auction(flower_id)
+    return claimed
 
 
 async def update_flower_bid(session: AsyncSession, flower_id: int, bid: int, bidder_telegram_id: int):
@@ -134,6 +230,13 @@ async def update_flower_bid(session: AsyncSession, flower_id: int, bid: int, bid
         await session.commit()
 
 
+async def get_flower_owner_telegram_id(session: AsyncSession, flower: Flower) -> Optional[int]:
+    if flower.seller_telegram_id:
+        return flower.seller_telegram_id
+    result = await session.execute(select(User.telegram_id).where(User.id == flower.user_id))
+    return result.scalar_one_or_none()
+
+
 async def get_user_flowers(session: AsyncSession, user_id: int) -> List[Flower]:
     result = await session.execute(
         select(Flower).where(Flower.user_id == user_id)
@@ -151,8 +254,28 @@ async def get_active_auctions(session: AsyncSession) -> List[Flower]:
     return result.scalars().all()
 
 
+async def get_auction_deadlines(session: AsyncSession) -> List[Tuple[int, datetime]]:
+    """(flower_id, auction_end_time) of every live auction that has a deadline"""
+    result = await session.execute(
+        select(Flower.id, Flower.auction_end_time).where(
+            Flower.is_auction == True,
+            Flower.status == "published",
+            Flower.auction_end_time.isnot(None)
+        )
+    )
+    return [tuple(row) for row in result.all()]
+
+
 # ==================== AUCTION PARTICIPANT QUERIES ====================
 
+async def _change_participant_count(session: AsyncSession, flower_id: int, delta: int):
+    await session.execute(
+        update(Flower)
+        .where(Flower.id == flower_id)
+        .values(participant_count=Flower.participant_count + delta)
+    )
+
+
 async def add_auction_participant(session: AsyncSession, flower_id: int, 
                                    user_telegram_id: int, username: str = None, 
                                    full_name: str = None) -> AuctionParticipant:
@@ -160,8 +283,15 @@ async def add_auction_participant(session: AsyncSession, flower_id: int,
     existing = await get_auction_participant(session, flower_id, user_telegram_id)
     if existing:
         if not existing.is_active:
-            existing.is_active = True
+            result = await session.execute(
+                update(AuctionParticipant)
+                .where(AuctionParticipant.id == existing.id, AuctionParticipant.is_active == False)
+                .values(is_active=True)
+            )
+            if result.rowcount:
+                await _change_participant_count(session, flower_id, 1)
             await session.commit()
+        active_auction_index.add(user_telegram_id, flower_id)
         return existing
     
     participant = AuctionParticipant(
@@ -172,7 +302,9 @@ async def add_auction_participant(session: AsyncSession, flower_id: int,
         is_active=True
     )
     session.add(participant)
+    await _change_participant_count(session, flower_id, 1)
     await session.commit()
+    active_auction_index.add(user_telegram_id, flower_id)
     await session.refresh(participant)
     return participant
 
@@ -199,12 +331,52 @@ async def get_auction_participants(session: AsyncSession, flower_id: int,
 
 async def remove_auction_participant(session: AsyncSession, flower_id: int, 
                                       user_telegram_id: int) -> bool:
-    participant = await get_auction_participant(session, flower_id, user_telegram_id)
-    if participant:
-        participant.is_active = False
+    result = await session.execute(
+        update(AuctionParticipant)
+        .where(
+            AuctionParticipant.flower_id == flower_id,
+            AuctionParticipant.user_telegram_id == user_telegram_id,
+            AuctionParticipant.is_active == True
+        )
+        .values(is_active=False)
+    )
+    removed = result.rowcount > 0
+    if removed:
+        await _change_participant_count(session, flower_id, -1)
+    await session.commit()
+    active_auction_index.remove(user_telegram_id, flower_id)
+    return removed
+
+
+def _active_participant_count():
+    return (
+        select(func.count(AuctionParticipant.id))
+        .where(AuctionParticipant.flower_id == Flower.id, AuctionParticipant.is_active == True)
+        .scalar_subquery()
+    )
+
+
+def participant_count_sync_statement():
+    """UPDATE that recomputes flowers.participant_count from auction_participants"""
+    return update(Flower).values(participant_count=_active_participant_count())
+
+
+async def reconcile_participant_counts(session: AsyncSession, fix: bool = False) -> List[Tuple[int, int, int]]:
+    """Compare flowers.participant_count with the real rows.
+    Returns (flower_id, stored, actual) for mismatches; rewrites the counters if fix"""
+    actual = _active_participant_count()
+    result = await session.execute(
+        select(Flower.id, Flower.participant_count, actual)
+        .where(Flower.participant_count != actual)
+    )
+    mismatches = [tuple(row) for row in result.all()]
+    if fix and mismatches:
+        await session.execute(
+            participant_count_sync_statement().where(Flower.id.in_([m[0] for m in mismatches])),
+            execution_options={"synchronize_session": False}
+        )
         await session.commit()
-        return True
-    return False
+    return mismatches
 
 
 async def get_user_active_auction(session: AsyncSession, user_telegram_id: int) -> Optional[AuctionParticipant]:
@@ -218,6 +390,18 @@ async def get_user_active_auction(session: AsyncSession, user_telegram_id: int)
     return result.scalar_one_or_none()
 
 
+async def load_active_auction_index(session: AsyncSession) -> int:
+    """Fill active_auction_index from active participants of published auctions"""
+    result = await session.execute(
+        select(AuctionParticipant.user_telegram_id, AuctionParticipant.flower_id)
+        .join(Flower, Flower.id == AuctionParticipant.flower_id)
+        .where(AuctionParticipant.is_active == True, Flower.status == "published")
+        .order_by(AuctionParticipant.id)
+    )
+    active_auction_index.load(result.all())
+    return len(active_auction_index)
+
+
 # ==================== AUCTION BID QUERIES ====================
 
 async def add_auction_bid(session: AsyncSession, flower_id: int, user_telegram_id: int,
@@ -235,6 +419,25 @@ async def add_auction_bid(session: AsyncSession, flower_id: int, user_telegram_i
     return bid
 
 
+async def add_auction_bids_batch(session: AsyncSession, flower_id: int, bids: List[dict],
+                                 current_bid: int, highest_bidder_id: int) -> List[AuctionBid]:
+    """Insert several bids and move the flower to its new price in one commit.
+    bids: dicts with user_telegram_id, username, full_name, amount"""
+    rows = [AuctionBid(flower_id=flower_id, **bid) for bid in bids]
+    session.add_all(rows)
+    await session.execute(
+        update(Flower)
+        .where(Flower.id == flower_id)
+        .values(
+            current_bid=current_bid,
+            highest_bidder_id=highest_bidder_id,
+            bid_count=Flower.bid_count + len(rows)
+        )
+    )
+    await session.commit()
+    return rows
+
+
 async def get_auction_bids(session: AsyncSession, flower_id: int) -> List[AuctionBid]:
     result = await session.execute(
         select(AuctionBid).where(AuctionBid.flower_id == flower_id).order_by(AuctionBid.amount.desc())
@@ -249,6 +452,107 @@ async def get_highest_bid(session: AsyncSession, flower_id: int) -> Optional[Auc
     return result.scalar_one_or_none()
 
 
+async def get_top_bids(session: AsyncSession, flower_id: int, limit: int = 10) -> List[AuctionBid]:
+    """Highest bids first, served from the (flower_id, amount) index"""
+    result = await session.execute(
+        select(AuctionBid).where(AuctionBid.flower_id == flower_id)
+        .order_by(AuctionBid.amount.desc()).limit(limit)
+    )
+    return result.scalars().all()
+
+
+async def get_bid(session: AsyncSession, bid_id: int) -> Optional[AuctionBid]:
+    return await session.get(AuctionBid, bid_id)
+
+
+async def get_bid_rank(session: AsyncSession, bid: AuctionBid) -> int:
+    """1-based position of the bid among the flower's bids (highest amount first)"""
+    result = await session.execute(
+        select(func.count(AuctionBid.id)).where(
+            AuctionBid.flower_id == bid.flower_id,
+            AuctionBid.amount > bid.amount
+        )
+    )
+    return result.scalar() + 1
+
+
+# ==================== PENDING FLOWER QUERIES ====================
+
+def _pending_flower_cutoff() -> datetime:
+    return datetime.utcnow() - timedelta(seconds=PENDING_FLOWER_TTL)
+
+
+async def save_pending_flower(session: AsyncSession, user_telegram_id: int, entry: dict):
+    """Keep a listing until its payment is approved (replaces the user's previous one)"""
+    stmt = upsert(session, PendingFlower).values(
+        user_telegram_id=user_telegram_id,
+        payload=json.dumps(entry, ensure_ascii=False),
+        created_at=datetime.utcnow()
+    )
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=[PendingFlower.user_telegram_id],
+        set_={"payload": stmt.excluded.payload, "created_at": stmt.excluded.created_at}
+    ))
+    await session.commit()
+    evicted = pending_flowers.set(user_telegram_id, entry)
+    if evicted:
+        # Over PENDING_FLOWER_LIMIT: the evicted listings are gone, don't bring them back on restart
+        logger.warning("Pending listing limit reached: dropped unpaid listings of %s", evicted)
+        await session.execute(delete(PendingFlower).where(PendingFlower.user_telegram_id.in_(evicted)))
+        await session.commit()
+
+
+def hold_pending_flower(user_telegram_id: int) -> bool:
+    """The owner sent the payment for their listing: keep it past PENDING_FLOWER_LIMIT/TTL
+    until it is published or dropped. False if the listing had already expired"""
+    return pending_flowers.pin(user_telegram_id)
+
+
+async def pop_pending_flower(session: AsyncSession, user_telegram_id: int) -> Optional[dict]:
+    """Take the user's pending listing out of the store (None if there is none)"""
+    entry = pending_flowers.get(user_telegram_id)
+    pending_flowers.pop(user_telegram_id)
+    # Memory is authoritative: an expired entry is gone, its row is deleted all the same
+    await session.execute(delete(PendingFlower).where(PendingFlower.user_telegram_id == user_telegram_id))
+    await session.commit()
+    return entry
+
+
+async def load_pending_flowers(session: AsyncSession) -> int:
+    """Drop expired unpaid rows and fill the in-memory store with the rest (newest kept if over
+    the limit); listings with a pending payment are always kept, pinned"""
+    paid = select(User.telegram_id).join(Payment, Payment.user_id == User.id).where(Payment.status == "pending")
+    await session.execute(delete(PendingFlower).where(
+        PendingFlower.created_at < _pending_flower_cutoff(),
+        PendingFlower.user_telegram_id.not_in(paid)
+    ))
+    await session.commit()
+    
+    held = (await session.execute(
+        select(PendingFlower).where(PendingFlower.user_telegram_id.in_(paid))
+    )).scalars().all()
+    result = await session.execute(
+        select(PendingFlower)
+        .where(PendingFlower.user_telegram_id.not_in(paid))
+        .order_by(PendingFlower.created_at.desc())
+        .limit(PENDING_FLOWER_LIMIT)
+    )
+    now = datetime.utcnow()
+    pending_flowers.clear()
+    for row in held:
+        pending_flowers.set(row.user_telegram_id, json.loads(row.payload))
+        pending_flowers.pin(row.user_telegram_id)
+    for row in reversed(result.scalars().all()):
+        remaining = PENDING_FLOWER_TTL - (now - row.created_at).total_seconds()
+        pending_flowers.set(row.user_telegram_id, json.loads(row.payload), ttl=remaining)
+    return len(pending_flowers)
+
+
+def pending_flower_stats() -> dict:
+    pending_flowers.purge_expired()
+    return pending_flowers.stats()
+
+
 # ==================== PAYMENT QUERIES ====================
 
 async def create_payment(session: AsyncSession, user_id: int, amount: int, screenshot_id: str) -> Payment:
@@ -285,118 +589,193 @@ async def update_payment_status(session: AsyncSession, payment_id: int, status:
         await session.commit()
 
 
+async def approve_pending_payment(session: AsyncSession, payment_id: int) -> Optional[int]:
+    """Mark a pending payment approved, credit its user and add it to the daily rollup in one
+    transaction. Returns the user's new balance; None if the payment doesn't exist or was already
+    reviewed. Raises LookupError (nothing is changed) if the paying user no longer exists"""
+    result = await session.execute(
+        update(Payment)
+        .where(Payment.id == payment_id, Payment.status == "pending")
+        .values(status="approved")
+        .returning(Payment.user_id, Payment.amount, Payment.created_at)
+    )
+    row = result.one_or_none()
+    if row is None:
+        await session.commit()  # end the (empty) write transaction
+        return None
+    
+    credited = (await session.execute(
+        update(User)
+        .where(User.id == row.user_id)
+        .values(balance=User.balance + row.amount)
+        .returning(User.telegram_id, User.balance)
+    )).one_or_none()
+    if credited is None:
+        await session.rollback()
+        raise LookupError(f"User {row.user_id} of payment {payment_id} not found")
+    
+    day = (row.created_at or datetime.utcnow()).date()
+    stmt = upsert(session, PaymentDailyRollup).values(day=day, amount=row.amount, count=1)
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[PaymentDailyRollup.day],
+            set_={
+                "amount": PaymentDailyRollup.amount + stmt.excluded.amount,
+                "count": PaymentDailyRollup.count + 1,
+            }
+        )
+    )
+    await session.commit()
+    user_cache.pop(credited.telegram_id)
+    return credited.balance
+
+
 # ==================== SETTINGS QUERIES ====================
 
+@dataclass(frozen=True)
+class BotSettings:
+    """Effective bot settings: Settings rows with config.py defaults as fallback"""
+    regular_post_price: int
+    auction_post_price: int
+    card_number: str
+    
+    @classmethod
+    def from_values(cls, values: dict) -> "BotSettings":
+        def as_int(key: str, default: int) -> int:
+            try:
+                return int(values[key])
+            except (KeyError, ValueError):
+                return default
+        
+        return cls(
+            regular_post_price=as_int("regular_post_price", REGULAR_POST_PRICE),
+            auction_post_price=as_int("auction_post_price", AUCTION_POST_PRICE),
+            card_number=values.get("card_number") or CARD_NUMBER,
+        )
+    
+    def post_price(self, is_auction: bool) -> int:
+        return self.auction_post_price if is_auction else self.regular_post_price
+
+
+# key -> value for every Settings row, loaded on first use and written through by set_setting
+_settings_values: Optional[dict] = None
+
+
+async def _load_settings(session: AsyncSession) -> dict:
+    global _settings_values
+    if _settings_values is None:
+        result = await session.execute(select(Settings.key, Settings.value))
+        _settings_values = dict(result.all())
+    return _settings_values
+
+
+async def get_bot_settings(session: AsyncSession) -> BotSettings:
+    return BotSettings.from_values(await _load_settings(session))
+
+
 async def get_setting(session: AsyncSession, key: str) -> Optional[str]:
-    result = await session.execute(
-        select(Settings).where(Settings.key == key)
-    )
-    setting = result.scalar_one_or_none()
-    return setting.value if setting else None
+    return (await _load_settings(session)).get(key)
 
 
 async def set_setting(session: AsyncSession, key: str, value: str):
-    result = await session.execute(
-        select(Settings).where(Settings.key == key)
-    )
-    setting = result.scalar_one_or_none()
-    if setting:
-        setting.value = value
-    else:
-        setting = Settings(key=key, value=value)
-        session.add(setting)
+    stmt = upsert(session, Settings).values(key=key, value=value)
+    await session.execute(
+        stmt.on_conflict_do_update(index_elements=[Settings.key], set_={"value": stmt.excluded.value})
+    )
     await session.commit()
+    (await _load_settings(session))[key] = value
 
 
-# ==================== INCOME STATISTICS ====================
+# ==================== ADMIN STATISTICS ====================
 
-async def get_income_stats(session: AsyncSession) -> dict:
-    """Get approved payments statistics by period"""
-    from datetime import datetime, timedelta
-    from sqlalchemy import func, and_
+FLOWER_STATUSES = ("pending", "published", "expired", "sold", "ended")
+
+
+async def get_admin_stats(session: AsyncSession) -> dict:
+    """Counts and sums for the admin statistics screen in a single round trip"""
+    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
     
-    now = datetime.utcnow()
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    week_start = today_start - timedelta(days=now.weekday())
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    year_start = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    columns = [
+        select(func.count(User.id)).scalar_subquery(),
+        select(func.coalesce(func.sum(User.balance), 0)).scalar_subquery(),
+        select(func.count(Flower.id)).where(
+            Flower.is_auction == True, Flower.status == "published"
+        ).scalar_subquery(),
+        select(func.count(AuctionBid.id)).where(AuctionBid.created_at >= today_start).scalar_subquery(),
+    ]
+    for status in FLOWER_STATUSES:
+        columns.append(select(func.count(Flower.id)).where(Flower.status == status).scalar_subquery())
     
-    # Daily income
-    daily_result = await session.execute(
-        select(func.sum(Payment.amount)).where(
-            and_(
-                Payment.status == "approved",
-                Payment.created_at >= today_start
-            )
-        )
-    )
-    daily_income = daily_result.scalar() or 0
+    row = (await session.execute(select(*columns))).one()
     
-    # Weekly income
-    weekly_result = await session.execute(
-        select(func.sum(Payment.amount)).where(
-            and_(
-                Payment.status == "approved",
-                Payment.created_at >= week_start
-            )
-        )
-    )
-    weekly_income = weekly_result.scalar() or 0
-    
-    # Monthly income
-    monthly_result = await session.execute(
-        select(func.sum(Payment.amount)).where(
-            and_(
-                Payment.status == "approved",
-                Payment.created_at >= month_start
-            )
-        )
-    )
-    monthly_income = monthly_result.scalar() or 0
-    
-    # Yearly income
-    yearly_result = await session.execute(
-        select(func.sum(Payment.amount)).where(
-            and_(
-                Payment.status == "approved",
-                Payment.created_at >= year_start
-            )
-        )
-    )
-    yearly_income = yearly_result.scalar() or 0
+    return {
+        "total_users": row[0],
+        "total_balance": row[1],
+        "active_auctions": row[2],
+        "bids_today": row[3],
+        "flowers_by_status": dict(zip(FLOWER_STATUSES, row[4:])),
+    }
+
+
+async def get_live_gauges(session: AsyncSession) -> dict:
+    """Live auctions, their active participants and payments awaiting review (for /metrics)"""
+    row = (await session.execute(select(
+        select(func.count(Flower.id)).where(
+            Flower.is_auction == True, Flower.status == "published"
+        ).scalar_subquery(),
+        select(func.coalesce(func.sum(Flower.participant_count), 0)).where(
+            Flower.is_auction == True, Flower.status == "published"
+        ).scalar_subquery(),
+        select(func.count(Payment.id)).where(Payment.status == "pending").scalar_subquery(),
+    ))).one()
+    return {"active_auctions": row[0], "auction_participants": row[1], "pending_payments": row[2]}
+
+
+# ==================== INCOME STATISTICS ====================
+
+def payment_rollup_rebuild_statements() -> list:
+    """Statements that recompute payment_daily_rollup from approved payments"""
+    day = func.date(Payment.created_at)
+    return [
+        delete(PaymentDailyRollup),
+        insert(PaymentDailyRollup).from_select(
+            ["day", "amount", "count"],
+            select(day, func.sum(Payment.amount), func.count(Payment.id))
+            .where(Payment.status == "approved")
+            .group_by(day)
+        ),
+    ]
+
+
+async def rebuild_payment_rollup(session: AsyncSession) -> int:
+    """Backfill payment_daily_rollup from the payments table. Returns number of days"""
+    for stmt in payment_rollup_rebuild_statements():
+        await session.execute(stmt)
+    await session.commit()
+    result = await session.execute(select(func.count()).select_from(PaymentDailyRollup))
+    return result.scalar()
+
+
+async def get_income_stats(session: AsyncSession) -> dict:
+    """Get approved payments statistics by period (one query over the daily rollup)"""
+    today = datetime.utcnow().date()
+    periods = {
+        "daily": today,
+        "weekly": today - timedelta(days=today.weekday()),
+        "monthly": today.replace(day=1),
+        "yearly": today.replace(month=1, day=1),
+    }
     
-    # Total income (all time)
-    total_result = await session.execute(
-        select(func.sum(Payment.amount)).where(Payment.status == "approved")
-    )
-    total_income = total_result.scalar() or 0
+    columns = []
+    for start in periods.values():
+        columns.append(func.sum(case((PaymentDailyRollup.day >= start, PaymentDailyRollup.amount), else_=0)))
+        columns.append(func.sum(case((PaymentDailyRollup.day >= start, PaymentDailyRollup.count), else_=0)))
+    columns.append(func.sum(PaymentDailyRollup.amount))
     
-    # Payment counts
-    daily_count = await session.execute(
-        select(func.count(Payment.id)).where(
-            and_(Payment.status == "approved", Payment.created_at >= today_start)
-        )
-    )
-    weekly_count = await session.execute(
-        select(func.count(Payment.id)).where(
-            and_(Payment.status == "approved", Payment.created_at >= week_start)
-        )
-    )
-    monthly_count = await session.execute(
-        select(func.count(Payment.id)).where(
-            and_(Payment.status == "approved", Payment.created_at >= month_start)
-        )
-    )
-    yearly_count = await session.execute(
-        select(func.count(Payment.id)).where(
-            and_(Payment.status == "approved", Payment.created_at >= year_start)
-        )
-    )
+    row = (await session.execute(select(*columns))).one()
     
-    return {
-        "daily": {"amount": daily_income, "count": daily_count.scalar() or 0},
-        "weekly": {"amount": weekly_income, "count": weekly_count.scalar() or 0},
-        "monthly": {"amount": monthly_income, "count": monthly_count.scalar() or 0},
-        "yearly": {"amount": yearly_income, "count": yearly_count.scalar() or 0},
-        "total": total_income
-    }
+    stats = {}
+    for i, name in enumerate(periods):
+        stats[name] = {"amount": row[i * 2] or 0, "count": row[i * 2 + 1] or 0}
+    stats["total"] = row[-1] or 0
+    return stats
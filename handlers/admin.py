@@ -1,18 +1,28 @@
+import asyncio
+import logging
+from datetime import datetime
+
 from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, CallbackQuery, BufferedInputFile
 from aiogram.fsm.context import FSMContext
 
 from database import async_session
 from database.queries import (
     get_or_create_user, get_user, update_user_balance, set_user_balance,
-    get_payment, update_payment_status, get_pending_payments,
-    get_setting, set_setting, get_all_users, get_income_stats
+    get_payment, update_payment_status, approve_pending_payment, get_pending_payments,
+    get_bot_settings, set_setting, get_all_users, get_admin_stats, get_income_stats,
+    pop_pending_flower
 )
 from keyboards import (
     admin_panel_kb, admin_menu_kb, main_menu_kb, cancel_kb, back_kb
 )
 from states import AdminStates
-from config import ADMIN_IDS, REGULAR_POST_PRICE, AUCTION_POST_PRICE
+from config import ADMIN_IDS, PROFILE_MAX_SECONDS
+from utils.broadcaster import broadcaster
+from utils.profiler import profiler
+
+logger = logging.getLogger(__name__)
 
 router = Router()
 
@@ -26,6 +36,17 @@ def format_price(amount: int) -> str:
     return f"{amount:,}".replace(",", " ")
 
 
+def admin_panel_text(settings) -> str:
+    return (
+        f"⚙️ <b>Admin panel</b>\n\n"
+        f"📊 Joriy sozlamalar:\n"
+        f"• 💳 Karta: {settings.card_number}\n"
+        f"• 🛒 Oddiy e'lon: {format_price(settings.regular_post_price)} som\n"
+        f"• 🔨 Auksiyon: {format_price(settings.auction_post_price)} som\n\n"
+        f"Quyidagi amallardan birini tanlang:"
+    )
+
+
 # ==================== ADMIN PANEL ====================
 
 @router.message(F.text == "⚙️ Admin panel")
@@ -35,21 +56,10 @@ async def admin_panel(message: Message):
         return
     
     async with async_session() as session:
-        regular_price = await get_setting(session, "regular_post_price")
-        regular_price = int(regular_price) if regular_price else REGULAR_POST_PRICE
-        
-        auction_price = await get_setting(session, "auction_post_price")
-        auction_price = int(auction_price) if auction_price else AUCTION_POST_PRICE
-        
-        card_number = await get_setting(session, "card_number") or "Belgilanmagan"
+        settings = await get_bot_settings(session)
     
     await message.answer(
-        f"⚙️ <b>Admin panel</b>\n\n"
-        f"📊 Joriy sozlamalar:\n"
-        f"• 💳 Karta: {card_number}\n"
-        f"• 🛒 Oddiy e'lon: {format_price(regular_price)} som\n"
-        f"• 🔨 Auksiyon: {format_price(auction_price)} som\n\n"
-        f"Quyidagi amallardan birini tanlang:",
+        admin_panel_text(settings),
         parse_mode="HTML",
         reply_markup=admin_panel_kb()
     )
@@ -222,14 +232,18 @@ async def admin_balance_amount_received(message: Message, state: FSMContext, bot
         target_user_id = data['target_user_id']
         
         async with async_session() as session:
-            await update_user_balance(session, target_user_id, amount)
-            user = await get_user(session, target_user_id)
+            new_balance = await update_user_balance(session, target_user_id, amount)
+        
+        if new_balance is None:
+            await message.answer("❌ Bunday foydalanuvchi topilmadi!", reply_markup=admin_menu_kb())
+            await state.clear()
+            return
         
         await message.answer(
             f"✅ Balans qoshildi!\n\n"
             f"👤 Foydalanuvchi ID: {target_user_id}\n"
             f"💰 Qoshilgan: {format_price(amount)} som\n"
-            f"💰 Yangi balans: {format_price(user.balance)} som",
+            f"💰 Yangi balans: {format_price(new_balance)} som",
             reply_markup=admin_menu_kb()
         )
         
@@ -238,7 +252,7 @@ async def admin_balance_amount_received(message: Message, state: FSMContext, bot
             await bot.send_message(
                 chat_id=target_user_id,
                 text=f"🎉 Sizga {format_price(amount)} som qoshildi!\n\n"
-                     f"💰 Yangi balans: {format_price(user.balance)} som"
+                     f"💰 Yangi balans: {format_price(new_balance)} som"
             )
         except Exception:
             pass
@@ -257,14 +271,22 @@ async def admin_stats(callback: CallbackQuery):
         return
     
     async with async_session() as session:
-        users = await get_all_users(session)
-        total_users = len(users)
-        total_balance = sum(u.balance for u in users)
+        stats = await get_admin_stats(session)
+    
+    by_status = stats["flowers_by_status"]
     
     await callback.message.edit_text(
         f"📊 <b>Statistika</b>\n\n"
-        f"👥 Jami foydalanuvchilar: {total_users}\n"
-        f"💰 Jami balans: {format_price(total_balance)} som",
+        f"👥 Jami foydalanuvchilar: {stats['total_users']}\n"
+        f"💰 Jami balans: {format_price(stats['total_balance'])} som\n\n"
+        f"🌸 <b>E'lonlar:</b>\n"
+        f"   ⏳ Kutilmoqda: {by_status['pending']}\n"
+        f"   ✅ Nashr qilingan: {by_status['published']}\n"
+        f"   ⏰ Vaqti tugagan: {by_status['expired']}\n"
+        f"   💰 Sotilgan: {by_status['sold']}\n"
+        f"   🏁 Tugagan: {by_status['ended']}\n\n"
+        f"🔨 Faol auksiyonlar: {stats['active_auctions']}\n"
+        f"📊 Bugungi stavkalar: {stats['bids_today']}",
         parse_mode="HTML",
         reply_markup=back_kb()
     )
@@ -278,21 +300,10 @@ async def back_to_admin_panel(callback: CallbackQuery):
         return
     
     async with async_session() as session:
-        regular_price = await get_setting(session, "regular_post_price")
-        regular_price = int(regular_price) if regular_price else REGULAR_POST_PRICE
-        
-        auction_price = await get_setting(session, "auction_post_price")
-        auction_price = int(auction_price) if auction_price else AUCTION_POST_PRICE
-        
-        card_number = await get_setting(session, "card_number") or "Belgilanmagan"
+        settings = await get_bot_settings(session)
     
     await callback.message.edit_text(
-        f"⚙️ <b>Admin panel</b>\n\n"
-        f"📊 Joriy sozlamalar:\n"
-        f"• 💳 Karta: {card_number}\n"
-        f"• 🛒 Oddiy e'lon: {format_price(regular_price)} som\n"
-        f"• 🔨 Auksiyon: {format_price(auction_price)} som\n\n"
-        f"Quyidagi amallardan birini tanlang:",
+        admin_panel_text(settings),
         parse_mode="HTML",
         reply_markup=admin_panel_kb()
     )
@@ -366,24 +377,19 @@ async def admin_broadcast_message_received(message: Message, state: FSMContext,
     async with async_session() as session:
         users = await get_all_users(session)
     
-    success_count = 0
-    fail_count = 0
-    
-    for user in users:
-        try:
-            await bot.send_message(
-                chat_id=user.telegram_id,
-                text=f"📢 <b>Xabar:</b>\n\n{broadcast_text}",
-                parse_mode="HTML"
-            )
-            success_count += 1
-        except Exception:
-            fail_count += 1
+    result = await broadcaster.broadcast(
+        bot,
+        [user.telegram_id for user in users],
+        f"📢 <b>Xabar:</b>\n\n{broadcast_text}",
+        name="admin",
+        bulk=True,  # auction notifications go first
+        parse_mode="HTML"
+    )
     
     await message.answer(
         f"✅ Xabar yuborildi!\n\n"
-        f"✅ Muvaffaqiyatli: {success_count}\n"
-        f"❌ Xato: {fail_count}",
+        f"✅ Muvaffaqiyatli: {result.delivered}\n"
+        f"❌ Xato: {result.failed}",
         reply_markup=admin_menu_kb()
     )
     await state.clear()
@@ -436,13 +442,15 @@ async def approve_payment(callback: CallbackQuery, bot: Bot):
             await callback.answer("❌ Bu tolov allaqachon korib chiqilgan!", show_alert=True)
             return
         
-        # Update payment status
-        await update_payment_status(session, payment_id, "approved")
-        
-        # Add balance to user
-        await update_user_balance(session, user_telegram_id, payment.amount)
-        
-        user = await get_user(session, user_telegram_id)
+        # Approve and credit in one transaction (conditional - another admin may have just approved it)
+        try:
+            new_balance = await approve_pending_payment(session, payment_id)
+        except LookupError:
+            await callback.answer("⚠️ Foydalanuvchi topilmadi - tolov tasdiqlanmadi!", show_alert=True)
+            return
+        if new_balance is None:
+            await callback.answer("❌ Bu tolov allaqachon korib chiqilgan!", show_alert=True)
+            return
     
     # Edit admin message
     await callback.message.edit_caption(
@@ -457,7 +465,7 @@ async def approve_payment(callback: CallbackQuery, bot: Bot):
             chat_id=user_telegram_id,
             text=f"✅ Tolovingiz tasdiqlandi!\n\n"
                  f"💰 Qoshilgan: {format_price(payment.amount)} som\n"
-                 f"💰 Yangi balans: {format_price(user.balance)} som"
+                 f"💰 Yangi balans: {format_price(new_balance)} som"
         )
     except Exception:
         pass
@@ -531,13 +539,15 @@ async def approve_flower_payment(callback: CallbackQuery, bot: Bot):
             await callback.answer("❌ Bu tolov allaqachon korib chiqilgan!", show_alert=True)
             return
         
-        # Update payment status
-        await update_payment_status(session, payment_id, "approved")
-        
-        # Add balance to user
-        await update_user_balance(session, user_telegram_id, payment.amount)
-        
-        user = await get_user(session, user_telegram_id)
+        # Approve and credit in one transaction (conditional - another admin may have just approved it)
+        try:
+            new_balance = await approve_pending_payment(session, payment_id)
+        except LookupError:
+            await callback.answer("⚠️ Foydalanuvchi topilmadi - tolov tasdiqlanmadi!", show_alert=True)
+            return
+        if new_balance is None:
+            await callback.answer("❌ Bu tolov allaqachon korib chiqilgan!", show_alert=True)
+            return
     
     # Edit admin message
     await callback.message.edit_caption(
@@ -557,14 +567,14 @@ async def approve_flower_payment(callback: CallbackQuery, bot: Bot):
             # Create a dummy state context
             class DummyState:
                 async def get_data(self):
-                    return pending_flowers.get(user_telegram_id, {}).get('data', {})
+                    return (pending_flowers.get(user_telegram_id) or {}).get('data', {})
                 async def clear(self):
                     pass
                 async def update_data(self, **kwargs):
                     pass
             
             dummy_state = DummyState()
-            flower_data = pending_flowers.get(user_telegram_id, {})
+            flower_data = pending_flowers.get(user_telegram_id) or {}
             
             await publish_flower_final(
                 message=None,
@@ -583,7 +593,7 @@ async def approve_flower_payment(callback: CallbackQuery, bot: Bot):
                     chat_id=user_telegram_id,
                     text=f"✅ Tolovingiz tasdiqlandi!\n\n"
                          f"💰 Qoshilgan: {format_price(payment.amount)} som\n"
-                         f"💰 Yangi balans: {format_price(user.balance)} som\n\n"
+                         f"💰 Yangi balans: {format_price(new_balance)} som\n\n"
                          f"⚠️ E'lonni joylashda xatolik: {str(e)}\n"
                          f"Iltimos, qaytadan urinib ko'ring."
                 )
@@ -596,7 +606,7 @@ async def approve_flower_payment(callback: CallbackQuery, bot: Bot):
                 chat_id=user_telegram_id,
                 text=f"✅ Tolovingiz tasdiqlandi!\n\n"
                      f"💰 Qoshilgan: {format_price(payment.amount)} som\n"
-                     f"💰 Yangi balans: {format_price(user.balance)} som"
+                     f"💰 Yangi balans: {format_price(new_balance)} som"
             )
         except: pass
         await callback.answer("✅ Tolov tasdiqlandi!")
@@ -625,11 +635,9 @@ async def reject_flower_payment(callback: CallbackQuery, bot: Bot):
         
         # Update payment status
         await update_payment_status(session, payment_id, "rejected")
-    
-    # Remove pending flower data
-    from handlers.user import pending_flowers
-    if user_telegram_id in pending_flowers:
-        del pending_flowers[user_telegram_id]
+        
+        # Remove pending flower data
+        await pop_pending_flower(session, user_telegram_id)
     
     # Edit admin message
     await callback.message.edit_caption(
@@ -648,3 +656,60 @@ async def reject_flower_payment(callback: CallbackQuery, bot: Bot):
     except: pass
     
     await callback.answer("❌ Tolov rad etildi!")
+
+
+# ==================== PROFILER ====================
+
+# Running captures (referenced so they are not garbage collected)
+profile_tasks = set()
+
+
+async def send_profile(bot: Bot, chat_id: int, seconds: int):
+    try:
+        profile = await profiler.capture(seconds)
+    except RuntimeError:
+        await bot.send_message(chat_id, "❌ Profil allaqachon olinmoqda, tugashini kuting.")
+        return
+    
+    try:
+        # Frame names like <locals>.<genexpr> are not valid HTML: send the caption as plain text
+        await bot.send_document(
+            chat_id,
+            BufferedInputFile(
+                profile.collapsed().encode(),
+                filename=f"profile-{datetime.now():%Y%m%d-%H%M%S}.collapsed.txt"
+            ),
+            caption=f"⏱ Profil tayyor\n\n{profile.summary()}"[:1024],
+            parse_mode=None
+        )
+    except Exception as e:
+        logger.exception("Sending the profile to %s failed", chat_id)
+        try:
+            await bot.send_message(chat_id, f"❌ Profilni yuborib bo'lmadi: {type(e).__name__}", parse_mode=None)
+        except Exception:
+            pass
+
+
+@router.message(Command("profile"))
+async def admin_profile(message: Message, command: CommandObject, bot: Bot):
+    """/profile [seconds]: sample the running bot and send back a collapsed-stack file"""
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ Sizda ruxsat yoq!")
+        return
+    
+    args = (command.args or "30").strip()
+    if not args.isdigit() or not 1 <= int(args) <= PROFILE_MAX_SECONDS:
+        await message.answer(f"❌ Foydalanish: /profile <soniya> (1-{PROFILE_MAX_SECONDS})")
+        return
+    
+    if profiler.running:
+        await message.answer("❌ Profil allaqachon olinmoqda, tugashini kuting.")
+        return
+    
+    seconds = int(args)
+    await message.answer(f"⏱ Profil olinmoqda: {seconds} soniya...")
+    
+    # Captured in the background: this admin's next updates are not held up meanwhile
+    task = asyncio.create_task(send_profile(bot, message.chat.id, seconds))
+    profile_tasks.add(task)
+    task.add_done_callback(profile_tasks.discard)
@@ -1,4 +1,5 @@
 from aiogram import Router, F, Bot
+from aiogram.filters import Filter
 from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
 from datetime import datetime
@@ -7,14 +8,34 @@ from database import async_session
 from database.queries import (
     get_or_create_user, get_user, get_flower, update_flower_bid,
     add_auction_participant, get_auction_participants, remove_auction_participant,
-    get_user_active_auction, add_auction_bid, get_auction_bids, update_flower_status
+    get_bid, get_bid_rank, update_flower_status,
+    active_auction_index
 )
-from database.models import User, AuctionBid, Flower
+from database.models import User, Flower
 from sqlalchemy import select
 from keyboards import cancel_kb, main_menu_kb, admin_menu_kb, auction_participant_kb, flower_channel_kb, auction_sell_kb
 from config import CHANNEL_ID, ADMIN_IDS
+from utils.auction_engine import auction_engine, EXPIRED, OWNER, TOO_LOW
+from utils.caption_refresher import caption_refresher
+from utils.broadcaster import broadcaster
+from utils.scheduler import auction_deadlines
+from utils import tracing
+
+
+class InActiveAuction(Filter):
+    """Passes only users active in a live auction (in-memory index, no DB);
+    injects the auction as `auction_flower_id`"""
+    
+    async def __call__(self, message: Message):
+        if not message.from_user:
+            return False
+        flower_id = active_auction_index.get(message.from_user.id)
+        return {"auction_flower_id": flower_id} if flower_id else False
+
 
 router = Router()
+# Message handlers here are bids / auction guidance: everyone else is skipped before any DB work
+router.message.filter(InActiveAuction())
 
 
 def format_price(amount: int) -> str:
@@ -26,162 +47,146 @@ def get_menu_kb(user_id: int, user=None):
     return admin_menu_kb() if is_admin else main_menu_kb()
 
 
-async def update_channel_auction_message(bot: Bot, flower, session):
-    """Update the channel message with current bid info"""
-    try:
-        participants = await get_auction_participants(session, flower.id)
-        
-        remaining = ""
-        if flower.auction_end_time:
-            delta = flower.auction_end_time - datetime.utcnow()
-            if delta.total_seconds() > 0:
-                hours, remainder = divmod(int(delta.total_seconds()), 3600)
-                minutes, _ = divmod(remainder, 60)
-                remaining = f"⏰ Qolgan vaqt: {hours} soat {minutes} daqiqa\n"
-        
-        channel_text = (
-            f"🔨 AUKSIYON\n\n"
-            f"🌸 <b>{flower.name}</b>\n\n"
-            f"📝 {flower.description}\n\n"
-            f"💰 Boshlangich narx: {format_price(flower.price)} som\n"
-            f"📍 Manzil: {flower.location}\n\n"
-            f"{remaining}"
-            f"🔨 <b>Joriy narx: {format_price(flower.current_bid)} som</b>\n"
-            f"📊 <b>Stavkalar soni: {flower.bid_count}</b>\n"
-            f"👥 Ishtirokchilar: {len(participants)}"
-        )
-        
-        bot_info = await bot.get_me()
+def auction_channel_caption(flower) -> str:
+    """Caption of a live auction post in the channel"""
+    remaining = ""
+    if flower.auction_end_time:
+        delta = flower.auction_end_time - datetime.utcnow()
+        if delta.total_seconds() > 0:
+            hours, remainder = divmod(int(delta.total_seconds()), 3600)
+            minutes, _ = divmod(remainder, 60)
+            remaining = f"⏰ Qolgan vaqt: {hours} soat {minutes} daqiqa\n"
+    
+    return (
+        f"🔨 AUKSIYON\n\n"
+        f"🌸 <b>{flower.name}</b>\n\n"
+        f"📝 {flower.description}\n\n"
+        f"💰 Boshlangich narx: {format_price(flower.price)} som\n"
+        f"📍 Manzil: {flower.location}\n\n"
+        f"{remaining}"
+        f"🔨 <b>Joriy narx: {format_price(flower.current_bid)} som</b>\n"
+        f"📊 <b>Stavkalar soni: {flower.bid_count}</b>\n"
+        f"👥 Ishtirokchilar: {flower.participant_count}"
+    )
+
+
+async def update_channel_auction_message(bot: Bot, flower, session=None):
+    """Queue a refresh of the channel message with current bid info (coalesced and rate-limited)"""
+    if flower is None or flower.status != "published":
+        return  # sold or ended: the post already has its final caption
+    flower_id, seller_username = flower.id, flower.seller_username
+    
+    async def send(caption: str):
+        bot_info = await bot.me()
         await bot.edit_message_caption(
             chat_id=CHANNEL_ID,
             message_id=flower.message_id,
-            caption=channel_text,
+            caption=caption,
             parse_mode="HTML",
-            reply_markup=flower_channel_kb(flower.id, True, flower.seller_username, bot_info.username)
+            reply_markup=flower_channel_kb(flower_id, True, seller_username, bot_info.username)
         )
-    except Exception as e:
-        print(f"Error updating channel message: {e}")
+    
+    caption_refresher.schedule(flower.message_id, auction_channel_caption(flower), send, version=flower.bid_count or 0)
 
 
 @router.message(F.text.regexp(r'^\d[\d\s,]*$'))
-async def process_auction_bid(message: Message, bot: Bot):
+async def process_auction_bid(message: Message, bot: Bot, auction_flower_id: int):
     """Process bid from auction participant (only numbers)"""
-    async with async_session() as session:
-        # Check if user is in any active auction
-        participant = await get_user_active_auction(session, message.from_user.id)
-        
-        if not participant:
-            return  # Not in any auction, ignore
-        
-        flower = await get_flower(session, participant.flower_id)
-        
-        if not flower or flower.status != "published":
-            await message.answer("❌ Bu auksiyon tugagan!", reply_markup=get_menu_kb(message.from_user.id))
-            return
-        
-        # Check if auction time has ended
-        if flower.auction_end_time and datetime.utcnow() > flower.auction_end_time:
-            await message.answer("❌ Auksiyon vaqti tugagan!", reply_markup=get_menu_kb(message.from_user.id))
-            return
-        
-        # Get owner
-        result = await session.execute(select(User).where(User.id == flower.user_id))
-        owner = result.scalar_one_or_none()
-        
-        is_owner = owner and owner.telegram_id == message.from_user.id
-        
-        # Owner can't bid
-        if is_owner:
-            await message.answer("❌ Siz bu auksiyonning egasisiz, stavka qoya olmaysiz!")
-            return
-        
-        # Parse bid amount
-        try:
-            bid = int(message.text.replace(" ", "").replace(",", ""))
-        except ValueError:
-            return
-        
-        current_bid = flower.current_bid or flower.price
-        
-        # Check bid is higher than current
-        if bid <= current_bid:
-            await message.answer(
-                f"❌ Stavka joriy narxdan ({format_price(current_bid)} som) yuqori bolishi kerak!"
-            )
-            return
-        
-        # Save bid
-        auction_bid = await add_auction_bid(
-            session, 
-            flower.id, 
+    # Parse bid amount
+    try:
+        bid = int(message.text.replace(" ", "").replace(",", ""))
+    except ValueError:
+        return
+    
+    tracing.set_attributes(flower_id=auction_flower_id, bid=bid)
+    
+    # Validated and applied by the auction's actor, persisted in the next batch
+    with tracing.span("auction.submit_bid", flower_id=auction_flower_id):
+        result = await auction_engine.submit_bid(
+            auction_flower_id,
             message.from_user.id,
             message.from_user.username,
             message.from_user.full_name,
             bid
         )
+    tracing.set_attributes(accepted=result.accepted, reason=result.reason or "")
+    
+    if not result.accepted:
+        if result.reason == EXPIRED:
+            await message.answer("❌ Auksiyon vaqti tugagan!", reply_markup=get_menu_kb(message.from_user.id))
+        elif result.reason == OWNER:
+            await message.answer("❌ Siz bu auksiyonning egasisiz, stavka qoya olmaysiz!")
+        elif result.reason == TOO_LOW:
+            await message.answer(
+                f"❌ Stavka joriy narxdan ({format_price(result.current_bid)} som) yuqori bolishi kerak!"
+            )
+        else:
+            await message.answer("❌ Bu auksiyon tugagan!", reply_markup=get_menu_kb(message.from_user.id))
+        return
+    
+    # Confirm to bidder
+    await message.answer(
+        f"✅ Stavkangiz qabul qilindi: {format_price(bid)} som\n\n"
+        f"📊 Siz {result.bid_count}-chi stavka qo'ydingiz"
+    )
+    
+    try:
+        with tracing.span("auction.commit_wait", flower_id=auction_flower_id):
+            bid_id = await result.bid_id
+    except Exception:
+        await message.answer("❌ Stavkani saqlashda xatolik yuz berdi, qaytadan urinib ko'ring.")
+        return
+    
+    owner_telegram_id = result.owner_telegram_id
+    
+    # Short sessions only: the connection must not be held while the actor commits
+    async with async_session() as session:
+        flower = await get_flower(session, auction_flower_id)
         
-        # Update flower current bid and bid count
-        flower.current_bid = bid
-        flower.highest_bidder_id = message.from_user.id
-        flower.bid_count = (flower.bid_count or 0) + 1
-        await session.commit()
-        
-        # Confirm to bidder
-        await message.answer(
-            f"✅ Stavkangiz qabul qilindi: {format_price(bid)} som\n\n"
-            f"📊 Siz {flower.bid_count}-chi stavka qo'ydingiz"
-        )
-        
-        # Refresh flower
-        flower = await get_flower(session, flower.id)
+        # Queue the channel caption refresh (sent in the background)
+        await update_channel_auction_message(bot, flower, session)
         
         user_name = message.from_user.full_name or message.from_user.username or "Nomalum"
         user_link = f"@{message.from_user.username}" if message.from_user.username else user_name
         
         # Notify owner with SELL button
-        if owner:
+        if owner_telegram_id:
             try:
                 await bot.send_message(
-                    chat_id=owner.telegram_id,
+                    chat_id=owner_telegram_id,
                     text=(
                         f"💰 <b>Yangi stavka!</b>\n\n"
                         f"🌸 Auksiyon: {flower.name}\n"
                         f"👤 Ishtirokchi: {user_name}\n"
                         f"📱 Telegram: {user_link}\n"
                         f"💵 Stavka: {format_price(bid)} som\n"
-                        f"📊 Stavkalar soni: {flower.bid_count}\n\n"
+                        f"📊 Stavkalar soni: {result.bid_count}\n\n"
                         f"Shu narxga sotmoqchimisiz?"
                     ),
                     parse_mode="HTML",
-                    reply_markup=auction_sell_kb(flower.id, auction_bid.id, message.from_user.id)
+                    reply_markup=auction_sell_kb(flower.id, bid_id, message.from_user.id)
                 )
             except Exception:
                 pass
         
-        # Broadcast to other participants
+        # Broadcast to other participants (owner already notified with sell button)
         participants = await get_auction_participants(session, flower.id)
-        for p in participants:
-            if p.user_telegram_id == message.from_user.id:
-                continue
-            if owner and p.user_telegram_id == owner.telegram_id:
-                continue  # Owner already notified with sell button
-            try:
-                await bot.send_message(
-                    chat_id=p.user_telegram_id,
-                    text=(
-                        f"💰 <b>Yangi stavka!</b>\n\n"
-                        f"🌸 {flower.name}\n"
-                        f"👤 {user_name}: {format_price(bid)} som\n"
-                        f"📊 Stavkalar soni: {flower.bid_count}\n\n"
-                        f"🔨 Joriy narx: {format_price(flower.current_bid)} som"
-                    ),
-                    parse_mode="HTML"
-                )
-            except Exception:
-                pass
-        
-        # Update channel message
-        await update_channel_auction_message(bot, flower, session)
+        tracing.set_attributes(participants=len(participants))
+        broadcaster.broadcast(
+            bot,
+            [p.user_telegram_id for p in participants
+             if p.user_telegram_id not in (message.from_user.id, owner_telegram_id)],
+            (
+                f"💰 <b>Yangi stavka!</b>\n\n"
+                f"🌸 {flower.name}\n"
+                f"👤 {user_name}: {format_price(bid)} som\n"
+                f"📊 Stavkalar soni: {result.bid_count}\n\n"
+                f"🔨 Joriy narx: {format_price(result.current_bid)} som"
+            ),
+            name=f"bid:{flower.id}",
+            parse_mode="HTML"
+        )
+
 
 
 @router.callback_query(F.data.startswith("sell_"))
@@ -207,13 +212,13 @@ async def sell_to_bidder(callback: CallbackQuery, bot: Bot):
             await callback.answer("❌ Siz bu auksiyonning egasi emassiz!", show_alert=True)
             return
         
-        if flower.status != "published":
+        # "expired": time is up and the seller is choosing a bid
+        if flower.status not in ("published", "expired"):
             await callback.answer("❌ Bu auksiyon allaqachon tugagan!", show_alert=True)
             return
         
         # Get the bid
-        result = await session.execute(select(AuctionBid).where(AuctionBid.id == bid_id))
-        bid = result.scalar_one_or_none()
+        bid = await get_bid(session, bid_id)
         
         if not bid:
             await callback.answer("❌ Stavka topilmadi!", show_alert=True)
@@ -225,14 +230,13 @@ async def sell_to_bidder(callback: CallbackQuery, bot: Bot):
         
         # Update flower status
         await update_flower_status(session, flower_id, "sold")
+        auction_deadlines.cancel(flower_id)
+        # Wait for the bids already accepted to be committed, then use the final counts
+        await auction_engine.close_auction(flower_id)
+        await session.refresh(flower)
         
-        # Get all bids to find position
-        all_bids = await get_auction_bids(session, flower_id)
-        position = 1
-        for i, b in enumerate(all_bids, 1):
-            if b.id == bid_id:
-                position = i
-                break
+        # Position of the accepted bid among all bids
+        position = await get_bid_rank(session, bid)
         
         # Notify winner
         try:
@@ -253,21 +257,18 @@ async def sell_to_bidder(callback: CallbackQuery, bot: Bot):
         
         # Notify all participants
         participants = await get_auction_participants(session, flower_id)
-        for p in participants:
-            if p.user_telegram_id in [bidder_telegram_id, callback.from_user.id]:
-                continue
-            try:
-                await bot.send_message(
-                    chat_id=p.user_telegram_id,
-                    text=(
-                        f"🏁 <b>AUKSIYON TUGADI!</b>\n\n"
-                        f"🌸 {flower.name}\n"
-                        f"💰 Yakuniy narx: {format_price(bid.amount)} som"
-                    ),
-                    parse_mode="HTML"
-                )
-            except Exception:
-                pass
+        broadcaster.broadcast(
+            bot,
+            [p.user_telegram_id for p in participants
+             if p.user_telegram_id not in (bidder_telegram_id, callback.from_user.id)],
+            (
+                f"🏁 <b>AUKSIYON TUGADI!</b>\n\n"
+                f"🌸 {flower.name}\n"
+                f"💰 Yakuniy narx: {format_price(bid.amount)} som"
+            ),
+            name=f"sold:{flower.id}",
+            parse_mode="HTML"
+        )
         
         # Update channel - reply to original message (WITHOUT buyer info)
         try:
@@ -287,6 +288,7 @@ async def sell_to_bidder(callback: CallbackQuery, bot: Bot):
             )
             
             # Also update original message caption (WITHOUT buyer info)
+            await caption_refresher.cancel(flower.message_id)
             channel_text = (
                 f"🏁 AUKSIYON TUGADI - SOTILDI\n\n"
                 f"🌸 <b>{flower.name}</b>\n\n"
@@ -310,7 +312,8 @@ async def sell_to_bidder(callback: CallbackQuery, bot: Bot):
             f"✅ Sotildi!\n\n"
             f"🌸 {flower.name}\n"
             f"👤 Xaridor: {winner_name} ({winner_link})\n"
-            f"💰 Narx: {format_price(bid.amount)} som",
+            f"💰 Narx: {format_price(bid.amount)} som\n"
+            f"🏅 Stavka o'rni: {position}",
             reply_markup=None
         )
         
@@ -333,18 +336,16 @@ async def leave_auction(callback: CallbackQuery, bot: Bot):
         await remove_auction_participant(session, flower_id, callback.from_user.id)
         
         participants = await get_auction_participants(session, flower_id)
+        remaining_count = flower.participant_count
         
         # Notify others
         user_name = callback.from_user.full_name or callback.from_user.username or "Nomalum"
-        for p in participants:
-            if p.user_telegram_id != callback.from_user.id:
-                try:
-                    await bot.send_message(
-                        chat_id=p.user_telegram_id,
-                        text=f"🚪 {user_name} auksiyondan chiqdi.\n👥 Qolgan ishtirokchilar: {len(participants)}"
-                    )
-                except Exception:
-                    pass
+        broadcaster.broadcast(
+            bot,
+            [p.user_telegram_id for p in participants if p.user_telegram_id != callback.from_user.id],
+            f"🚪 {user_name} auksiyondan chiqdi.\n👥 Qolgan ishtirokchilar: {remaining_count}",
+            name=f"leave:{flower_id}"
+        )
         
         user = await get_user(session, callback.from_user.id)
     
@@ -378,27 +379,28 @@ async def end_auction(callback: CallbackQuery, bot: Bot):
         
         # Update flower status
         await update_flower_status(session, flower_id, "ended")
+        auction_deadlines.cancel(flower_id)
+        # Wait for the bids already accepted to be committed, then use the final price
+        await auction_engine.close_auction(flower_id)
+        await session.refresh(flower)
         
         # Notify all participants
         participants = await get_auction_participants(session, flower_id)
-        for p in participants:
-            if p.user_telegram_id == callback.from_user.id:
-                continue
-            try:
-                await bot.send_message(
-                    chat_id=p.user_telegram_id,
-                    text=(
-                        f"🏁 <b>AUKSIYON TUGADI!</b>\n\n"
-                        f"🌸 {flower.name}\n\n"
-                        f"Sotuvchi auksiyonni yopdi."
-                    ),
-                    parse_mode="HTML"
-                )
-            except Exception:
-                pass
+        broadcaster.broadcast(
+            bot,
+            [p.user_telegram_id for p in participants if p.user_telegram_id != callback.from_user.id],
+            (
+                f"🏁 <b>AUKSIYON TUGADI!</b>\n\n"
+                f"🌸 {flower.name}\n\n"
+                f"Sotuvchi auksiyonni yopdi."
+            ),
+            name=f"closed:{flower.id}",
+            parse_mode="HTML"
+        )
         
         # Update channel message
         try:
+            await caption_refresher.cancel(flower.message_id)
             channel_text = (
                 f"🏁 AUKSIYON YOPILDI\n\n"
                 f"🌸 <b>{flower.name}</b>\n\n"
@@ -430,19 +432,15 @@ async def end_auction(callback: CallbackQuery, bot: Bot):
 
 # Handle text messages in auction (chat functionality removed - only bids allowed)
 @router.message(F.text)
-async def check_auction_message(message: Message):
-    """Check if user in auction and guide them"""
+async def check_auction_message(message: Message, auction_flower_id: int):
+    """Guide an auction participant who sent a non-numeric message"""
     async with async_session() as session:
-        participant = await get_user_active_auction(session, message.from_user.id)
-        
-        if participant:
-            # User is in auction but sent non-numeric message
-            flower = await get_flower(session, participant.flower_id)
-            if flower and flower.status == "published":
-                current_bid = flower.current_bid or flower.price
-                await message.answer(
-                    f"❌ Faqat narx kiriting!\n\n"
-                    f"🔨 Joriy narx: {format_price(current_bid)} som\n"
-                    f"📊 Stavkalar soni: {flower.bid_count}\n\n"
-                    f"💡 Joriy narxdan yuqori narx kiriting"
-                )
+        flower = await get_flower(session, auction_flower_id)
+        if flower and flower.status == "published":
+            current_bid = flower.current_bid or flower.price
+            await message.answer(
+                f"❌ Faqat narx kiriting!\n\n"
+                f"🔨 Joriy narx: {format_price(current_bid)} som\n"
+                f"📊 Stavkalar soni: {flower.bid_count}\n\n"
+                f"💡 Joriy narxdan yuqori narx kiriting"
+            )
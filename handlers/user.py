@@ -9,9 +9,10 @@ import asyncio
 
 from database import async_session
 from database.queries import (
-    get_or_create_user, get_user, update_user_balance,
+    get_or_create_user, get_user, update_user_balance, debit_user_balance,
     create_flower, get_flower, update_flower_status, get_user_flowers,
-    get_setting, add_auction_participant, get_auction_participants
+    get_bot_settings, add_auction_participant, get_auction_participants,
+    pending_flowers, save_pending_flower, pop_pending_flower, hold_pending_flower
 )
 from keyboards import (
     main_menu_kb, admin_menu_kb, cancel_kb, flower_type_first_kb,
@@ -19,16 +20,15 @@ from keyboards import (
     auction_participant_kb, phone_share_kb, regions_kb
 )
 from states import FlowerStates, PaymentStates
-from config import ADMIN_IDS, CHANNEL_ID, REGULAR_POST_PRICE, AUCTION_POST_PRICE, CARD_NUMBER
+from config import ADMIN_IDS, CHANNEL_ID
+from utils.broadcaster import broadcaster
+from utils.scheduler import auction_deadlines
 
 router = Router()
 
-# Store for collecting media groups
+# Store for collecting media groups (entries remove themselves when the task finishes)
 media_collection_tasks = {}
 
-# Store for pending flower data (user_id -> flower_data)
-pending_flowers = {}
-
 
 def format_price(amount: int) -> str:
     """Format price with thousands separator"""
@@ -105,11 +105,7 @@ async def cmd_start(message: Message, state: FSMContext, bot: Bot):
             message.from_user.full_name
         )
         
-        regular_price = await get_setting(session, "regular_post_price")
-        regular_price = int(regular_price) if regular_price else REGULAR_POST_PRICE
-        
-        auction_price = await get_setting(session, "auction_post_price")
-        auction_price = int(auction_price) if auction_price else AUCTION_POST_PRICE
+        settings = await get_bot_settings(session)
         
         # Show bonus message for new users
         bonus_text = ""
@@ -122,8 +118,8 @@ async def cmd_start(message: Message, state: FSMContext, bot: Bot):
             f"💰 Sizning balansingiz: {format_price(user.balance)} som\n\n"
             f"📌 Bu bot orqali gullaringizni sotishingiz yoki auksionga qoyishingiz mumkin.\n\n"
             f"💰 Narxlar:\n"
-            f"• Oddiy e'lon: {format_price(regular_price)} som\n"
-            f"• Auksiyon e'loni: {format_price(auction_price)} som{bonus_text}",
+            f"• Oddiy e'lon: {format_price(settings.regular_post_price)} som\n"
+            f"• Auksiyon e'loni: {format_price(settings.auction_post_price)} som{bonus_text}",
             parse_mode="HTML",
             reply_markup=get_menu_kb(message.from_user.id, user)
         )
@@ -162,8 +158,6 @@ async def join_auction(message: Message, flower_id: int, bot: Bot):
             message.from_user.username, message.from_user.full_name
         )
         
-        participants = await get_auction_participants(session, flower_id)
-        
         remaining = ""
         if flower.auction_end_time:
             delta = flower.auction_end_time - datetime.utcnow()
@@ -172,13 +166,13 @@ async def join_auction(message: Message, flower_id: int, bot: Bot):
                 minutes, _ = divmod(remainder, 60)
                 remaining = f"⏰ Qolgan vaqt: {hours} soat {minutes} daqiqa\n"
         
-        from database.queries import get_auction_bids
-        bids = await get_auction_bids(session, flower_id)
+        from database.queries import get_top_bids
+        bids = await get_top_bids(session, flower_id, 10)
         
         bids_text = ""
         if bids:
             bids_text = "\n📊 <b>Stavkalar:</b>\n"
-            for i, bid in enumerate(bids[:10], 1):
+            for i, bid in enumerate(bids, 1):
                 name = bid.full_name or bid.username or "Nomalum"
                 bids_text += f"{i}. {name}: {format_price(bid.amount)} som\n"
         
@@ -191,7 +185,7 @@ async def join_auction(message: Message, flower_id: int, bot: Bot):
             f"📊 Stavkalar soni: {flower.bid_count}\n"
             f"📍 Manzil: {flower.location}\n\n"
             f"{remaining}"
-            f"👥 Ishtirokchilar: {len(participants)}\n"
+            f"👥 Ishtirokchilar: {flower.participant_count}\n"
             f"{bids_text}\n"
             f"{'📢 Siz bu auksiyonning egasisiz!' if is_owner else '💬 Stavka qoyish uchun joriy narxdan yuqori narx kiriting'}"
         )
@@ -204,12 +198,11 @@ async def join_auction(message: Message, flower_id: int, bot: Bot):
                 parse_mode="HTML", reply_markup=auction_participant_kb(flower_id, is_owner))
         
         if not is_owner:
-            for p in participants:
-                if p.user_telegram_id != message.from_user.id:
-                    try:
-                        await bot.send_message(chat_id=p.user_telegram_id,
-                            text=f"👤 Yangi ishtirokchi qoshildi!\n🌸 Auksiyon: {flower.name}\n👥 Jami: {len(participants)}")
-                    except: pass
+            participants = await get_auction_participants(session, flower_id)
+            broadcaster.broadcast(bot,
+                [p.user_telegram_id for p in participants if p.user_telegram_id != message.from_user.id],
+                f"👤 Yangi ishtirokchi qoshildi!\n🌸 Auksiyon: {flower.name}\n👥 Jami: {flower.participant_count}",
+                name=f"join:{flower_id}")
 
 
 # ==================== PROFILE ====================
@@ -250,7 +243,7 @@ async def my_flowers(message: Message):
         
         text = "📋 <b>Sizning gullaringiz:</b>\n\n"
         for flower in flowers:
-            status_emoji = {"pending": "⏳", "published": "✅", "sold": "💰", "ended": "🏁"}.get(flower.status, "❓")
+            status_emoji = {"pending": "⏳", "published": "✅", "expired": "⏰", "sold": "💰", "ended": "🏁"}.get(flower.status, "❓")
             auction_text = " (Auksiyon)" if flower.is_auction else ""
             text += f"{status_emoji} <b>{flower.name}</b>{auction_text}\n"
             text += f"   💰 Narx: {format_price(flower.price)} som\n"
@@ -267,20 +260,16 @@ async def my_flowers(message: Message):
 @router.message(F.text == "🌸 Gul qoshish")
 async def add_flower_start(message: Message, state: FSMContext):
     async with async_session() as session:
-        regular_price = await get_setting(session, "regular_post_price")
-        regular_price = int(regular_price) if regular_price else REGULAR_POST_PRICE
-        
-        auction_price = await get_setting(session, "auction_post_price")
-        auction_price = int(auction_price) if auction_price else AUCTION_POST_PRICE
+        settings = await get_bot_settings(session)
     
     await state.set_state(FlowerStates.waiting_type)
     await message.answer(
         f"🌸 <b>Gul qoshish</b>\n\n"
         f"Qanday turdagi e'lon qo'ymoqchisiz?\n\n"
         f"🛒 <b>Oddiy sotish</b> - belgilangan narxda sotish\n"
-        f"   💰 Narxi: {format_price(regular_price)} som\n\n"
+        f"   💰 Narxi: {format_price(settings.regular_post_price)} som\n\n"
         f"🔨 <b>Auksiyon</b> - eng yuqori narx taklif qilgan oladi\n"
-        f"   💰 Narxi: {format_price(auction_price)} som",
+        f"   💰 Narxi: {format_price(settings.auction_post_price)} som",
         parse_mode="HTML",
         reply_markup=flower_type_first_kb()
     )
@@ -315,9 +304,22 @@ async def process_media_collection(user_id: int, state: FSMContext, message: Mes
         await state.update_data(media_collected=True)
         await state.set_state(FlowerStates.waiting_name)
         await message.answer("🌸 Gulning nomini yozing:", reply_markup=cancel_kb())
-    
+
+
+def start_media_collection(user_id: int, state: FSMContext, message: Message):
+    """(Re)start the debounce task that ends media collection for the user"""
     if user_id in media_collection_tasks:
-        del media_collection_tasks[user_id]
+        media_collection_tasks[user_id].cancel()
+    
+    task = asyncio.create_task(process_media_collection(user_id, state, message))
+    media_collection_tasks[user_id] = task
+    
+    def forget(done: asyncio.Task):
+        # Also runs on errors/cancel, so nothing is left behind
+        if media_collection_tasks.get(user_id) is done:
+            del media_collection_tasks[user_id]
+    
+    task.add_done_callback(forget)
 
 
 @router.message(FlowerStates.waiting_media, F.photo)
@@ -331,12 +333,7 @@ async def flower_photo_received(message: Message, state: FSMContext):
     media_list.append({'type': 'photo', 'file_id': photo_id})
     await state.update_data(media_list=media_list)
     
-    user_id = message.from_user.id
-    if user_id in media_collection_tasks:
-        media_collection_tasks[user_id].cancel()
-    
-    task = asyncio.create_task(process_media_collection(user_id, state, message))
-    media_collection_tasks[user_id] = task
+    start_media_collection(message.from_user.id, state, message)
 
 
 @router.message(FlowerStates.waiting_media, F.video)
@@ -350,12 +347,7 @@ async def flower_video_received(message: Message, state: FSMContext):
     media_list.append({'type': 'video', 'file_id': video_id})
     await state.update_data(media_list=media_list)
     
-    user_id = message.from_user.id
-    if user_id in media_collection_tasks:
-        media_collection_tasks[user_id].cancel()
-    
-    task = asyncio.create_task(process_media_collection(user_id, state, message))
-    media_collection_tasks[user_id] = task
+    start_media_collection(message.from_user.id, state, message)
 
 
 @router.message(FlowerStates.waiting_media)
@@ -495,26 +487,22 @@ async def try_publish_flower(message: Message, state: FSMContext, bot: Bot, is_a
     full_name = callback.from_user.full_name if callback else message.from_user.full_name
     
     async with async_session() as session:
-        if is_auction:
-            required_price = await get_setting(session, "auction_post_price")
-            required_price = int(required_price) if required_price else AUCTION_POST_PRICE
-        else:
-            required_price = await get_setting(session, "regular_post_price")
-            required_price = int(required_price) if required_price else REGULAR_POST_PRICE
+        settings = await get_bot_settings(session)
+        required_price = settings.post_price(is_auction)
         
         user, _ = await get_or_create_user(session, user_id, username, full_name)
-        card_number = await get_setting(session, "card_number") or CARD_NUMBER
+        card_number = settings.card_number
         
         if user.balance < required_price:
             # Save flower data for later
             data = await state.get_data()
-            pending_flowers[user_id] = {
+            await save_pending_flower(session, user_id, {
                 'data': data,
                 'is_auction': is_auction,
                 'required_price': required_price,
                 'username': username,
                 'full_name': full_name
-            }
+            })
             
             shortage = required_price - user.balance
             
@@ -547,31 +535,36 @@ async def publish_flower_final(message: Message, state: FSMContext, bot: Bot, is
     """Actually publish the flower to channel"""
     user_id = user_id_override or (callback.from_user.id if callback else message.from_user.id)
     
-    # Get data from pending or state
-    if user_id in pending_flowers:
-        flower_data = pending_flowers[user_id]
+    # Get data from pending or state; the pending listing is only removed once it is published
+    flower_data = pending_flowers.get(user_id)
+    
+    if flower_data:
         data = flower_data['data']
         is_auction = flower_data['is_auction']
         username = flower_data['username']
         full_name = flower_data['full_name']
-        del pending_flowers[user_id]
     else:
         data = await state.get_data()
         username = callback.from_user.username if callback else message.from_user.username
         full_name = callback.from_user.full_name if callback else message.from_user.full_name
     
     async with async_session() as session:
-        if is_auction:
-            required_price = await get_setting(session, "auction_post_price")
-            required_price = int(required_price) if required_price else AUCTION_POST_PRICE
-        else:
-            required_price = await get_setting(session, "regular_post_price")
-            required_price = int(required_price) if required_price else REGULAR_POST_PRICE
+        settings = await get_bot_settings(session)
+        required_price = settings.post_price(is_auction)
         
         user, _ = await get_or_create_user(session, user_id, username, full_name)
         
-        # Deduct balance
-        await update_user_balance(session, user_id, -required_price)
+        # Deduct balance (atomic - fails if a concurrent change left too little)
+        new_balance = await debit_user_balance(session, user_id, required_price)
+        if new_balance is None:
+            await bot.send_message(
+                chat_id=user_id,
+                text=f"❌ Hisobingizda mablag' yetarli emas!\n\n"
+                     f"💰 Kerak: {format_price(required_price)} som",
+                reply_markup=get_menu_kb(user_id, user)
+            )
+            await state.clear()
+            return
         
         media_list = data.get('media_list', [])
         
@@ -601,6 +594,9 @@ async def publish_flower_final(message: Message, state: FSMContext, bot: Bot, is
         flower.seller_telegram_id = user_id
         await session.commit()
         
+        if flower_data:
+            await pop_pending_flower(session, user_id)
+        
         if is_auction:
             await add_auction_participant(session, flower.id, user_id, username, full_name)
         
@@ -673,14 +669,13 @@ async def publish_flower_final(message: Message, state: FSMContext, bot: Bot, is
                 )
             
             await update_flower_status(session, flower.id, "published", sent_message.message_id)
-            
-            # Refresh user balance
-            user = await get_user(session, user_id)
+            if is_auction:
+                auction_deadlines.schedule(flower.id, flower.auction_end_time)
             
             success_text = (
                 f"✅ {'Auksiyoningiz' if is_auction else 'Gullingiz'} muvaffaqiyatli joylandi!\n\n"
                 f"💰 {format_price(required_price)} som yechib olindi.\n"
-                f"💰 Qolgan balans: {format_price(user.balance)} som"
+                f"💰 Qolgan balans: {format_price(new_balance)} som"
             )
             
             if is_auction:
@@ -710,7 +705,7 @@ async def topup_flower_amount_selected(callback: CallbackQuery, state: FSMContex
     amount = int(callback.data.split("_")[2])
     
     async with async_session() as session:
-        card_number = await get_setting(session, "card_number") or CARD_NUMBER
+        card_number = (await get_bot_settings(session)).card_number
     
     await state.update_data(topup_amount=amount)
     await state.set_state(PaymentStates.waiting_screenshot_for_flower)
@@ -733,8 +728,9 @@ async def payment_screenshot_for_flower_received(message: Message, state: FSMCon
     amount = data.get('topup_amount', 0)
     
     # If no amount selected, estimate from pending flower
-    if not amount and message.from_user.id in pending_flowers:
-        amount = pending_flowers[message.from_user.id]['required_price']
+    pending = pending_flowers.get(message.from_user.id)
+    if not amount and pending:
+        amount = pending['required_price']
     
     async with async_session() as session:
         from database.queries import create_payment
@@ -744,6 +740,9 @@ async def payment_screenshot_for_flower_received(message: Message, state: FSMCon
         )
         
         payment = await create_payment(session, user.id, amount, screenshot_id)
+        if pending:
+            # Paid for: the listing must outlive the pending-listing limit/TTL until it is reviewed
+            hold_pending_flower(message.from_user.id)
         
         # Mark payment as flower-related
         from database.models import Payment
@@ -790,13 +789,11 @@ async def payment_screenshot_for_flower_received(message: Message, state: FSMCon
 async def cancel_flower_payment(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     
-    # Remove pending flower data
-    if user_id in pending_flowers:
-        del pending_flowers[user_id]
-    
     await state.clear()
     
     async with async_session() as session:
+        # Remove pending flower data
+        await pop_pending_flower(session, user_id)
         user = await get_user(session, callback.from_user.id)
     
     await callback.message.delete()
@@ -812,7 +809,7 @@ async def cancel_flower_payment(callback: CallbackQuery, state: FSMContext):
 @router.message(F.text == "💰 Balans toldirish")
 async def topup_balance_start(message: Message, state: FSMContext):
     async with async_session() as session:
-        card_number = await get_setting(session, "card_number") or CARD_NUMBER
+        card_number = (await get_bot_settings(session)).card_number
         user, _ = await get_or_create_user(session, message.from_user.id,
             message.from_user.username, message.from_user.full_name)
     
@@ -831,7 +828,7 @@ async def topup_amount_selected(callback: CallbackQuery, state: FSMContext):
     amount = int(callback.data.split("_")[1])
     
     async with async_session() as session:
-        card_number = await get_setting(session, "card_number") or CARD_NUMBER
+        card_number = (await get_bot_settings(session)).card_number
     
     await state.update_data(topup_amount=amount)
     await state.set_state(PaymentStates.waiting_screenshot)
@@ -898,7 +895,6 @@ async def cancel_action(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     if user_id in media_collection_tasks:
         media_collection_tasks[user_id].cancel()
-        del media_collection_tasks[user_id]
     
     async with async_session() as session:
         user = await get_user(session, callback.from_user.id)
@@ -914,7 +910,6 @@ async def cancel_text_action(message: Message, state: FSMContext):
     user_id = message.from_user.id
     if user_id in media_collection_tasks:
         media_collection_tasks[user_id].cancel()
-        del media_collection_tasks[user_id]
     
     async with async_session() as session:
         user = await get_user(session, message.from_user.id)
@@ -927,4 +922,4 @@ def get_pending_flower(user_id: int):
     return pending_flowers.get(user_id)
 
 def has_pending_flower(user_id: int):
-    return user_id in pending_flowers
+    return pending_flowers.get(user_id) is not None
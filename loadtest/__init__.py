@@ -0,0 +1,7 @@
+"""Offline load testing: a local Bot API stand-in and a synthetic workload.
+
+Run with `python -m loadtest --help`.
+"""
+from loadtest.fake_api import FakeBotAPI
+
+__all__ = ["FakeBotAPI"]
@@ -0,0 +1,120 @@
+"""Offline load test: simulated users bid against the real routers and a fake Bot API.
+
+    python -m loadtest [--users 2000] [--auctions 20] [--bids 5] [--latency 0.05] [--flood-rate 0.01]
+
+Runs on a temporary SQLite database and a local Bot API stand-in, nothing is
+sent to Telegram. The dispatcher is set up like bot.py (same storage choice
+and per-user dispatch). Prints p50/p95/p99 handler latency per update kind
+(`/start auction_<id>`, bids, `sell_` callbacks) and the outbound API calls
+made, including broadcasts that finished within --drain seconds. With
+--trace RATE that share of updates is traced to TRACE_FILE / TRACE_OTLP_ENDPOINT.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+
+
+async def run(args):
+    # Imported late: config reads DATABASE_URL/CHANNEL_ID when first imported
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.enums import ParseMode
+    from aiogram.fsm.storage.memory import MemoryStorage
+
+    from config import FSM_STORAGE
+    from database import init_db
+    from database.connection import engine
+    from database.fsm_storage import DatabaseStorage
+    from handlers import user_router, admin_router, auction_router
+    from utils import auction_engine, caption_refresher, broadcaster, user_dispatch
+    from utils import tracing
+    from loadtest.fake_api import FakeBotAPI
+    from loadtest.workload import Scenario, Workload
+
+    api = FakeBotAPI(latency=args.latency, jitter=args.jitter, flood_rate=args.flood_rate,
+                     retry_after=args.retry_after, seed=args.seed)
+    await api.start()
+    await init_db()
+
+    bot = Bot("123456:LOADTEST", session=api.session(), default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    storage = MemoryStorage() if FSM_STORAGE == "memory" else DatabaseStorage()
+    dp = Dispatcher(storage=storage)
+    tracing.instrument_dispatcher(dp, bot)
+    tracing.instrument_engine(engine)
+    user_dispatch.setup(dp)
+    dp.include_router(user_router)
+    dp.include_router(admin_router)
+    dp.include_router(auction_router)
+
+    workload = Workload(dp, bot, Scenario(
+        users=args.users, auctions=args.auctions, hot=args.hot, bids=args.bids,
+        think=args.think, ramp=args.ramp, sell=not args.no_sell, seed=args.seed,
+    ))
+    await workload.seed()
+    api.reset()
+
+    print(f"{args.users} users, {args.auctions} auctions, {args.bids} bids each, "
+          f"API latency {args.latency * 1000:.0f}ms, 429 rate {args.flood_rate:.1%}")
+    results = await workload.run()
+
+    try:
+        await asyncio.wait_for(broadcaster.shutdown(), args.drain)
+    except asyncio.TimeoutError:
+        print(f"broadcasts still running after {args.drain:.0f}s were cancelled")
+    await caption_refresher.shutdown()
+    await user_dispatch.shutdown()
+    await auction_engine.shutdown()
+    await storage.close()
+    await tracing.tracer.shutdown()
+
+    total = sum(len(values) for values in results.latencies.values())
+    print(f"\n{total} updates in {results.elapsed:.1f}s ({total / results.elapsed:.0f}/s)\n")
+    print(f"{'update':<8}{'count':>8}{'errors':>8}{'p50':>11}{'p95':>11}{'p99':>11}{'max':>11}")
+    for kind, values in results.latencies.items():
+        values.sort()
+        print(f"{kind:<8}{len(values):>8}{results.errors[kind]:>8}"
+              f"{statistics.median(values) * 1000:>9.1f}ms{values[int(len(values) * 0.95)] * 1000:>9.1f}ms"
+              f"{values[int(len(values) * 0.99)] * 1000:>9.1f}ms{values[-1] * 1000:>9.1f}ms")
+
+    print(f"\n{'outbound call':<24}{'ok':>8}{'429':>8}")
+    for method in sorted(set(api.calls) | set(api.floods), key=lambda m: -api.calls[m]):
+        print(f"{method:<24}{api.calls[method]:>8}{api.floods[method]:>8}")
+    print(f"{'total':<24}{sum(api.calls.values()):>8}{sum(api.floods.values()):>8}")
+
+    await bot.session.close()
+    await api.stop()
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--auctions", type=int, default=20)
+    parser.add_argument("--hot", type=float, default=1.2, help="zipf exponent of auction popularity")
+    parser.add_argument("--bids", type=int, default=5, help="bids per user")
+    parser.add_argument("--think", type=float, default=0.5, help="mean seconds between a user's bids")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which users arrive")
+    parser.add_argument("--no-sell", action="store_true", help="skip the owners' sell_ callbacks")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake API latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="share of calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--drain", type=float, default=10.0, help="seconds to let broadcasts finish")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--trace", type=float, default=0.0, help="share of updates to trace")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tmp, 'loadtest.db')}"
+        os.environ.setdefault("CHANNEL_ID", "-1001000000000")
+        if args.trace:
+            os.environ["TRACE_SAMPLE_RATE"] = str(args.trace)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
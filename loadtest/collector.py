@@ -0,0 +1,108 @@
+"""Local stand-in for an OpenTelemetry collector (OTLP/HTTP, JSON encoding).
+
+    python -m loadtest.collector [--port 4318] [--out collected.jsonl]
+
+Accepts POST /v1/traces as sent by utils.tracing.OtlpExporter and appends
+every span to --out as one JSON line in the same flat shape TRACE_FILE uses.
+On Ctrl+C (or SIGTERM) prints the span count and p50/p95 duration per span name.
+"""
+import argparse
+import asyncio
+import json
+import signal
+import statistics
+from collections import defaultdict
+from typing import Dict, List
+
+from aiohttp import web
+
+
+def _value(value: dict):
+    for kind in ("stringValue", "boolValue", "doubleValue"):
+        if kind in value:
+            return value[kind]
+    if "intValue" in value:
+        return int(value["intValue"])
+    return None
+
+
+def flatten(payload: dict) -> List[dict]:
+    """OTLP ExportTraceServiceRequest -> the flat span dicts of TRACE_FILE"""
+    spans = []
+    for resource in payload.get("resourceSpans", []):
+        for scope in resource.get("scopeSpans", []):
+            for s in scope.get("spans", []):
+                start, end = int(s["startTimeUnixNano"]), int(s["endTimeUnixNano"])
+                status = s.get("status", {})
+                spans.append({
+                    "trace_id": s["traceId"], "span_id": s["spanId"], "parent_id": s.get("parentSpanId") or None,
+                    "name": s["name"], "start_ns": start, "end_ns": end,
+                    "duration_ms": round((end - start) / 1e6, 3),
+                    "attributes": {a["key"]: _value(a["value"]) for a in s.get("attributes", [])},
+                    "error": status.get("message") if status.get("code") == 2 else None,
+                })
+    return spans
+
+
+class Collector:
+    def __init__(self, out: str):
+        self.out = out
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/traces", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        try:
+            spans = flatten(await request.json())
+        except (ValueError, KeyError) as e:
+            return web.json_response({"error": str(e)}, status=400)
+        with open(self.out, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span, ensure_ascii=False) + "\n")
+                self.durations[span["name"]].append(span["duration_ms"])
+        return web.json_response({})
+
+    def report(self):
+        print(f"\n{'span':<48}{'count':>8}{'p50':>11}{'p95':>11}")
+        for name, values in sorted(self.durations.items(), key=lambda item: -len(item[1])):
+            values.sort()
+            print(f"{name:<48}{len(values):>8}{statistics.median(values):>9.2f}ms"
+                  f"{values[int(len(values) * 0.95)]:>9.2f}ms")
+
+
+async def serve(collector: Collector, host: str, port: int):
+    runner = web.AppRunner(collector.app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Collecting on http://{host}:{port}/v1/traces -> {collector.out}", flush=True)
+    stop = asyncio.Event()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    except NotImplementedError:  # Windows
+        pass
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--out", default="collected.jsonl")
+    args = parser.parse_args()
+
+    collector = Collector(args.out)
+    try:
+        asyncio.run(serve(collector, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    collector.report()
+
+
+if __name__ == "__main__":
+    main()
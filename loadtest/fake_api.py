@@ -0,0 +1,140 @@
+"""Local stand-in for the Telegram Bot API.
+
+Serves `/bot<token>/<method>` like api.telegram.org, so a real `Bot` can be
+pointed at it with `FakeBotAPI.session()`. Every call is recorded; send/edit
+methods can be slowed down (`latency` +- `jitter` seconds) and answered with
+429 "retry after" at `flood_rate` probability. getUpdates long-polls over the
+updates queued with `put_update`, so start_polling works against it too.
+"""
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from aiohttp import web
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Flower Bot", "username": "flower_loadtest_bot"}
+
+# Never throttled or delayed: they are not what we measure
+SERVICE_METHODS = {"getme", "getupdates", "deletewebhook", "setwebhook", "getwebhookinfo", "close", "logout"}
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, flood_rate: float = 0.0,
+                 retry_after: int = 1, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.calls = Counter()  # method -> answered calls
+        self.floods = Counter()  # method -> 429s returned
+        self.log: List[Tuple[float, str, dict]] = []  # (time, method, params) of every call
+        self.queued_at = {}  # update_id -> time it was queued
+        self._updates: List[dict] = []
+        self._arrived = asyncio.Event()
+        self._message_id = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.base = ""
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self.base = f"http://{host}:{site._server.sockets[0].getsockname()[1]}"
+        return self.base
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def session(self, **kwargs) -> AiohttpSession:
+        """aiogram session that talks to this server"""
+        return AiohttpSession(api=TelegramAPIServer.from_base(self.base), **kwargs)
+
+    def put_update(self, update: dict):
+        self.queued_at[update["update_id"]] = time.perf_counter()
+        self._updates.append(update)
+        self._arrived.set()
+
+    def reset(self):
+        self.calls.clear()
+        self.floods.clear()
+        self.log.clear()
+
+    def _message(self, params: dict, **fields) -> dict:
+        self._message_id += 1
+        chat_id = params.get("chat_id") or 0
+        chat_id = int(chat_id) if str(chat_id).lstrip("-").isdigit() else 0
+        return {
+            "message_id": int(params.get("message_id") or self._message_id),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "channel" if chat_id < 0 else "private"},
+            "from": BOT_USER,
+            **fields,
+        }
+
+    def _result(self, method: str, params: dict):
+        if method == "getme":
+            return BOT_USER
+        if method in ("sendmessage", "editmessagetext"):
+            return self._message(params, text=params.get("text", ""))
+        if method == "sendphoto":
+            return self._message(params, caption=params.get("caption"),
+                                 photo=[{"file_id": "p", "file_unique_id": "p", "width": 1, "height": 1}])
+        if method == "sendvideo":
+            return self._message(params, caption=params.get("caption"),
+                                 video={"file_id": "v", "file_unique_id": "v", "width": 1, "height": 1, "duration": 1})
+        if method == "senddocument":
+            return self._message(params, document={"file_id": "d", "file_unique_id": "d"})
+        if method in ("editmessagecaption", "editmessagereplymarkup"):
+            return self._message(params, caption=params.get("caption"))
+        if method == "sendmediagroup":
+            return [self._message(params, photo=[{"file_id": "p", "file_unique_id": "p", "width": 1, "height": 1}])
+                    for _ in json.loads(params.get("media") or "[]")]
+        return True
+
+    async def _get_updates(self, params: dict) -> list:
+        offset = int(params.get("offset") or 0)
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:int(params.get("limit") or 100)]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = dict(await request.post())
+        self.log.append((time.perf_counter(), method, params))
+
+        if method == "getupdates":
+            self.calls[method] += 1
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+
+        if method not in SERVICE_METHODS:
+            if self.latency or self.jitter:
+                await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+            if self.flood_rate and self.random.random() < self.flood_rate:
+                self.floods[method] += 1
+                return web.json_response({
+                    "ok": False, "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                }, status=429)
+
+        self.calls[method] += 1
+        return web.json_response({"ok": True, "result": self._result(method, params)})
@@ -0,0 +1,134 @@
+"""Synthetic bidding storm driven through the real dispatcher and routers.
+
+Each simulated user joins one auction with `/start auction_<id>` (a few hot
+auctions get most users), then places bids with exponential think time in
+between, waiting for each update to be handled like a real client. When every
+user is done, each owner presses `sell_` on the highest bid. The time of each
+`dp.feed_update` is recorded per update kind.
+"""
+import asyncio
+import itertools
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from database import async_session
+from database.queries import (
+    get_or_create_user, create_flower, update_flower_status, add_auction_participant, get_highest_bid
+)
+
+OWNER_BASE = 1_000_000
+USER_BASE = 2_000_000
+START_PRICE = 100_000
+
+
+@dataclass
+class Scenario:
+    users: int = 2000
+    auctions: int = 20
+    hot: float = 1.2  # zipf exponent of auction popularity
+    bids: int = 5  # per user
+    think: float = 0.5  # mean seconds between one user's bids
+    ramp: float = 5.0  # users start spread over this many seconds
+    sell: bool = True
+    seed: int = 1
+
+
+@dataclass
+class Results:
+    latencies: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    errors: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    elapsed: float = 0.0
+
+
+class Workload:
+    def __init__(self, dp: Dispatcher, bot: Bot, scenario: Scenario):
+        self.dp = dp
+        self.bot = bot
+        self.scenario = scenario
+        self.random = random.Random(scenario.seed)
+        self.results = Results()
+        self.auctions: List[int] = []
+        self.owners: Dict[int, int] = {}  # flower id -> owner telegram id
+        self.prices: Dict[int, int] = {}  # what users believe the current price is
+        self._update_id = itertools.count(1)
+        self._message_id = itertools.count(1)
+
+    async def seed(self):
+        """Publish `auctions` live auctions, one owner each"""
+        end = datetime.utcnow() + timedelta(hours=2)
+        async with async_session() as session:
+            for n in range(self.scenario.auctions):
+                owner_id = OWNER_BASE + n
+                owner, _ = await get_or_create_user(session, owner_id, f"owner{n}", f"Owner {n}")
+                flower = await create_flower(
+                    session, owner.id, f"photo{n}", f"Atirgul #{n}", "Yangi uzilgan", START_PRICE, True,
+                    "+998901234567", "Toshkent", end
+                )
+                await update_flower_status(session, flower.id, "published", message_id=10_000 + n)
+                await add_auction_participant(session, flower.id, owner_id, f"owner{n}", f"Owner {n}")
+                self.auctions.append(flower.id)
+                self.owners[flower.id] = owner_id
+                self.prices[flower.id] = START_PRICE
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": "Load", "last_name": str(user_id),
+                "username": f"load{user_id}"}
+
+    def message(self, user_id: int, text: str) -> Update:
+        return Update.model_validate({"update_id": next(self._update_id), "message": {
+            "message_id": next(self._message_id), "date": int(time.time()), "text": text,
+            "chat": {"id": user_id, "type": "private"}, "from": self._user(user_id),
+        }})
+
+    def callback(self, user_id: int, data: str) -> Update:
+        return Update.model_validate({"update_id": next(self._update_id), "callback_query": {
+            "id": str(next(self._message_id)), "chat_instance": "1", "data": data, "from": self._user(user_id),
+            "message": {"message_id": next(self._message_id), "date": int(time.time()), "text": "💰 Yangi stavka!",
+                        "chat": {"id": user_id, "type": "private"}},
+        }})
+
+    async def feed(self, kind: str, update: Update):
+        start = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception:
+            self.results.errors[kind] += 1
+        self.results.latencies[kind].append(time.perf_counter() - start)
+
+    async def _simulate_user(self, n: int, flower_id: int):
+        s = self.scenario
+        user_id = USER_BASE + n
+        await asyncio.sleep(self.random.uniform(0, s.ramp))
+        await self.feed("start", self.message(user_id, f"/start auction_{flower_id}"))
+        for _ in range(s.bids):
+            await asyncio.sleep(self.random.expovariate(1 / s.think) if s.think else 0)
+            bid = self.prices[flower_id] + self.random.randint(1, 10) * 1000
+            self.prices[flower_id] = max(self.prices[flower_id], bid)
+            await self.feed("bid", self.message(user_id, str(bid)))
+
+    async def _sell(self, flower_id: int):
+        async with async_session() as session:
+            bid = await get_highest_bid(session, flower_id)
+        if bid is not None:
+            await self.feed("sell", self.callback(
+                self.owners[flower_id], f"sell_{flower_id}_{bid.id}_{bid.user_telegram_id}"
+            ))
+
+    async def run(self) -> Results:
+        s = self.scenario
+        weights = [1 / (rank + 1) ** s.hot for rank in range(len(self.auctions))]
+        picks = self.random.choices(self.auctions, weights=weights, k=s.users)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(self._simulate_user(n, flower_id) for n, flower_id in enumerate(picks)))
+        if s.sell:
+            await asyncio.gather(*(self._sell(flower_id) for flower_id in self.auctions))
+        self.results.elapsed = time.perf_counter() - start
+        return self.results
@@ -0,0 +1,51 @@
+"""Bid decisions come from memory; commits happen behind them."""
+import asyncio
+import importlib
+from datetime import datetime, timedelta
+
+from database.queries import create_flower, get_flower, get_or_create_user, update_flower_status
+from utils.auction_engine import AuctionEngine, TOO_LOW
+
+# utils/__init__ re-exports the engine instance under the module's name
+engine_module = importlib.import_module("utils.auction_engine")
+
+
+def test_bids_are_answered_while_a_commit_is_in_flight(db, monkeypatch):
+    add_batch = engine_module.add_auction_bids_batch
+
+    async def test(sessions):
+        gate = asyncio.Event()
+
+        async def slow_add_batch(*args, **kwargs):
+            await gate.wait()
+            return await add_batch(*args, **kwargs)
+
+        monkeypatch.setattr(engine_module, "add_auction_bids_batch", slow_add_batch)
+        async with sessions() as session:
+            owner, _ = await get_or_create_user(session, 1)
+            flower = await create_flower(session, owner.id, "photo", "Atirgul", "", 1000, True,
+                                         "+998901234567", "Toshkent", datetime.utcnow() + timedelta(hours=1))
+            await update_flower_status(session, flower.id, "published")
+
+        engine = AuctionEngine(session_factory=sessions)
+        first = await engine.submit_bid(flower.id, 100, None, None, 2000)
+        await asyncio.sleep(0)  # the writer takes the first bid and blocks in its commit
+        results = await asyncio.wait_for(asyncio.gather(
+            engine.submit_bid(flower.id, 101, None, None, 3000),
+            engine.submit_bid(flower.id, 102, None, None, 2500),
+            engine.submit_bid(flower.id, 103, None, None, 4000),
+        ), timeout=1)
+        assert first.accepted
+        assert [(r.accepted, r.reason) for r in results] == [(True, None), (False, TOO_LOW), (True, None)]
+        assert not first.bid_id.done()
+
+        gate.set()
+        ids = [await first.bid_id, await results[0].bid_id, await results[2].bid_id]
+        assert ids == sorted(ids)
+        await engine.close_auction(flower.id)
+
+        async with sessions() as session:
+            flower = await get_flower(session, flower.id)
+            assert (flower.current_bid, flower.highest_bidder_id) == (4000, 103)
+
+    db(test)
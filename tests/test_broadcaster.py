@@ -0,0 +1,35 @@
+"""Per-chat spacing must not hold back messages to other chats."""
+import asyncio
+import time
+from collections import defaultdict
+
+from utils.broadcaster import Broadcaster
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = defaultdict(list)  # chat_id -> send times
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.sent[chat_id].append(time.monotonic())
+
+
+def test_repeat_chats_dont_delay_fresh_ones():
+    async def main():
+        bot = RecordingBot()
+        broadcaster = Broadcaster(concurrency=4, rate=50, chat_interval=0.5)
+        start = time.monotonic()
+        repeats = [broadcaster.broadcast(bot, [1, 2], f"bid {n}") for n in range(3)]
+        await broadcaster.broadcast(bot, range(100, 110), "fresh")
+        fresh_elapsed = time.monotonic() - start
+        await asyncio.gather(*repeats)
+        await broadcaster.shutdown()
+
+        # 16 messages are ready at once: ~0.3s at 50/s, not three chat intervals
+        assert fresh_elapsed < 0.5
+        for chat_id in (1, 2):
+            times = bot.sent[chat_id]
+            assert len(times) == 3
+            assert all(b - a >= 0.5 - 0.01 for a, b in zip(times, times[1:]))
+
+    asyncio.run(main())
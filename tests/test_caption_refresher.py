@@ -0,0 +1,24 @@
+"""A post that got its final caption is never re-captioned by a late bid."""
+import asyncio
+
+from utils.caption_refresher import CaptionRefresher
+
+
+def test_schedule_after_cancel_is_ignored():
+    async def main():
+        refresher = CaptionRefresher(interval=0)
+        sent = []
+
+        async def send(caption: str):
+            sent.append(caption)
+
+        refresher.schedule(7, "live #1", send, version=1)
+        await asyncio.sleep(0.01)
+        await refresher.cancel(7)  # sold: the final caption goes out next
+        refresher.schedule(7, "live #2", send, version=2)  # a bid handler that was still running
+        await asyncio.sleep(0.01)
+
+        assert sent == ["live #1"]
+        assert refresher.stats()["pending"] == 0
+
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+"""ON CONFLICT upserts and UPDATE ... RETURNING queries on SQLite and PostgreSQL."""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from database.models import Payment, PaymentDailyRollup, PendingFlower, Settings, User
+from database.queries import (
+    NEW_USER_BONUS, approve_pending_payment, create_flower, create_payment, debit_user_balance,
+    get_or_create_user, get_setting, save_pending_flower, set_setting, set_user_admin, set_user_balance,
+    transition_flower_status, update_user_balance
+)
+
+
+def test_engine_backend(db, db_url):
+    async def test(sessions):
+        async with sessions() as session:
+            assert session.get_bind().dialect.name == db_url.split("+")[0]
+
+    db(test)
+
+
+def test_get_or_create_user_inserts_once(db):
+    async def test(sessions):
+        async def start():
+            async with sessions() as session:
+                return await get_or_create_user(session, 42, "user", "User")
+
+        # Two concurrent /start: ON CONFLICT DO NOTHING, exactly one of them creates
+        results = await asyncio.gather(start(), start())
+        assert sorted(is_new for _, is_new in results) == [False, True]
+        assert {user.id for user, _ in results} == {results[0][0].id}
+
+        async with sessions() as session:
+            user, is_new = await get_or_create_user(session, 42)
+            assert not is_new and user.balance == NEW_USER_BONUS
+            assert len((await session.execute(select(User))).scalars().all()) == 1
+
+    db(test)
+
+
+def test_balance_updates_return_new_balance(db):
+    async def test(sessions):
+        async with sessions() as session:
+            await get_or_create_user(session, 1)
+            assert await update_user_balance(session, 1, 5000) == NEW_USER_BONUS + 5000
+            assert await debit_user_balance(session, 1, NEW_USER_BONUS) == 5000
+            assert await debit_user_balance(session, 1, 5001) is None  # not enough funds
+            assert await update_user_balance(session, 999, 1) is None
+
+            assert await set_user_balance(session, 1, 7) is True
+            assert await set_user_balance(session, 999, 7) is False
+            assert await set_user_admin(session, 1, True) is True
+            assert await set_user_admin(session, 999, True) is False
+
+            user = (await session.execute(select(User).where(User.telegram_id == 1))).scalar_one()
+            await session.refresh(user)
+            assert (user.balance, user.is_admin) == (7, True)
+
+    db(test)
+
+
+def test_transition_flower_status_claims_once(db):
+    async def test(sessions):
+        async with sessions() as session:
+            owner, _ = await get_or_create_user(session, 1)
+            flower = await create_flower(session, owner.id, "photo", "Atirgul", "", 1000, True,
+                                         "+998901234567", "Toshkent", datetime.utcnow() + timedelta(hours=1))
+            assert await transition_flower_status(session, flower.id, "pending", "published")
+
+        async def claim():
+            async with sessions() as session:
+                return await transition_flower_status(session, flower.id, "published", "expired")
+
+        assert sorted(await asyncio.gather(claim(), claim(), claim())) == [False, False, True]
+
+    db(test)
+
+
+def test_setting_upsert_replaces_value(db):
+    async def test(sessions):
+        async with sessions() as session:
+            await set_setting(session, "card_number", "8600 0000")
+            await set_setting(session, "card_number", "9860 1111")
+            rows = (await session.execute(select(Settings.key, Settings.value))).all()
+            assert rows == [("card_number", "9860 1111")]
+            assert await get_setting(session, "card_number") == "9860 1111"
+
+    db(test)
+
+
+def test_pending_flower_upsert_keeps_latest(db):
+    async def test(sessions):
+        async with sessions() as session:
+            await save_pending_flower(session, 5, {"name": "first"})
+            await save_pending_flower(session, 5, {"name": "second"})
+            rows = (await session.execute(select(PendingFlower))).scalars().all()
+            assert [(row.user_telegram_id, row.payload) for row in rows] == [(5, '{"name": "second"}')]
+
+    db(test)
+
+
+def test_approve_payment_credits_user_and_updates_daily_rollup(db):
+    async def test(sessions):
+        async with sessions() as session:
+            user, _ = await get_or_create_user(session, 1)
+            first = await create_payment(session, user.id, 10000, "screenshot")
+            second = await create_payment(session, user.id, 25000, "screenshot")
+
+            assert await approve_pending_payment(session, first.id) == NEW_USER_BONUS + 10000
+            assert await approve_pending_payment(session, first.id) is None  # already reviewed
+            assert await approve_pending_payment(session, second.id) == NEW_USER_BONUS + 35000
+
+            rollup = (await session.execute(select(PaymentDailyRollup))).scalars().all()
+            assert [(row.amount, row.count) for row in rollup] == [(35000, 2)]
+
+    db(test)
+
+
+def test_approve_payment_of_missing_user_changes_nothing(db, db_url):
+    if db_url.startswith("postgresql"):
+        pytest.skip("the payments.user_id foreign key is enforced")
+
+    async def test(sessions):
+        async with sessions() as session:
+            user, _ = await get_or_create_user(session, 1)
+            payment_id = (await create_payment(session, user.id, 10000, "screenshot")).id
+            await session.execute(update(Payment).where(Payment.id == payment_id).values(user_id=user.id + 1))
+            await session.commit()
+
+            with pytest.raises(LookupError):
+                await approve_pending_payment(session, payment_id)
+
+        async with sessions() as session:
+            assert (await session.get(Payment, payment_id)).status == "pending"
+            assert (await session.execute(select(PaymentDailyRollup))).scalars().all() == []
+
+    db(test)
@@ -0,0 +1,67 @@
+"""Pending listings dropped from memory must not come back from the table on restart."""
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from database.models import PendingFlower
+from database.queries import (
+    create_payment, get_or_create_user, hold_pending_flower, load_pending_flowers, pending_flowers,
+    pop_pending_flower, save_pending_flower
+)
+
+
+async def _rows(session) -> list:
+    return sorted((await session.execute(select(PendingFlower.user_telegram_id))).scalars().all())
+
+
+def test_evicted_listing_row_is_deleted(db, monkeypatch):
+    monkeypatch.setattr(pending_flowers, "maxsize", 2)
+
+    async def test(sessions):
+        async with sessions() as session:
+            for user_id in (1, 2, 3):
+                await save_pending_flower(session, user_id, {"name": f"#{user_id}"})
+            assert await _rows(session) == [2, 3]
+
+            assert await load_pending_flowers(session) == 2  # as after a restart
+            assert pending_flowers.get(1) is None
+
+    db(test)
+
+
+def test_pop_of_expired_listing_deletes_row(db, monkeypatch):
+    async def test(sessions):
+        async with sessions() as session:
+            await save_pending_flower(session, 1, {"name": "#1"})
+            monkeypatch.setattr(pending_flowers, "ttl", -1)
+            await save_pending_flower(session, 2, {"name": "#2"})  # stored already expired
+
+            assert await pop_pending_flower(session, 2) is None
+            assert await pop_pending_flower(session, 1) == {"name": "#1"}
+            assert await _rows(session) == []
+
+    db(test)
+
+
+def test_paid_listing_outlives_limit_and_ttl(db, monkeypatch):
+    monkeypatch.setattr(pending_flowers, "maxsize", 1)
+
+    async def test(sessions):
+        async with sessions() as session:
+            user, _ = await get_or_create_user(session, 1)
+            await save_pending_flower(session, 1, {"name": "#1"})
+            await create_payment(session, user.id, 40000, "screenshot")
+            assert hold_pending_flower(1)
+
+            await save_pending_flower(session, 2, {"name": "#2"})
+            await save_pending_flower(session, 3, {"name": "#3"})  # evicts #2 only
+            assert await _rows(session) == [1, 3]
+
+            # Restart after the TTL: the paid listing is still there, pinned
+            await session.execute(update(PendingFlower).values(created_at=datetime.utcnow() - timedelta(days=4)))
+            await session.commit()
+            assert await load_pending_flowers(session) == 1
+            assert pending_flowers.get(1) == {"name": "#1"} and pending_flowers.is_pinned(1)
+            assert await _rows(session) == [1]
+
+    db(test)
@@ -0,0 +1,42 @@
+"""The user cache must not keep a row read before a concurrent write."""
+import asyncio
+
+from database.queries import get_or_create_user, get_user, update_user_balance, user_cache, NEW_USER_BONUS
+
+
+class _SlowSession:
+    """Session whose query results are held back until `release` is set"""
+
+    def __init__(self, session, release: asyncio.Event):
+        self.session = session
+        self.release = release
+        self.executed = asyncio.Event()
+
+    async def execute(self, *args, **kwargs):
+        result = await self.session.execute(*args, **kwargs)
+        self.executed.set()
+        await self.release.wait()
+        return result
+
+
+def test_read_racing_a_balance_update_is_not_cached(db):
+    async def test(sessions):
+        async with sessions() as session:
+            await get_or_create_user(session, 7)
+        user_cache.clear()
+
+        release = asyncio.Event()
+        async with sessions() as reader, sessions() as writer:
+            slow = _SlowSession(reader, release)
+            read = asyncio.create_task(get_user(slow, 7))
+            await slow.executed.wait()  # the old balance has been read
+
+            assert await update_user_balance(writer, 7, 500) == NEW_USER_BONUS + 500
+            release.set()
+            assert (await read).balance == NEW_USER_BONUS  # stale for this caller only
+
+        assert 7 not in user_cache
+        async with sessions() as session:
+            assert (await get_user(session, 7)).balance == NEW_USER_BONUS + 500
+
+    db(test)
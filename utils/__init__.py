@@ -1,3 +1,7 @@
-from utils.scheduler import scheduler_loop, check_ended_auctions
+from utils.scheduler import scheduler_loop, check_ended_auctions, auction_deadlines
+from utils.auction_engine import auction_engine
+from utils.caption_refresher import caption_refresher
+from utils.broadcaster import broadcaster
+from utils.dispatch import user_dispatch
 
-__all__ = ["scheduler_loop", "check_ended_auctions"]
+__all__ = ["scheduler_loop", "check_ended_auctions", "auction_deadlines", "auction_engine", "caption_refresher", "broadcaster", "user_dispatch"]
@@ -0,0 +1,258 @@
+"""In-memory auction engine.
+
+Every live auction gets one actor task that owns its state (price, leader,
+bid count, deadline, owner). Bids for that auction go through the actor's
+queue, so they are validated one at a time in memory and answered right away,
+never waiting on the database. Accepted bids go to the actor's writer task,
+which commits them in batches: everything accepted while the previous batch
+was committing goes into the next commit.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from database import async_session
+from database.queries import get_flower, get_flower_owner_telegram_id, add_auction_bids_batch
+from utils.tracing import detached_task
+from config import AUCTION_BID_BATCH_SIZE, AUCTION_ACTOR_IDLE_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Reject reasons
+NOT_FOUND = "not_found"
+ENDED = "ended"
+EXPIRED = "expired"
+OWNER = "owner"
+TOO_LOW = "too_low"
+
+
+@dataclass
+class AuctionState:
+    flower_id: int
+    owner_telegram_id: Optional[int]
+    start_price: int
+    current_bid: int
+    highest_bidder_id: Optional[int]
+    bid_count: int
+    end_time: Optional[datetime]
+    is_open: bool = True
+
+
+@dataclass
+class BidResult:
+    accepted: bool
+    reason: Optional[str] = None
+    current_bid: int = 0  # price after this bid (or the price it failed to beat)
+    bid_count: int = 0
+    owner_telegram_id: Optional[int] = None
+    # Resolves to the AuctionBid id once the batch holding this bid is committed
+    bid_id: Optional["asyncio.Future[int]"] = None
+
+
+@dataclass
+class _BidRequest:
+    user_telegram_id: int
+    username: Optional[str]
+    full_name: Optional[str]
+    amount: int
+    result: "asyncio.Future[BidResult]" = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+class AuctionActor:
+    def __init__(self, engine: "AuctionEngine", flower_id: int):
+        self.engine = engine
+        self.flower_id = flower_id
+        self.state: Optional[AuctionState] = None
+        self.closed = False  # set by close_auction, also covers a state still loading
+        self.failed = False  # a batch failed to commit: memory is ahead of the database
+        # None wakes the actor after the writer handed its queue to a fresh actor
+        self.queue: "asyncio.Queue[Optional[_BidRequest]]" = asyncio.Queue()
+        # Accepted bids waiting for the writer, oldest first
+        self._unwritten: List[Tuple[_BidRequest, BidResult]] = []
+        self._writer_wake = asyncio.Event()
+        self._draining = False
+        self.task = detached_task(self._run())  # batches commit bids of many updates
+
+    async def _load_state(self) -> Optional[AuctionState]:
+        async with self.engine.session_factory() as session:
+            flower = await get_flower(session, self.flower_id)
+            if not flower or not flower.is_auction:
+                return None
+            return AuctionState(
+                flower_id=flower.id,
+                owner_telegram_id=await get_flower_owner_telegram_id(session, flower),
+                start_price=flower.price,
+                current_bid=flower.current_bid or flower.price,
+                highest_bidder_id=flower.highest_bidder_id,
+                bid_count=flower.bid_count or 0,
+                end_time=flower.auction_end_time,
+                is_open=flower.status == "published",
+            )
+
+    def _validate(self, request: _BidRequest) -> BidResult:
+        """O(1) check and in-memory apply - the only place the state changes"""
+        state = self.state
+        if state is None:
+            return BidResult(False, NOT_FOUND)
+        if self.closed:
+            state.is_open = False
+        if not state.is_open:
+            return BidResult(False, ENDED, state.current_bid, state.bid_count, state.owner_telegram_id)
+        if state.end_time and datetime.utcnow() > state.end_time:
+            return BidResult(False, EXPIRED, state.current_bid, state.bid_count, state.owner_telegram_id)
+        if request.user_telegram_id == state.owner_telegram_id:
+            return BidResult(False, OWNER, state.current_bid, state.bid_count, state.owner_telegram_id)
+        if request.amount <= state.current_bid:
+            return BidResult(False, TOO_LOW, state.current_bid, state.bid_count, state.owner_telegram_id)
+
+        state.current_bid = request.amount
+        state.highest_bidder_id = request.user_telegram_id
+        state.bid_count += 1
+        return BidResult(True, None, state.current_bid, state.bid_count, state.owner_telegram_id,
+                         asyncio.get_running_loop().create_future())
+
+    async def _persist(self, batch: List[Tuple[_BidRequest, BidResult]]) -> bool:
+        # Accepted bids only go up: the batch's last one leads once it is committed
+        last, _ = batch[-1]
+        try:
+            async with self.engine.session_factory() as session:
+                rows = await add_auction_bids_batch(
+                    session, self.flower_id,
+                    [{"user_telegram_id": r.user_telegram_id, "username": r.username,
+                      "full_name": r.full_name, "amount": r.amount} for r, _ in batch],
+                    current_bid=last.amount,
+                    highest_bidder_id=last.user_telegram_id
+                )
+        except Exception as e:
+            logger.exception("Failed to persist %s bids for auction %s", len(batch), self.flower_id)
+            for _, result in batch + self._unwritten:
+                result.bid_id.set_exception(e)
+            self._unwritten.clear()
+            # Memory is ahead of the database now: retire this actor and let a
+            # fresh one reload the committed state for the bids still queued
+            self.failed = True
+            self.engine._forget(self)
+            while not self.queue.empty():
+                request = self.queue.get_nowait()
+                if request is not None:
+                    self.engine._route(self.flower_id, request)
+            self.queue.put_nowait(None)
+            return False
+
+        for (_, result), row in zip(batch, rows):
+            result.bid_id.set_result(row.id)
+        return True
+
+    async def _write(self):
+        """Commit accepted bids, whatever piled up during the previous commit at once"""
+        while True:
+            if not self._unwritten:
+                if self._draining:
+                    return
+                self._writer_wake.clear()
+                await self._writer_wake.wait()
+                continue
+            batch = self._unwritten[:self.engine.batch_size]
+            del self._unwritten[:len(batch)]
+            if not await self._persist(batch):
+                return
+
+    async def _decide(self):
+        """Answer queued bids one at a time; accepted ones go to the writer"""
+        while not self.failed:
+            try:
+                request = await asyncio.wait_for(self.queue.get(), self.engine.idle_timeout)
+            except asyncio.TimeoutError:
+                if self.queue.empty() and not self._unwritten:
+                    self.engine._forget(self)
+                    return
+                continue
+            if request is None:
+                return
+
+            result = self._validate(request)
+            request.result.set_result(result)
+            if result.accepted:
+                self._unwritten.append((request, result))
+                self._writer_wake.set()
+
+            if self.state is None or not self.state.is_open:
+                # Auction is over: answer whatever is still queued, then stop
+                self.engine._forget(self)
+                while not self.queue.empty():
+                    request = self.queue.get_nowait()
+                    if request is not None:
+                        request.result.set_result(self._validate(request))
+                return
+
+    async def _run(self):
+        try:
+            self.state = await self._load_state()
+        except Exception:
+            logger.exception("Failed to load auction %s", self.flower_id)
+
+        writer = asyncio.create_task(self._write())
+        try:
+            await self._decide()
+        finally:
+            # The actor is done once every bid it accepted is committed
+            self._draining = True
+            self._writer_wake.set()
+            await asyncio.wait({writer})
+
+
+class AuctionEngine:
+    def __init__(self, session_factory=async_session, batch_size: int = AUCTION_BID_BATCH_SIZE,
+                 idle_timeout: float = AUCTION_ACTOR_IDLE_TIMEOUT):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self._actors: Dict[int, AuctionActor] = {}
+
+    def _forget(self, actor: AuctionActor):
+        if self._actors.get(actor.flower_id) is actor:
+            del self._actors[actor.flower_id]
+
+    async def submit_bid(self, flower_id: int, user_telegram_id: int, username: Optional[str],
+                         full_name: Optional[str], amount: int) -> BidResult:
+        """Validate a bid against the live auction; returns as soon as it is accepted or rejected"""
+        request = _BidRequest(user_telegram_id, username, full_name, amount)
+        self._route(flower_id, request)
+        return await request.result
+
+    def _route(self, flower_id: int, request: _BidRequest):
+        actor = self._actors.get(flower_id)
+        if actor is None:
+            actor = self._actors[flower_id] = AuctionActor(self, flower_id)
+        actor.queue.put_nowait(request)
+
+    def _close(self, actor: AuctionActor):
+        actor.closed = True
+        # Wake the actor so it notices and exits
+        actor.queue.put_nowait(_BidRequest(0, None, None, 0))
+
+    async def close_auction(self, flower_id: int):
+        """Stop accepting bids (call after the flower left the "published" status).
+
+        Returns once every bid the actor already accepted is committed, so the
+        highest bid read afterwards is final."""
+        actor = self._actors.get(flower_id)
+        if actor is None:
+            return
+        self._close(actor)
+        # wait() rather than await: a cancelled caller must not cancel the actor mid-commit
+        await asyncio.wait({actor.task})
+
+    async def shutdown(self):
+        """Close every actor and wait for in-flight batches to be committed"""
+        actors = list(self._actors.values())
+        for actor in actors:
+            self._close(actor)
+            if actor.state is None:
+                actor.task.cancel()
+        await asyncio.gather(*(a.task for a in actors), return_exceptions=True)
+
+
+auction_engine = AuctionEngine()
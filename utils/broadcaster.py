@@ -0,0 +1,182 @@
+"""Fan-out sender for notifications to many chats.
+
+`broadcaster.broadcast(...)` returns a task right away, so handlers don't wait
+for hundreds of sends. Messages go out with bounded concurrency, under a global
+rate (Telegram allows ~30 msg/s per bot) and a per-chat minimum interval (a
+message for a chat inside its interval waits off the queue, without holding
+up other chats); TelegramRetryAfter is honoured and retried. The task resolves to a
+BroadcastResult with delivered/failed counts.
+
+Bulk broadcasts (`bulk=True`, e.g. an admin message to every user) only get
+the workers when no auction notification is waiting, so a 50k-user send can't
+delay bid/sold/ended messages; on shutdown their unsent remainder is dropped.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+
+from utils.tracing import detached_task
+from config import BROADCAST_CONCURRENCY, BROADCAST_RATE, BROADCAST_CHAT_INTERVAL, BROADCAST_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+URGENT, BULK = 0, 1  # queue priorities
+
+
+@dataclass
+class BroadcastResult:
+    delivered: int = 0
+    failed: int = 0
+
+
+class _Job:
+    """One broadcast: counts its sends and resolves once all are done"""
+
+    def __init__(self, total: int, bulk: bool = False):
+        self.bulk = bulk
+        self.remaining = total
+        self.result = BroadcastResult()
+        self.cancelled = False
+        self.done = asyncio.get_running_loop().create_future()
+        if not total:
+            self.done.set_result(self.result)
+
+    def sent(self, ok: bool):
+        if ok:
+            self.result.delivered += 1
+        else:
+            self.result.failed += 1
+        self.remaining -= 1
+        if not self.remaining and not self.done.done():
+            self.done.set_result(self.result)
+
+
+class Broadcaster:
+    def __init__(self, concurrency: int = BROADCAST_CONCURRENCY, rate: float = BROADCAST_RATE,
+                 chat_interval: float = BROADCAST_CHAT_INTERVAL, max_retries: int = BROADCAST_MAX_RETRIES):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        # One queue of (priority, seq, (bot, chat_id, text, kwargs, job)) served by `concurrency`
+        # workers, so a burst of broadcasts costs a queue entry per message, not a task each;
+        # bulk entries sort after urgent ones, seq keeps each priority FIFO
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._seq = itertools.count()
+        self._jobs: Set[_Job] = set()
+        self._workers: List[asyncio.Task] = []
+        self._next_slot = 0.0  # earliest time the next message may go out (global limit)
+        self._chat_next: Dict[int, float] = {}  # same, per chat
+        self._tasks: Set[asyncio.Task] = set()
+        self.delivered = 0
+        self.failed = 0
+
+    async def _wait_turn(self, chat_id: int):
+        """Reserve the next global slot (and this chat's next turn after it), then sleep until it"""
+        now = time.monotonic()
+        at = max(now, self._next_slot)
+        self._next_slot = at + 1 / self.rate
+        self._chat_next[chat_id] = at + self.chat_interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+    def _requeue(self, entry: tuple):
+        if self._queue is not None and not entry[2][4].cancelled:
+            self._queue.put_nowait(entry)
+
+    def _prune(self):
+        now = time.monotonic()
+        self._chat_next = {chat_id: at for chat_id, at in self._chat_next.items() if at > now}
+
+    async def _send(self, bot: Bot, chat_id: int, text: str, kwargs: dict) -> bool:
+        for _ in range(self.max_retries + 1):
+            await self._wait_turn(chat_id)
+            try:
+                await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                return True
+            except TelegramRetryAfter as e:
+                # Flood control applies to the whole bot: hold every sender back
+                self._next_slot = max(self._next_slot, time.monotonic() + e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest):
+                return False  # blocked the bot / chat not found - retrying won't help
+            except Exception:
+                logger.debug("Send to %s failed", chat_id, exc_info=True)
+                return False
+        return False
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            entry = await self._queue.get()
+            _, _, (bot, chat_id, text, kwargs, job) = entry
+            if job.cancelled:
+                continue
+            wait = self._chat_next.get(chat_id, 0) - time.monotonic()
+            if wait > 0:
+                # The chat had a message moments ago: put this one back (same place in line)
+                # when its turn comes instead of holding a worker and the global slot for it
+                loop.call_later(wait, self._requeue, entry)
+                continue
+            job.sent(await self._send(bot, chat_id, text, kwargs))
+
+    async def _run(self, bot: Bot, chat_ids: list, text: str, kwargs: dict, name: str,
+                   bulk: bool) -> BroadcastResult:
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._workers = [detached_task(self._worker()) for _ in range(self.concurrency)]
+        if len(self._chat_next) > 10000:
+            self._prune()
+
+        job = _Job(len(chat_ids), bulk)
+        priority = BULK if bulk else URGENT
+        for chat_id in chat_ids:
+            self._queue.put_nowait((priority, next(self._seq), (bot, chat_id, text, kwargs, job)))
+        self._jobs.add(job)
+        try:
+            result = await job.done
+        except asyncio.CancelledError:
+            job.cancelled = True  # workers drop its queued messages
+            raise
+        finally:
+            self._jobs.discard(job)
+        self.delivered += result.delivered
+        self.failed += result.failed
+        logger.info("Broadcast %s: %s delivered, %s failed", name, result.delivered, result.failed)
+        return result
+
+    def broadcast(self, bot: Bot, chat_ids: Iterable[int], text: str, name: str = "", bulk: bool = False,
+                  **kwargs) -> "asyncio.Task[BroadcastResult]":
+        """Send `text` to every chat in the background; await the task for the counts.
+        `bulk` sends yield to every non-bulk one and are dropped on shutdown."""
+        chat_ids = list(dict.fromkeys(chat_ids))
+        task = asyncio.create_task(self._run(bot, chat_ids, text, kwargs, name, bulk))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def shutdown(self):
+        """Drop what is left of bulk broadcasts, wait for the others, then stop the workers"""
+        for job in [job for job in self._jobs if job.bulk]:
+            job.cancelled = True
+            if job.remaining:
+                logger.warning("Shutdown: %s messages of a bulk broadcast dropped", job.remaining)
+            if not job.done.done():
+                job.done.set_result(job.result)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._queue = None
+
+    def stats(self) -> dict:
+        return {"delivered": self.delivered, "failed": self.failed, "in_flight": len(self._tasks),
+                "queued": self._queue.qsize() if self._queue is not None else 0}
+
+
+broadcaster = Broadcaster()
@@ -0,0 +1,117 @@
+"""Coalesced channel caption updates.
+
+Live auction posts are re-captioned after every bid. Callers hand the latest
+caption to the refresher and return right away; per channel message only the
+newest caption is kept, at most one edit is sent per interval, and captions
+identical to the last one sent are skipped. Once a post is cancelled (it got
+its final caption) late captions for it are ignored.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from config import CHANNEL_CAPTION_REFRESH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# How long a cancelled post keeps refusing captions (late bid handlers finish well within it)
+CLOSED_TTL = 3600
+
+# Sends the caption to Telegram (edit_message_caption with the right markup)
+SendCaption = Callable[[str], Awaitable]
+
+
+class CaptionRefresher:
+    def __init__(self, interval: float = CHANNEL_CAPTION_REFRESH_INTERVAL):
+        self.interval = interval
+        self._pending: Dict[int, Tuple[int, str, SendCaption]] = {}
+        self._sent: Dict[int, Tuple[int, str]] = {}  # last (version, caption) per message
+        self._next_at: Dict[int, float] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._closed: Dict[int, float] = {}  # message_id -> when it was cancelled
+        self.edits = 0
+        self.coalesced = 0
+        self.skipped = 0
+
+    def schedule(self, message_id: int, caption: str, send: SendCaption, version: int = 0):
+        """Queue a caption for the message. `version` (e.g. bid_count) keeps a
+        slow caller from replacing a newer caption with an older one"""
+        if not message_id or message_id in self._closed:
+            return
+
+        pending = self._pending.get(message_id)
+        newest = pending[0] if pending else self._sent.get(message_id, (-1, None))[0]
+        if version < newest:
+            self.coalesced += 1
+            return
+        if pending:
+            self.coalesced += 1
+
+        self._pending[message_id] = (version, caption, send)
+        if message_id not in self._tasks:
+            self._tasks[message_id] = asyncio.create_task(self._run(message_id))
+
+    async def _run(self, message_id: int):
+        try:
+            while message_id in self._pending:
+                delay = self._next_at.get(message_id, 0) - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                item = self._pending.pop(message_id, None)
+                if item is None:
+                    break
+                version, caption, send = item
+
+                if self._sent.get(message_id, (None, None))[1] == caption:
+                    self.skipped += 1
+                    continue
+
+                self._next_at[message_id] = time.monotonic() + self.interval
+                try:
+                    await send(caption)
+                except TelegramRetryAfter as e:
+                    # Back off as told and retry with whatever is newest by then
+                    self._next_at[message_id] = time.monotonic() + e.retry_after
+                    self._pending.setdefault(message_id, item)
+                    continue
+                except TelegramBadRequest as e:
+                    if "message is not modified" not in e.message:
+                        logger.warning("Caption edit for message %s failed: %s", message_id, e.message)
+                        continue
+                except Exception:
+                    logger.exception("Caption edit for message %s failed", message_id)
+                    continue
+
+                self._sent[message_id] = (version, caption)
+                self.edits += 1
+        finally:
+            self._tasks.pop(message_id, None)
+
+    async def cancel(self, message_id: int):
+        """Drop queued captions for a post and ignore later ones (call before giving it its final caption)"""
+        now = time.monotonic()
+        if len(self._closed) > 1000:
+            self._closed = {m: at for m, at in self._closed.items() if now - at < CLOSED_TTL}
+        self._closed[message_id] = now
+        self._pending.pop(message_id, None)
+        self._sent.pop(message_id, None)
+        self._next_at.pop(message_id, None)
+        task = self._tasks.pop(message_id, None)
+        if task:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def shutdown(self):
+        for message_id in list(self._tasks):
+            await self.cancel(message_id)
+
+    def stats(self) -> dict:
+        return {"edits": self.edits, "coalesced": self.coalesced, "skipped": self.skipped,
+                "pending": len(self._pending)}
+
+
+caption_refresher = CaptionRefresher()
@@ -0,0 +1,133 @@
+"""Per-user ordered, cross-user parallel update dispatch.
+
+aiogram handles every update as its own task, so two photos of one album can
+run `flower_photo_received` at the same time and overwrite each other's
+`media_list`. This outer middleware queues updates per `from_user.id`: a pool
+of DISPATCH_WORKERS workers runs one update per user at a time, in arrival
+order, while different users are served in parallel (round-robin, one update
+per turn). Updates without a user skip the queue. Handlers run in the context
+of the update's own task, so context variables set by earlier middlewares
+(e.g. the tracing span) carry over to them.
+
+It sits right after aiogram's user context middleware and before the FSM one,
+so an update reads its state only after the user's previous update is done.
+"""
+import asyncio
+import contextvars
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+
+from config import DISPATCH_WORKERS
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]]
+
+
+class UserOrderedDispatch(BaseMiddleware):
+    def __init__(self, workers: int = DISPATCH_WORKERS):
+        self.workers = workers
+        self._queues: Dict[int, Deque] = {}  # user id -> (handler, event, data, context, future), head is running
+        self._ready: Optional[asyncio.Queue] = None  # users with work waiting for a worker
+        self._workers: List[asyncio.Task] = []
+        self._drained: Optional[asyncio.Event] = None
+        self.busy = 0
+        self.processed = 0
+        self.max_depth = 0  # deepest single-user queue seen
+
+    def setup(self, dp: Dispatcher):
+        """Install between the user context and FSM middlewares"""
+        dp.update.outer_middleware.unregister(dp.fsm)
+        dp.update.outer_middleware(self)
+        dp.update.outer_middleware(dp.fsm)
+
+    def _start(self):
+        self._ready = asyncio.Queue()
+        self._drained = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def __call__(self, handler: Handler, event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+        if self._ready is None:
+            self._start()
+
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(user.id)
+        if queue is None:
+            queue = self._queues[user.id] = deque()
+            self._ready.put_nowait(user.id)
+            self._drained.clear()
+        queue.append((handler, event, data, contextvars.copy_context(), future))
+        self.max_depth = max(self.max_depth, len(queue))
+        return await future
+
+    async def _worker(self):
+        while True:
+            user_id = await self._ready.get()
+            queue = self._queues[user_id]
+            handler, event, data, context, future = queue[0]
+            if not future.done():  # the update's task may have been cancelled meanwhile
+                self.busy += 1
+                try:
+                    # A task copies the current context when created, hence the run()
+                    result = await context.run(asyncio.create_task, handler(event, data))
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+                finally:
+                    self.busy -= 1
+                    self.processed += 1
+
+            queue.popleft()
+            if queue:
+                self._ready.put_nowait(user_id)  # back of the line: other users go first
+            else:
+                del self._queues[user_id]
+                if not self._queues:
+                    self._drained.set()
+
+    async def shutdown(self, timeout: float = 10):
+        """Let queued updates finish (up to `timeout` seconds), then stop the workers"""
+        if self._ready is None:
+            return
+        if self._queues:
+            try:
+                await asyncio.wait_for(self._drained.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Dispatch shutdown: %s users still queued", len(self._queues))
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        for queue in self._queues.values():
+            for *_, future in queue:
+                future.cancel()
+        self._queues.clear()
+        self._ready = None
+
+    def stats(self) -> dict:
+        depths = [len(queue) for queue in self._queues.values()]
+        return {
+            "workers": self.workers,
+            "busy": self.busy,
+            "users_queued": len(depths),
+            "users_waiting": self._ready.qsize() if self._ready is not None else 0,
+            "updates_queued": sum(depths),
+            "deepest_queue": max(depths, default=0),
+            "max_depth": self.max_depth,
+            "processed": self.processed,
+        }
+
+
+user_dispatch = UserOrderedDispatch()
@@ -0,0 +1,291 @@
+"""Prometheus metrics, served as text on METRICS_HOST:METRICS_PORT/metrics.
+
+- update and per-handler latency (router = handler module, handler = function);
+- every Telegram API call: latency per method, errors per method and type;
+- every SQL statement: latency per operation and table;
+- at scrape time: live auctions, their participants, pending payments and the
+  stats() of registered components (broadcaster, dispatch queue, FSM, ...).
+
+No client library needed: the few metric types used are implemented here.
+With METRICS_PORT=0 nothing is instrumented and no collector is registered.
+"""
+import logging
+import re
+import time
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from database.queries import get_live_gauges
+from config import METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# Nothing could read the numbers without the endpoint, so don't pay for collecting them
+enabled = bool(METRICS_PORT)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self._values: Dict[Tuple, Any] = {}
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        counts = entry[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+        self.collectors: List[Callable[[], Awaitable[None]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    async def render(self) -> str:
+        for collect in self.collectors:
+            try:
+                await collect()
+            except Exception:
+                logger.exception("Metrics collector %s failed", getattr(collect, "__name__", collect))
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+UPDATE_SECONDS = registry.register(Histogram(
+    "flower_bot_update_seconds", "Time to handle one update, including the per-user queue", ("type",)))
+HANDLER_SECONDS = registry.register(Histogram(
+    "flower_bot_handler_seconds", "Handler run time", ("router", "handler")))
+HANDLER_ERRORS = registry.register(Counter(
+    "flower_bot_handler_errors_total", "Exceptions raised by handlers", ("router", "handler", "error")))
+API_SECONDS = registry.register(Histogram(
+    "flower_bot_telegram_request_seconds", "Telegram Bot API call time", ("method",)))
+API_ERRORS = registry.register(Counter(
+    "flower_bot_telegram_errors_total", "Failed Telegram Bot API calls", ("method", "error")))
+DB_SECONDS = registry.register(Histogram(
+    "flower_bot_db_query_seconds", "SQL statement time", ("operation", "table")))
+LIVE = registry.register(Gauge(
+    "flower_bot_live", "Live auctions, their active participants and pending payments", ("what",)))
+COMPONENT = registry.register(Gauge(
+    "flower_bot_component", "stats() of the bot's in-process components", ("component", "stat")))
+
+
+# ==================== AIOGRAM ====================
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer update middleware: whole-update latency by update type"""
+
+    async def __call__(self, handler, event, data):
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            UPDATE_SECONDS.observe(time.perf_counter() - start, type=event.event_type)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: runs once the handler is chosen, so it can label by it"""
+
+    async def __call__(self, handler, event, data):
+        callback = data["handler"].callback
+        router = callback.__module__.rsplit(".", 1)[-1]
+        name = getattr(callback, "__name__", "handler")
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.inc(router=router, handler=name, error=type(e).__name__)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, router=router, handler=name)
+
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    """Bot session middleware: wraps every API call the bot makes"""
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            API_ERRORS.inc(method=name, error=type(e).__name__)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - start, method=name)
+
+
+def instrument_dispatcher(dp: Dispatcher, bot: Bot):
+    """Call before other outer update middlewares are set up (e.g. user_dispatch),
+    so update latency includes their wait"""
+    if not enabled:
+        return
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    # Inner middlewares on the dispatcher apply to the handlers of every included router
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(HandlerMetricsMiddleware())
+    bot.session.middleware(RequestMetricsMiddleware())
+
+
+# ==================== SQLALCHEMY ====================
+
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+"?(\w+)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=2048)
+def _statement_labels(statement: str) -> Tuple[str, str]:
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    match = _TABLE.search(statement)
+    return operation, match.group(1) if match else ""
+
+
+def instrument_engine(engine: AsyncEngine):
+    if not enabled:
+        return
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("metrics_started")
+        if started:
+            operation, table = _statement_labels(statement)
+            DB_SECONDS.observe(time.perf_counter() - started.pop(), operation=operation, table=table)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def failed(context):
+        started = context.connection.info.get("metrics_started") if context.connection else None
+        if started:
+            started.pop()
+
+
+# ==================== GAUGES AND SERVER ====================
+
+def register_stats(component: str, stats: Callable[[], dict]):
+    """Export a component's stats() numbers as flower_bot_component gauges"""
+    if not enabled:
+        return
+
+    async def collect():
+        for stat, value in stats().items():
+            if isinstance(value, (int, float)):
+                COMPONENT.set(value, component=component, stat=stat)
+    collect.__name__ = f"stats:{component}"
+    registry.collectors.append(collect)
+
+
+def register_live_gauges(session_factory):
+    if not enabled:
+        return
+
+    async def collect():
+        async with session_factory() as session:
+            for what, value in (await get_live_gauges(session)).items():
+                LIVE.set(value, what=what)
+    registry.collectors.append(collect)
+
+
+async def _metrics_view(request: web.Request) -> web.Response:
+    return web.Response(text=await registry.render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> Optional[web.AppRunner]:
+    """Serve /metrics; returns the runner to clean up, or None if METRICS_PORT is 0"""
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_view)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Metrics on http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,176 @@
+"""On-demand sampling profiler for the running bot (admin `/profile N`).
+
+Two samplers run for N seconds, every PROFILE_INTERVAL seconds:
+
+- a thread samples the event loop thread's Python stack (wall clock) and
+  marks each sample on-CPU or off-CPU by whether the thread's CPU clock moved
+  just before it was taken (off-CPU on the loop thread is mostly select(), i.e.
+  idle, or a blocking call made from async code);
+- a task on the loop records where every other asyncio task is suspended,
+  following its `await` chain down to the future it waits on, so time spent
+  waiting on the database, the Bot API or a lock shows up per coroutine.
+
+The result is in the collapsed-stack format (`frame;frame;frame count`) read
+by flamegraph.pl, speedscope and inferno; the roots are `loop;on-cpu`,
+`loop;off-cpu` and `tasks`.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from config import PROFILE_INTERVAL
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _short_path(path: str) -> str:
+    if path.startswith(_ROOT):
+        return os.path.relpath(path, _ROOT)
+    marker = path.rfind("site-packages" + os.sep)
+    if marker != -1:
+        return path[marker + len("site-packages") + 1:]
+    return os.path.basename(path)
+
+
+def _frame_name(code) -> str:
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _thread_stack(frame) -> List[str]:
+    stack = []
+    while frame is not None:
+        stack.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _task_stack(task: asyncio.Task) -> List[str]:
+    """Where a suspended task is waiting: its coroutine chain, then the awaited object"""
+    stack = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None) \
+            or getattr(awaitable, "ag_frame", None)
+        if frame is None:
+            break
+        stack.append(_frame_name(frame.f_code))
+        nxt = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None) \
+            or getattr(awaitable, "ag_await", None)
+        if nxt is None or not (hasattr(nxt, "cr_frame") or hasattr(nxt, "gi_frame") or hasattr(nxt, "ag_frame")):
+            if nxt is not None:
+                stack.append(f"<{type(nxt).__name__}>")
+            break
+        awaitable = nxt
+    return stack
+
+
+class Profile:
+    def __init__(self, seconds: float, interval: float):
+        self.seconds = seconds
+        self.interval = interval
+        self.stacks: Counter = Counter()  # collapsed stack -> samples
+        self.loop_samples = 0
+        self.cpu_samples = 0
+        self.task_samples = 0
+        self.process_cpu = 0.0  # CPU seconds of the whole process while profiling
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_cpu(self, n: int = 5) -> List[Tuple[str, int]]:
+        """Functions the loop thread was running (leaf frame) in on-CPU samples"""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            if stack.startswith("loop;on-cpu;"):
+                leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(n)
+
+    def summary(self) -> str:
+        cpu_share = self.cpu_samples / self.loop_samples if self.loop_samples else 0
+        lines = [
+            f"{self.seconds:g}s, every {self.interval * 1000:g}ms: {self.loop_samples} loop samples, "
+            f"{cpu_share:.0%} on CPU; process CPU {self.process_cpu:.2f}s",
+            f"{self.task_samples} task samples",
+        ]
+        lines += [f"{count:>6}  {name}" for name, count in self.top_cpu()]
+        return "\n".join(lines)
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self._profile: Optional[Profile] = None
+
+    @property
+    def running(self) -> bool:
+        return self._profile is not None
+
+    def _sample_thread(self, profile: Profile, thread_id: int, stop: threading.Event):
+        try:
+            cpu_clock = time.pthread_getcpuclockid(thread_id)
+        except (AttributeError, OSError):  # not on Linux/BSD: every sample counts as on-CPU
+            cpu_clock = None
+        # The thread is on CPU if its clock moves during a short probe right before the stack is taken
+        probe = min(self.interval / 4, 0.001)
+        while not stop.wait(self.interval - probe):
+            on_cpu = True
+            if cpu_clock is not None:
+                before = time.clock_gettime(cpu_clock)
+                time.sleep(probe)
+                on_cpu = time.clock_gettime(cpu_clock) > before
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            stack = _thread_stack(frame)
+            del frame
+            profile.loop_samples += 1
+            profile.cpu_samples += on_cpu
+            profile.stacks[";".join(["loop", "on-cpu" if on_cpu else "off-cpu"] + stack)] += 1
+
+    async def _sample_tasks(self, profile: Profile, stop: asyncio.Event):
+        this = asyncio.current_task()
+        while not stop.is_set():
+            for task in asyncio.all_tasks():
+                if task is this or task.done():
+                    continue
+                stack = _task_stack(task)
+                if stack:
+                    profile.task_samples += 1
+                    profile.stacks[";".join(["tasks"] + stack)] += 1
+            await asyncio.sleep(self.interval)
+
+    async def capture(self, seconds: float) -> Profile:
+        """Profile the process for `seconds`; one capture at a time (RuntimeError otherwise)"""
+        if self._profile is not None:
+            raise RuntimeError("A profile is already being captured")
+        profile = self._profile = Profile(seconds, self.interval)
+        thread_stop, tasks_stop = threading.Event(), asyncio.Event()
+        sampler = threading.Thread(target=self._sample_thread, name="profiler",
+                                   args=(profile, threading.get_ident(), thread_stop), daemon=True)
+        tasks = asyncio.create_task(self._sample_tasks(profile, tasks_stop))
+        # The sampler needs the GIL to read the loop's stack; by default a busy loop thread
+        # keeps it up to 5ms, long enough to move on from the code that was hot
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, self.interval / 10))
+        cpu_start = time.process_time()
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sys.setswitchinterval(switch_interval)
+            thread_stop.set()
+            tasks_stop.set()
+            await tasks
+            await asyncio.to_thread(sampler.join)
+            profile.process_cpu = time.process_time() - cpu_start
+            self._profile = None
+        return profile
+
+
+profiler = SamplingProfiler()
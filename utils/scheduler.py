@@ -1,15 +1,24 @@
 import asyncio
+import heapq
+import logging
 from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Set, Tuple
 from aiogram import Bot
 
 from database import async_session
 from database.queries import (
-    get_active_auctions, update_flower_status, get_flower,
-    get_auction_participants, get_user, get_auction_bids
+    update_flower_status, get_flower,
+    get_auction_participants, get_user, get_highest_bid, get_auction_deadlines,
+    transition_flower_status
 )
 from database.models import User
 from sqlalchemy import select
-from config import CHANNEL_ID
+from config import CHANNEL_ID, AUCTION_CLOSE_CONCURRENCY
+from utils.auction_engine import auction_engine
+from utils.caption_refresher import caption_refresher
+from utils.broadcaster import broadcaster
+
+logger = logging.getLogger(__name__)
 
 
 def format_price(amount: int) -> str:
@@ -19,31 +28,39 @@ def format_price(amount: int) -> str:
 async def check_ended_auctions(bot: Bot):
     """Check for auctions that have ended and process them"""
     async with async_session() as session:
-        auctions = await get_active_auctions(session)
-        
-        for flower in auctions:
-            if not flower.auction_end_time:
-                continue
-            
-            if datetime.utcnow() > flower.auction_end_time:
-                # Auction has ended
-                await process_ended_auction(bot, flower.id, session)
+        now = datetime.utcnow()
+        ended = [flower_id for flower_id, end_time in await get_auction_deadlines(session) if now > end_time]
+    
+    semaphore = asyncio.Semaphore(AUCTION_CLOSE_CONCURRENCY)
+    
+    async def close(flower_id: int):
+        async with semaphore:
+            try:
+                await close_auction_on_deadline(bot, flower_id)
+            except Exception as e:
+                logger.exception("Closing auction %s failed: %s", flower_id, e)
+    
+    await asyncio.gather(*(close(flower_id) for flower_id in ended))
 
 
 async def process_ended_auction(bot: Bot, flower_id: int, session):
     """Process an auction that has ended"""
-    flower = await get_flower(session, flower_id)
+    # Claim it: only one caller gets past this, re-runs and restarts are no-ops
+    if not await transition_flower_status(session, flower_id, "published", "expired"):
+        return
+    # Bids the actor already accepted are committed before the winner is read
+    await auction_engine.close_auction(flower_id)
     
-    if not flower or flower.status != "published":
+    flower = await get_flower(session, flower_id)
+    if not flower:
         return
     
     # Get highest bid
-    bids = await get_auction_bids(session, flower_id)
     winner = None
     highest_bid = flower.current_bid
     
-    if bids and flower.highest_bidder_id:
-        top_bid = bids[0] if bids else None
+    if flower.highest_bidder_id:
+        top_bid = await get_highest_bid(session, flower_id)
         if top_bid:
             winner = {
                 "telegram_id": top_bid.user_telegram_id,
@@ -106,18 +123,12 @@ async def process_ended_auction(bot: Bot, flower_id: int, session):
     
     # Broadcast to all participants
     participants = await get_auction_participants(session, flower_id)
-    for p in participants:
-        try:
-            await bot.send_message(
-                chat_id=p.user_telegram_id,
-                text=result_text,
-                parse_mode="HTML"
-            )
-        except Exception:
-            pass
+    broadcaster.broadcast(bot, [p.user_telegram_id for p in participants], result_text,
+                          name=f"ended:{flower_id}", parse_mode="HTML")
     
     # Update channel message
     try:
+        await caption_refresher.cancel(flower.message_id)
         if winner and highest_bid > flower.price:
             channel_text = (
                 f"⏰ AUKSIYON VAQTI TUGADI\n\n"
@@ -147,12 +158,101 @@ async def process_ended_auction(bot: Bot, flower_id: int, session):
         pass
 
 
+class AuctionDeadlines:
+    """Min-heap of (auction_end_time, flower_id). Sleeps until the earliest
+    deadline; rescheduled or cancelled auctions leave stale heap entries that
+    are skipped when popped"""
+    
+    def __init__(self, concurrency: int = AUCTION_CLOSE_CONCURRENCY):
+        self.concurrency = concurrency
+        self._heap: List[Tuple[datetime, int]] = []
+        self._deadlines: Dict[int, datetime] = {}
+        self._changed = asyncio.Event()
+        self._tasks: Set[asyncio.Task] = set()
+    
+    def schedule(self, flower_id: int, end_time: datetime):
+        if end_time is None:
+            return
+        self._deadlines[flower_id] = end_time
+        heapq.heappush(self._heap, (end_time, flower_id))
+        if self._heap[0] == (end_time, flower_id):
+            self._changed.set()  # new earliest deadline: re-arm the sleep
+    
+    def cancel(self, flower_id: int):
+        """Auction ended early; its heap entry is dropped lazily"""
+        self._deadlines.pop(flower_id, None)
+    
+    def load(self, deadlines: List[Tuple[int, datetime]]):
+        """Add (flower_id, end_time) pairs in bulk (one heapify instead of n pushes)"""
+        self._deadlines.update(deadlines)
+        self._heap = [(end_time, flower_id) for flower_id, end_time in self._deadlines.items()]
+        heapq.heapify(self._heap)
+        self._changed.set()
+    
+    def pop_due(self, now: datetime) -> List[int]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            end_time, flower_id = heapq.heappop(self._heap)
+            if self._deadlines.get(flower_id) == end_time:
+                del self._deadlines[flower_id]
+                due.append(flower_id)
+        # Drop stale entries at the top so the next sleep is exact
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return due
+    
+    def next_delay(self, now: datetime):
+        """Seconds until the earliest deadline (None if nothing is scheduled)"""
+        if not self._heap:
+            return None
+        return max(0.0, (self._heap[0][0] - now).total_seconds())
+    
+    async def _fire(self, semaphore: asyncio.Semaphore, on_due: Callable[[int], Awaitable], flower_id: int):
+        async with semaphore:
+            try:
+                await on_due(flower_id)
+            except Exception as e:
+                logger.exception("Closing auction %s failed: %s", flower_id, e)
+    
+    async def run(self, on_due: Callable[[int], Awaitable]):
+        """Call on_due(flower_id) for each deadline, up to `concurrency` at a time,
+        so one slow auction never holds back the others"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            for flower_id in self.pop_due(datetime.utcnow()):
+                task = asyncio.create_task(self._fire(semaphore, on_due, flower_id))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            
+            self._changed.clear()
+            delay = self.next_delay(datetime.utcnow())
+            if delay == 0:
+                continue
+            try:
+                await asyncio.wait_for(self._changed.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+    
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+
+auction_deadlines = AuctionDeadlines()
+
+
+async def load_auction_deadlines():
+    """Seed the deadline heap from the DB (overdue auctions fire right away)"""
+    async with async_session() as session:
+        auction_deadlines.load(await get_auction_deadlines(session))
+    logger.info("Scheduled %s auction deadlines", len(auction_deadlines))
+
+
+async def close_auction_on_deadline(bot: Bot, flower_id: int):
+    async with async_session() as session:
+        await process_ended_auction(bot, flower_id, session)
+
+
 async def scheduler_loop(bot: Bot):
-    """Main scheduler loop - runs every minute"""
-    while True:
-        try:
-            await check_ended_auctions(bot)
-        except Exception as e:
-            print(f"Scheduler error: {e}")
-        
-        await asyncio.sleep(60)  # Check every minute
+    """Close auctions exactly at their auction_end_time"""
+    await load_auction_deadlines()
+    await auction_deadlines.run(lambda flower_id: close_auction_on_deadline(bot, flower_id))
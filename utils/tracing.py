@@ -0,0 +1,350 @@
+"""Lightweight per-update tracing.
+
+A sampled update (TRACE_SAMPLE_RATE) gets a root span; the handler, every SQL
+statement, every Bot API call and the `span(...)` blocks in handlers become
+its children, linked through a context variable. Handlers add attributes with
+`set_attributes(flower_id=..., participants=...)`. When the root span ends
+the whole trace is exported: one JSON object per span appended to TRACE_FILE,
+or OTLP/HTTP JSON posted to TRACE_OTLP_ENDPOINT (any OpenTelemetry collector,
+or `python -m loadtest.collector` locally).
+
+Work that outlives the update (broadcasts, caption refreshes) is not traced:
+spans only attach while their trace is open, and long-lived workers are
+started with `detached_task` so they never inherit the update that woke them.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import TRACE_SAMPLE_RATE, TRACE_FILE, TRACE_OTLP_ENDPOINT, TRACE_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "flower_bot"
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    def as_dict(self) -> dict:
+        return {
+            "trace_id": self.trace.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "name": self.name, "start_ns": self.start_ns, "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes, "error": self.error,
+        }
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans", "done")
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self.done = False
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("trace_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    span = _current.get()
+    # A task started during an update keeps its context after the update is over
+    return span if span is not None and not span.trace.done else None
+
+
+def set_attributes(**attributes):
+    """Attach attributes to the current span (no-op when the update isn't sampled)"""
+    span = current_span()
+    if span is not None:
+        span.attributes.update(attributes)
+
+
+def start_span(name: str, **attributes) -> Optional[Span]:
+    parent = current_span()
+    if parent is None:
+        return None
+    span = Span(parent.trace, name, parent.span_id, attributes)
+    parent.trace.spans.append(span)
+    return span
+
+
+def detached_task(coro) -> asyncio.Task:
+    """create_task for long-lived workers: runs outside the current update's trace"""
+    context = contextvars.copy_context()
+    context.run(_current.set, None)
+    return context.run(asyncio.create_task, coro)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Child span around a block: `with tracing.span("auction.commit_wait", flower_id=...)`"""
+    child = start_span(name, **attributes)
+    if child is None:
+        yield None
+        return
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.finish(e)
+        raise
+    else:
+        child.finish()
+    finally:
+        _current.reset(token)
+
+
+# ==================== EXPORT ====================
+
+class Exporter(ABC):
+    """Buffers finished traces and writes them out every TRACE_FLUSH_INTERVAL seconds"""
+
+    def __init__(self, flush_interval: float = TRACE_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._buffer: List[Span] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self.exported = 0
+
+    def export(self, trace: Trace):
+        self._buffer.extend(s for s in trace.spans if s.end_ns is not None)
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        spans, self._buffer = self._buffer, []
+        try:
+            await self._write(spans)
+            self.exported += len(spans)
+        except Exception:
+            logger.exception("Exporting %s spans failed", len(spans))
+
+    @abstractmethod
+    async def _write(self, spans: List[Span]):
+        ...
+
+    async def shutdown(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+
+class JsonlExporter(Exporter):
+    def __init__(self, path: str = TRACE_FILE, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+
+    def _append(self, lines: str):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    async def _write(self, spans: List[Span]):
+        lines = "".join(json.dumps(s.as_dict(), ensure_ascii=False, default=str) + "\n" for s in spans)
+        await asyncio.to_thread(self._append, lines)
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpExporter(Exporter):
+    """OTLP/HTTP with the JSON encoding (POST {endpoint}/v1/traces)"""
+
+    def __init__(self, endpoint: str = TRACE_OTLP_ENDPOINT, **kwargs):
+        super().__init__(**kwargs)
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @staticmethod
+    def payload(spans: List[Span]) -> dict:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [
+                {
+                    "traceId": s.trace.trace_id, "spanId": s.span_id, "parentSpanId": s.parent_id or "",
+                    "name": s.name, "kind": 1,
+                    "startTimeUnixNano": str(s.start_ns), "endTimeUnixNano": str(s.end_ns),
+                    "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                    "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+                }
+                for s in spans
+            ]}],
+        }]}
+
+    async def _write(self, spans: List[Span]):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        async with self._session.post(self.url, json=self.payload(spans)) as resp:
+            resp.raise_for_status()
+
+    async def shutdown(self):
+        await super().shutdown()
+        if self._session is not None:
+            await self._session.close()
+
+
+class Tracer:
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE, exporter: Optional[Exporter] = None):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.sampled = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 and self.exporter is not None
+
+    def start_trace(self, name: str, **attributes) -> Optional[Span]:
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        trace = Trace()
+        root = Span(trace, name, None, attributes)
+        trace.spans.append(root)
+        self.sampled += 1
+        return root
+
+    def end_trace(self, root: Span, error: Optional[BaseException] = None):
+        root.finish(error)
+        root.trace.done = True
+        self.exporter.export(root.trace)
+
+    async def shutdown(self):
+        if self.exporter is not None:
+            await self.exporter.shutdown()
+
+    def stats(self) -> dict:
+        return {"sampled": self.sampled, "exported_spans": self.exporter.exported if self.exporter else 0}
+
+
+def _default_exporter() -> Optional[Exporter]:
+    if TRACE_OTLP_ENDPOINT:
+        return OtlpExporter()
+    if TRACE_FILE:
+        return JsonlExporter()
+    return None
+
+
+tracer = Tracer(exporter=_default_exporter())
+
+
+# ==================== HOOKS ====================
+
+class UpdateTracingMiddleware(BaseMiddleware):
+    """Outer update middleware: opens the root span"""
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        root = tracer.start_trace(f"update.{event.event_type}", update_id=event.update_id,
+                                  user_id=user.id if user else 0)
+        if root is None:
+            return await handler(event, data)
+        token = _current.set(root)
+        try:
+            result = await handler(event, data)
+        except BaseException as e:
+            tracer.end_trace(root, e)
+            raise
+        else:
+            tracer.end_trace(root)
+            return result
+        finally:
+            _current.reset(token)
+
+
+class HandlerTracingMiddleware(BaseMiddleware):
+    """Inner middleware: a span named after the chosen handler"""
+
+    async def __call__(self, handler, event, data):
+        if current_span() is None:
+            return await handler(event, data)
+        callback = data["handler"].callback
+        with span(f"handler.{callback.__module__.rsplit('.', 1)[-1]}.{getattr(callback, '__name__', 'handler')}"):
+            return await handler(event, data)
+
+
+class RequestTracingMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        if current_span() is None:
+            return await make_request(bot, method)
+        chat_id = getattr(method, "chat_id", None)
+        with span(f"telegram.{method.__api_method__}", **({"chat_id": chat_id} if chat_id is not None else {})):
+            return await make_request(bot, method)
+
+
+def instrument_dispatcher(dp: Dispatcher, bot: Bot):
+    """Call before other outer update middlewares (e.g. user_dispatch) are set up"""
+    if not tracer.enabled:
+        return
+    dp.update.outer_middleware(UpdateTracingMiddleware())
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(HandlerTracingMiddleware())
+    bot.session.middleware(RequestTracingMiddleware())
+
+
+def instrument_engine(engine: AsyncEngine):
+    if not tracer.enabled:
+        return
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        child = start_span("db.query", statement=statement[:200])
+        conn.info.setdefault("trace_spans", []).append(child)
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("trace_spans")
+        child = spans.pop() if spans else None
+        if child is not None:
+            child.attributes["rows"] = cursor.rowcount
+            child.finish()
+
+    @event.listens_for(sync_engine, "handle_error")
+    def failed(context):
+        spans = context.connection.info.get("trace_spans") if context.connection else None
+        child = spans.pop() if spans else None
+        if child is not None:
+            child.finish(context.original_exception)
@@ -0,0 +1,114 @@
+"""Webhook ingress (BOT_MODE=webhook).
+
+Telegram POSTs updates to WEBHOOK_PATH on an embedded aiohttp server. The
+X-Telegram-Bot-Api-Secret-Token header is checked, the request is answered
+200 right away and the update is handled in a background task.
+
+SIGTERM/SIGINT stop the server: it stops accepting requests and lets the
+updates it already answered finish (Telegram won't send them again) before
+run_webhook returns and bot.py shuts the rest down.
+"""
+import asyncio
+import logging
+import signal
+from typing import Any, Dict, Set
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT
+
+logger = logging.getLogger(__name__)
+
+# Seconds a stopping server gives acknowledged updates to finish
+DRAIN_TIMEOUT = 10
+
+
+class WebhookHandler(SimpleRequestHandler):
+    """Answers 200 at once and keeps the update tasks, so shutdown can wait for them"""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: str):
+        super().__init__(dispatcher=dispatcher, bot=bot, secret_token=secret_token)
+        self.in_flight: Set[asyncio.Task] = set()
+
+    async def _feed(self, bot: Bot, update: Dict[str, Any]):
+        result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+        if isinstance(result, TelegramMethod):
+            await self.dispatcher.silent_call_request(bot=bot, result=result)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+        task = asyncio.create_task(self._feed(bot, await request.json(loads=bot.session.json_loads)))
+        self.in_flight.add(task)
+        task.add_done_callback(self.in_flight.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    __call__ = handle
+
+    async def close(self):
+        """bot.py closes the session itself, after the shutdown steps that still send messages"""
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT):
+        if not self.in_flight:
+            return
+        _, pending = await asyncio.wait(set(self.in_flight), timeout=timeout)
+        if pending:
+            logger.warning("Webhook shutdown: %s updates still running, cancelled", len(pending))
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+WEBHOOK_HANDLER = web.AppKey("webhook_handler", WebhookHandler)
+
+
+def build_webhook_app(dp: Dispatcher, bot: Bot, path: str = WEBHOOK_PATH,
+                      secret: str = WEBHOOK_SECRET) -> web.Application:
+    app = web.Application()
+    handler = app[WEBHOOK_HANDLER] = WebhookHandler(dp, bot, secret)
+    handler.register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, allowed_updates: list):
+    """Register the webhook with Telegram and serve until SIGTERM/SIGINT (or cancelled)"""
+    if not WEBHOOK_URL or not WEBHOOK_SECRET:
+        raise RuntimeError("BOT_MODE=webhook requires WEBHOOK_URL and WEBHOOK_SECRET")
+
+    app = build_webhook_app(dp, bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+
+    await bot.set_webhook(
+        url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=allowed_updates,
+    )
+    logger.info("Webhook listening on %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    signals = []
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+            signals.append(sig)
+        except NotImplementedError:  # Windows
+            pass
+
+    try:
+        await stop.wait()
+        logger.info("Webhook stopping")
+    finally:
+        for sig in signals:
+            loop.remove_signal_handler(sig)
+        await site.stop()
+        await app[WEBHOOK_HANDLER].drain()
+        await runner.cleanup()